@@ -11,6 +11,8 @@ import getopt
 import os
 from pympi.Elan import Eaf
 from urllib.parse import urlparse
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
+from CNGT_scripts.python.filecollectionprocessing.eafwriter import write_eaf
 
 # SETTINGS
 # Parameters for the lexicon reference
@@ -34,6 +36,9 @@ class LexiconLinkAdder:
             if not os.path.isdir(self.output_dir):
                 os.mkdir(self.output_dir, 0o750)
 
+        # The number of EAFs that were actually changed by adding the link
+        self.number_of_files_changed = 0
+
         # Find all files recursively and add to a list
         self.all_files = []
         for f in eaf_files:
@@ -48,15 +53,7 @@ class LexiconLinkAdder:
         :param fname: the file name to add to the list of files to process
         :return:
         """
-        if os.path.isfile(fname):
-            if fname.endswith(".eaf"):
-                self.all_files.append(fname)
-        elif os.path.isdir(fname):
-            files_in_dir = os.listdir(fname)
-            for f in files_in_dir:
-                self.add_file(fname + os.sep + f)
-        else:
-            print("No such file of directory: " + fname, file=sys.stderr)
+        self.all_files.extend(find_files([fname], extensions=["eaf"]))
 
     def run(self):
         """
@@ -65,8 +62,11 @@ class LexiconLinkAdder:
         :return:
         """
         if len(self.all_files) > 0:
+            self.number_of_files_changed = 0
             for f in self.all_files:
                 self.process_file(f)
+            print("Output changed for %d of %d files." % (self.number_of_files_changed, len(self.all_files)),
+                  file=sys.stderr)
         else:
             print("No EAF files to process.", file=sys.stderr)
 
@@ -83,18 +83,23 @@ class LexiconLinkAdder:
             eaf.add_lexicon_ref(LEXICON_REF, NAME, TYPE, URL,
                                 LEXICON_ID, LEXICON_NAME, DATCAT_ID, DATCAT_NAME)
 
-            # Remove old referred lexicon
+            # Remove old referred lexicon, unless it is the one just added (EAF processed before)
             if LINGUISTIC_TYPE_ID in eaf.linguistic_types:
                 if "LEXICON_REF" in eaf.linguistic_types[LINGUISTIC_TYPE_ID]:
                     old_lexicon_ref = eaf.linguistic_types[LINGUISTIC_TYPE_ID]["LEXICON_REF"]
-                    del eaf.lexicon_refs[old_lexicon_ref]
+                    if old_lexicon_ref != LEXICON_REF:
+                        del eaf.lexicon_refs[old_lexicon_ref]
 
             eaf.linguistic_types[LINGUISTIC_TYPE_ID]["LEXICON_REF"] = LEXICON_REF
 
+            # Unchanged EAFs are not rewritten
             if self.output_dir is not None:
-                eaf.to_file(self.output_dir + os.sep + os.path.basename(urlparse(file_name).path), pretty=True)
+                changed = write_eaf(eaf, self.output_dir + os.sep + os.path.basename(urlparse(file_name).path),
+                                    pretty=True)
             else:
-                eaf.to_file(file_name, pretty=True)
+                changed = write_eaf(eaf, file_name, pretty=True)
+            if changed:
+                self.number_of_files_changed += 1
         except Exception:
             print("The EAF %s could not be processed." % file_name, file=sys.stderr)
             print(sys.exc_info()[0])
@@ -12,8 +12,9 @@ import getopt
 import os
 import sys
 import re
-from urlparse import urlparse
+from urllib.parse import urlparse
 from pympi.Elan import Eaf
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
 
 
 class AslEafTransformer:
@@ -37,15 +38,7 @@ class AslEafTransformer:
         :param fname: the file name to add to the list of files to process
         :return:
         """
-        if os.path.isfile(fname):
-            if fname.endswith(".eaf"):
-                self.all_files.append(fname)
-        elif os.path.isdir(fname):
-            files_in_dir = os.listdir(fname)
-            for f in files_in_dir:
-                self.add_file(fname + os.sep + f)
-        else:
-            print("No such file of directory: " + fname, file=sys.stderr)
+        self.all_files.extend(find_files([fname], extensions=["eaf"]))
 
     def run(self):
         """
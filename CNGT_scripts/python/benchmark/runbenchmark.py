@@ -0,0 +1,264 @@
+#!/usr/bin/python
+
+"""
+Script to benchmark the CNGT tools on synthetic corpora of different sizes.
+
+Each tool is run as a separate process on each corpus. Per run the wall clock time, the number of files and
+annotations per second and the peak resident set size of the process are measured. The results are written to a JSON
+file, which can be compared with the results of an earlier run, e.g. of another commit.
+"""
+
+from __future__ import print_function
+
+import datetime
+import getopt
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from CNGT_scripts.python.benchmark.syntheticcorpus import SyntheticCorpusGenerator, CORPUS_DESCRIPTION_FILE_NAME, \
+    METADATA_FILE_NAME
+from CNGT_scripts.python.filecollectionprocessing.manifest import data_hash
+
+PYTHON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPOSITORY_DIR = os.path.dirname(os.path.dirname(PYTHON_DIR))
+
+# The command line per tool; {corpus}, {metadata} and {output} are filled in per run
+TOOLS = {
+    'signCounter': ['-m', 'CNGT_scripts.python.signCounter', '-m', '{metadata}', '-o', '0', '{corpus}'],
+    'cngt_calculated_metadata': ['-m', 'CNGT_scripts.python.cngt_calculated_metadata',
+                                 '-f', '{output}' + os.sep + 'metadata.json', '{corpus}'],
+    'eaf2webvtt': [PYTHON_DIR + os.sep + 'eaf2webvtt.py', '-o', '{output}', '-t', 'Gloss', '-f', 'Gloss',
+                   '-h', 'L', '-h', 'R', '{corpus}'],
+    'eafRemoveUnusedLingtypes': ['-m', 'CNGT_scripts.python.eafRemoveUnusedLingtypes', '-o', '{output}', '{corpus}'],
+}
+
+DEFAULT_SIZES = [10, 1000, 10000]
+
+
+class Benchmark:
+    def __init__(self, work_dir, sizes=DEFAULT_SIZES, tools=None, repeats=1, generator=None, generator_workers=1):
+        """
+        :param work_dir: directory for the corpora (kept for later runs) and the output of the tools
+        :param sizes: the numbers of files of the corpora
+        :param tools: the names of the tools to run (see TOOLS), all if None
+        :param repeats: number of runs per tool and corpus
+        :param generator: SyntheticCorpusGenerator for the corpora
+        :param generator_workers: number of processes generating a corpus
+        """
+        self.work_dir = work_dir.rstrip(os.sep)
+        self.sizes = sizes
+        self.tools = tools if tools is not None else sorted(TOOLS)
+        self.repeats = repeats
+        self.generator = generator if generator is not None else SyntheticCorpusGenerator()
+        self.generator_workers = generator_workers
+        self.results = []
+
+    def run(self):
+        for size in self.sizes:
+            (corpus_dir, description) = self.get_corpus(size)
+            for tool in self.tools:
+                for repeat in range(self.repeats):
+                    result = self.run_tool(tool, corpus_dir, description)
+                    result['repeat'] = repeat
+                    self.results.append(result)
+                    print("%-26s %6d files  %8.2f s  %8.1f files/s  %10.1f annotations/s  %8.1f MB%s" % (
+                        tool, result['files'], result['wall_time'], result['files_per_second'],
+                        result['annotations_per_second'], result['peak_rss_mb'],
+                        "" if result['returncode'] == 0 else "  (exit code %d)" % result['returncode']),
+                        file=sys.stderr)
+
+    def get_corpus(self, size):
+        """
+        Returns the corpus with the number of files and the settings of the generator, generating it if it does
+        not exist yet.
+        :param size:
+        :return: a tuple: corpus directory, description of the corpus
+        """
+        settings = self.generator.get_settings()
+        corpus_dir = self.work_dir + os.sep + "corpus_%d_%s" % (size, data_hash(settings)[:8])
+        description_file = corpus_dir + os.sep + CORPUS_DESCRIPTION_FILE_NAME
+        if os.path.isfile(description_file):
+            with open(description_file) as f:
+                description = json.load(f)
+            if description['settings'] == settings and description['files'] == size:
+                return corpus_dir, description
+        if os.path.exists(corpus_dir):
+            shutil.rmtree(corpus_dir)
+
+        print("Generating a corpus of %d files in %s" % (size, corpus_dir), file=sys.stderr)
+        description = self.generator.generate(corpus_dir, size, self.generator_workers)
+        return corpus_dir, description
+
+    def run_tool(self, tool, corpus_dir, description):
+        """
+        Runs one tool on a corpus in a child process and measures its time and memory use.
+        :param tool:
+        :param corpus_dir:
+        :param description:
+        :return: the result of the run
+        """
+        output_dir = self.work_dir + os.sep + "output" + os.sep + tool
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+
+        values = {'corpus': corpus_dir, 'metadata': corpus_dir + os.sep + METADATA_FILE_NAME, 'output': output_dir}
+        command = [sys.executable] + [argument.format(**values) for argument in TOOLS[tool]]
+
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(
+            [REPOSITORY_DIR, PYTHON_DIR] + ([os.environ['PYTHONPATH']] if os.environ.get('PYTHONPATH') else []))
+
+        with open(output_dir + os.sep + "stdout.log", 'wb') as stdout, \
+                open(output_dir + os.sep + "stderr.log", 'wb') as stderr:
+            start = time.perf_counter()
+            process = subprocess.Popen(command, stdout=stdout, stderr=stderr, cwd=REPOSITORY_DIR, env=environment)
+            # wait4 gives the resource usage of this child only
+            (pid, status, resource_usage) = os.wait4(process.pid, 0)
+            wall_time = time.perf_counter() - start
+        returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        process.returncode = returncode
+
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_rss = resource_usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+        return {
+            'tool': tool,
+            'files': description['files'],
+            'annotations': description['annotations'],
+            'corpus_settings': description['settings'],
+            'wall_time': wall_time,
+            'user_time': resource_usage.ru_utime,
+            'system_time': resource_usage.ru_stime,
+            'files_per_second': description['files'] / wall_time,
+            'annotations_per_second': description['annotations'] / wall_time,
+            'peak_rss_mb': peak_rss / (1024.0 * 1024.0),
+            'returncode': returncode
+        }
+
+    def write_results(self, results_file):
+        output_data = {
+            'commit': get_commit(),
+            'date': datetime.datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': self.results
+        }
+        with open(results_file, 'w') as f:
+            json.dump(output_data, f, indent=4)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'describe', '--always', '--dirty'], cwd=REPOSITORY_DIR,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(old_results_file, new_results_file):
+    """
+    Prints, per tool and corpus size, the best wall clock time and peak memory of both results files.
+    :param old_results_file:
+    :param new_results_file:
+    :return:
+    """
+    def best_runs(results_file):
+        with open(results_file) as f:
+            output_data = json.load(f)
+        runs = {}
+        for result in output_data['results']:
+            key = (result['tool'], result['files'])
+            if key not in runs or result['wall_time'] < runs[key]['wall_time']:
+                runs[key] = result
+        return output_data['commit'], runs
+
+    (old_commit, old_runs) = best_runs(old_results_file)
+    (new_commit, new_runs) = best_runs(new_results_file)
+    print("%-26s %6s  %10s  %10s  %7s  %9s  %9s" % ("tool", "files", str(old_commit)[:10], str(new_commit)[:10],
+                                                     "speedup", "old MB", "new MB"))
+    for key in sorted(set(old_runs) & set(new_runs)):
+        old = old_runs[key]
+        new = new_runs[key]
+        print("%-26s %6d  %9.2fs  %9.2fs  %6.2fx  %9.1f  %9.1f" % (key[0], key[1], old['wall_time'],
+                                                                   new['wall_time'],
+                                                                   old['wall_time'] / new['wall_time'],
+                                                                   old['peak_rss_mb'], new['peak_rss_mb']))
+
+
+if __name__ == "__main__":
+    usage = "Usage: \n" + sys.argv[0] + \
+            " -d <work directory>" + \
+            " -o <results file (.json)>" + \
+            " [-n <corpus sizes, default 10,1000,10000>]" + \
+            " [-t <tools, default all: " + ",".join(sorted(TOOLS)) + ">]" + \
+            " [-r <repeats, default 1>]" + \
+            " [-l <session length in seconds>] [-a <signs per minute per signer>] [-w <two handed rate>]" + \
+            " [-s <random seed>] [-j <number of processes generating a corpus>]" + \
+            " [-c <results file of an earlier run to compare with>]"
+
+    # Set default values
+    work_dir = None
+    results_file = None
+    sizes = DEFAULT_SIZES
+    tools = None
+    repeats = 1
+    settings = {}
+    generator_workers = 1
+    compare_with = None
+
+    # Register command line arguments
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'd:o:n:t:r:l:a:w:s:j:c:')
+    for opt in opt_list:
+        if opt[0] == '-d':
+            work_dir = opt[1]
+        if opt[0] == '-o':
+            results_file = opt[1]
+        if opt[0] == '-n':
+            sizes = [int(size) for size in opt[1].split(",")]
+        if opt[0] == '-t':
+            tools = opt[1].split(",")
+        if opt[0] == '-r':
+            repeats = int(opt[1])
+        if opt[0] == '-l':
+            settings['session_length'] = int(opt[1])
+        if opt[0] == '-a':
+            settings['annotation_density'] = float(opt[1])
+        if opt[0] == '-w':
+            settings['two_handed_rate'] = float(opt[1])
+        if opt[0] == '-s':
+            settings['seed'] = int(opt[1])
+        if opt[0] == '-j':
+            generator_workers = int(opt[1])
+        if opt[0] == '-c':
+            compare_with = opt[1]
+
+    # Check for errors and report
+    errors = []
+    if work_dir is None:
+        errors.append("No work directory given.")
+    if results_file is None:
+        errors.append("No results file given.")
+    if tools is not None:
+        for tool in tools:
+            if tool not in TOOLS:
+                errors.append("Unknown tool: " + tool)
+
+    if len(errors) != 0:
+        print("Errors:")
+        print("\n".join(errors))
+        print(usage)
+        exit(1)
+
+    benchmark = Benchmark(work_dir, sizes=sizes, tools=tools, repeats=repeats,
+                          generator=SyntheticCorpusGenerator(**settings), generator_workers=generator_workers)
+    benchmark.run()
+    benchmark.write_results(results_file)
+    if compare_with is not None:
+        compare_results(compare_with, results_file)
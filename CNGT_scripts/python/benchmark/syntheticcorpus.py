@@ -0,0 +1,236 @@
+#!/usr/bin/python
+
+"""
+Script to generate a corpus of synthetic EAFs with the structure of the CNGT: per signer (S1, S2) the tiers
+GlossL, GlossR, TranslationFree, TranslationNarrow and DomRev Point, a participant per signer and a video per signer.
+Glosses are drawn from a Zipf-like distribution, so there are frequent and rare signs as in a real corpus.
+"""
+
+from __future__ import print_function
+
+import getopt
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+from pympi.Elan import Eaf
+
+CORPUS_DESCRIPTION_FILE_NAME = "corpus.json"
+METADATA_FILE_NAME = "metadata.tsv"
+
+REGIONS = ['Amsterdam', 'Groningen', 'Voorburg', 'Zwolle', 'Gestel']
+
+
+class SyntheticCorpusGenerator:
+    def __init__(self, session_length=600, annotation_density=40, two_handed_rate=0.3, vocabulary_size=2000,
+                 number_of_signers=100, seed=0):
+        """
+        :param session_length: length of a session in seconds
+        :param annotation_density: number of signs per minute per signer
+        :param two_handed_rate: fraction of the signs that is annotated on both hand tiers, with overlap
+        :param vocabulary_size: number of different glosses
+        :param number_of_signers: number of different participants in the corpus
+        :param seed: seed of the random generator; the same settings and seed give the same corpus
+        """
+        self.session_length = session_length
+        self.annotation_density = annotation_density
+        self.two_handed_rate = two_handed_rate
+        self.vocabulary_size = vocabulary_size
+        self.number_of_signers = number_of_signers
+        self.seed = seed
+
+        self.glosses = ['GLOSS%d' % i for i in range(vocabulary_size)]
+        # Some classifiers and fingerspellings, used by the calculated metadata
+        self.glosses[1::17] = ['DS_%d' % i for i in range(len(self.glosses[1::17]))]
+        self.glosses[2::23] = ['#FS%d' % i for i in range(len(self.glosses[2::23]))]
+        self.gloss_cumulative_weights = list(itertools.accumulate(1.0 / (rank + 1) for rank in range(vocabulary_size)))
+
+    def get_settings(self):
+        return {
+            'session_length': self.session_length,
+            'annotation_density': self.annotation_density,
+            'two_handed_rate': self.two_handed_rate,
+            'vocabulary_size': self.vocabulary_size,
+            'number_of_signers': self.number_of_signers,
+            'seed': self.seed
+        }
+
+    def generate(self, output_dir, number_of_files, workers=1):
+        """
+        Generates the EAFs, a metadata file for the signers and a description of the corpus (corpus.json).
+        :param output_dir:
+        :param number_of_files:
+        :param workers: number of processes generating EAFs
+        :return: the description of the corpus
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        sessions = range(1, number_of_files + 1)
+        if workers > 1:
+            with multiprocessing.Pool(workers) as pool:
+                annotations = pool.starmap(self.generate_session, [(output_dir, session) for session in sessions])
+        else:
+            annotations = [self.generate_session(output_dir, session) for session in sessions]
+
+        self.write_metadata(output_dir + os.sep + METADATA_FILE_NAME)
+
+        description = {
+            'settings': self.get_settings(),
+            'files': number_of_files,
+            'annotations': sum(annotations),
+            'metadata_file': METADATA_FILE_NAME
+        }
+        with open(output_dir + os.sep + CORPUS_DESCRIPTION_FILE_NAME, 'w') as f:
+            json.dump(description, f, indent=4)
+        return description
+
+    def get_session_file_name(self, output_dir, session):
+        # At most 1000 EAFs per directory
+        return os.sep.join([output_dir, "%03d" % (session // 1000), "CNGT%04d.eaf" % session])
+
+    def generate_session(self, output_dir, session):
+        """
+        Generates one EAF.
+        :param output_dir:
+        :param session: session number
+        :return: the number of annotations in the EAF
+        """
+        r = random.Random("%d-%d" % (self.seed, session))
+        eaf = Eaf()
+        eaf.remove_tier('default')
+        for lingtype in ['gloss', 'translation', 'domrev']:
+            eaf.add_linguistic_type(lingtype)
+
+        number_of_annotations = 0
+        participants = r.sample(range(1, self.number_of_signers + 1), 2)
+        for subject_id, participant_number in zip([1, 2], participants):
+            participant = "S%03d" % participant_number
+            for hand in ['L', 'R']:
+                eaf.add_tier('Gloss%s S%d' % (hand, subject_id), ling='gloss', part=participant)
+            eaf.add_tier('TranslationFree S%d' % subject_id, ling='translation', part=participant)
+            eaf.add_tier('TranslationNarrow S%d' % subject_id, ling='translation', part=participant)
+            eaf.add_tier('DomRev Point S%d' % subject_id, ling='domrev', part=participant)
+            eaf.add_linked_file('file:///video/CNGT%04d_%s_b.mpg' % (session, participant), mimetype='video/mpeg')
+
+            number_of_annotations += self.add_signs(eaf, r, subject_id)
+
+        file_name = self.get_session_file_name(output_dir, session)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        eaf.to_file(file_name, pretty=True)
+        return number_of_annotations
+
+    def add_signs(self, eaf, r, subject_id):
+        """
+        Adds signs on the gloss tiers of one signer, with sentences around them on the translation tier and
+        some points on the dominance reversal tier.
+        :return: the number of annotations added
+        """
+        session_end = self.session_length * 1000
+        mean_step = 60000.0 / self.annotation_density
+        number_of_annotations = 0
+
+        time = int(r.uniform(0, mean_step))
+        sentence_begin = time
+        signs_in_sentence = 0
+        dominant_hand = 'R' if r.random() < 0.9 else 'L'
+        while time < session_end:
+            duration = int(r.uniform(0.3, 0.9) * mean_step)
+            gloss = r.choices(self.glosses, cum_weights=self.gloss_cumulative_weights)[0]
+            eaf.add_annotation('Gloss%s S%d' % (dominant_hand, subject_id), time, time + duration, gloss)
+            number_of_annotations += 1
+            if r.random() < self.two_handed_rate:
+                other_hand = 'L' if dominant_hand == 'R' else 'R'
+                offset = r.randint(-40, 40)
+                eaf.add_annotation('Gloss%s S%d' % (other_hand, subject_id), max(0, time + offset),
+                                   time + duration + r.randint(1, 60), gloss)
+                number_of_annotations += 1
+            time += duration
+            signs_in_sentence += 1
+
+            # End of a sentence
+            if signs_in_sentence >= r.randint(3, 12):
+                eaf.add_annotation('TranslationFree S%d' % subject_id, sentence_begin, time, 'sentence')
+                number_of_annotations += 1
+                if r.random() < 0.05:
+                    value = r.choice(['TL', 'TR', 'RL', 'LR'])
+                    eaf.add_annotation('DomRev Point S%d' % subject_id, time, time + 10, value)
+                    number_of_annotations += 1
+                    if value in ['RL', 'LR']:
+                        dominant_hand = 'L' if dominant_hand == 'R' else 'R'
+                time += int(r.expovariate(1.0 / 1500))  # pause between sentences
+                sentence_begin = time
+                signs_in_sentence = 0
+            else:
+                time += int(r.uniform(0, 0.4) * mean_step)
+
+        return number_of_annotations
+
+    def write_metadata(self, metadata_file):
+        """
+        Writes a metadata file for the signers as read by signCounter.
+        :param metadata_file:
+        :return:
+        """
+        r = random.Random(self.seed)
+        with open(metadata_file, 'w') as f:
+            f.write("\t".join(['Signer', 'Metadata region', 'Age group', 'Gender']) + "\n")
+            for participant_number in range(1, self.number_of_signers + 1):
+                f.write("\t".join(["S%03d" % participant_number, r.choice(REGIONS),
+                                   r.choice(['18-35', '36-50', '51-65', '66+']), r.choice(['F', 'M'])]) + "\n")
+
+
+if __name__ == "__main__":
+    usage = "Usage: \n" + sys.argv[0] + \
+            " -o <output directory>" + \
+            " -n <number of files>" + \
+            " -l <session length in seconds, default 600>" + \
+            " -d <signs per minute per signer, default 40>" + \
+            " -t <two handed rate, default 0.3>" + \
+            " -v <vocabulary size, default 2000>" + \
+            " -s <random seed, default 0>" + \
+            " -j <number of processes>"
+
+    # Set default values
+    output_dir = None
+    number_of_files = None
+    settings = {}
+    workers = 1
+
+    # Register command line arguments
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:n:l:d:t:v:s:j:')
+    for opt in opt_list:
+        if opt[0] == '-o':
+            output_dir = opt[1]
+        if opt[0] == '-n':
+            number_of_files = int(opt[1])
+        if opt[0] == '-l':
+            settings['session_length'] = int(opt[1])
+        if opt[0] == '-d':
+            settings['annotation_density'] = float(opt[1])
+        if opt[0] == '-t':
+            settings['two_handed_rate'] = float(opt[1])
+        if opt[0] == '-v':
+            settings['vocabulary_size'] = int(opt[1])
+        if opt[0] == '-s':
+            settings['seed'] = int(opt[1])
+        if opt[0] == '-j':
+            workers = int(opt[1])
+
+    # Check for errors and report
+    errors = []
+    if output_dir is None:
+        errors.append("No output directory given.")
+    if number_of_files is None:
+        errors.append("No number of files given.")
+
+    if len(errors) != 0:
+        print("Errors:")
+        print("\n".join(errors))
+        print(usage)
+        exit(1)
+
+    generator = SyntheticCorpusGenerator(**settings)
+    description = generator.generate(output_dir, number_of_files, workers)
+    print("Generated %d EAFs with %d annotations in %s" % (description['files'], description['annotations'],
+                                                            output_dir), file=sys.stderr)
@@ -10,20 +10,121 @@ import getopt
 import json
 import numpy
 import math
-from CNGT_scripts.python.filecollectionprocessing.eafprocessor import EafProcessor
+from collections import Counter
+from CNGT_scripts.python.filecollectionprocessing.eaftierprocessor import EafTierProcessor
+from CNGT_scripts.python.filecollectionprocessing.annotationcache import open_annotation_cache
 from CNGT_scripts.python.filecollectionprocessing.filecollectionprocessor import FileCollectionProcessor
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
+from CNGT_scripts.python.intervals import count_overlapping
+from CNGT_scripts.python.signcounts import Interner
+from CNGT_scripts.python.metadatastate import CalculatedMetadataState
 
+GLOSS_TIER_IDS = [(subject_id, 'Gloss' + hand + ' S' + str(subject_id)) for subject_id in [1, 2] for hand in ['L', 'R']]
 
-class EafMetadataCalculator(EafProcessor):
+
+class GlossTier:
+    """
+    The annotations of one gloss tier, sorted once by begin time (annotations with the same begin time keep the
+    order of the tier): arrays of begin and end times and a list of values.
+    """
+
+    def __init__(self, tier):
+        begins = numpy.fromiter((annotation.begin for annotation in tier.annotations), dtype=numpy.int64,
+                                count=len(tier.annotations))
+        order = numpy.argsort(begins, kind='stable')
+        self.begins = begins[order]
+        self.ends = numpy.fromiter((tier.annotations[index].end for index in order), dtype=numpy.int64,
+                                   count=len(order))
+        self.values = [tier.annotations[index].value for index in order]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class DocumentTiers:
+    """
+    The tiers of one EAF, with the four gloss tiers decoded once into GlossTiers, shared by all metrics of the EAF.
+    The values of the gloss tiers are interned, so predicates on values are evaluated once per different value.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.gloss_tiers = [(subject_id, GlossTier(tiers[tier_id])) for (subject_id, tier_id) in GLOSS_TIER_IDS]
+        self.longest_tiers = {}
+
+        # The different values of the four gloss tiers and the number of annotations per value
+        self.values = Interner()
+        number_of_annotations = sum(len(gloss_tier) for (subject_id, gloss_tier) in self.gloss_tiers)
+        value_ids = numpy.fromiter((self.values.get_id(value) for (subject_id, gloss_tier) in self.gloss_tiers
+                                    for value in gloss_tier.values), dtype=numpy.int64, count=number_of_annotations)
+        self.value_frequencies = numpy.bincount(value_ids, minlength=len(self.values))
+
+    def get_number_of_annotations(self):
+        return int(self.value_frequencies.sum())
+
+    def count_annotations(self, predicate):
+        """
+        Counts the annotations of the four gloss tiers of which the value satisfies the predicate.
+        :param predicate: function of a value
+        :return:
+        """
+        mask = numpy.fromiter((predicate(value) for value in self.values), dtype=bool, count=len(self.values))
+        return int(self.value_frequencies[mask].sum())
+
+    def get_longest_tier(self, subject=None):
+        """
+        Returns the gloss tier containing the most annotations, of one subject or of both; the first of the tiers
+        in case of a tie.
+        :param subject: 1, 2 or None for both subjects
+        :return: a tuple: the subject of the tier (or the subject given, if there are no annotations), the GlossTier
+                 or None if there are no annotations
+        """
+        if subject not in self.longest_tiers:
+            longest_subject = subject if subject in [1, 2] else None
+            longest_tier = None
+            for (subject_id, gloss_tier) in self.gloss_tiers:
+                if subject in [1, 2] and subject_id != subject:
+                    continue
+                if len(gloss_tier) > (len(longest_tier) if longest_tier is not None else 0):
+                    longest_subject = subject_id
+                    longest_tier = gloss_tier
+            self.longest_tiers[subject] = (longest_subject, longest_tier)
+        return self.longest_tiers[subject]
+
+    def get_begin(self):
+        """
+        Returns the begin time of the first gloss annotation, or None if there are none.
+        :return:
+        """
+        begins = [int(gloss_tier.begins[0]) for (subject_id, gloss_tier) in self.gloss_tiers if len(gloss_tier)]
+        return min(begins) if begins else None
+
+    def get_end(self):
+        """
+        Returns the end time of the last gloss annotation, or None if there are none.
+        :return:
+        """
+        ends = [int(gloss_tier.ends.max()) for (subject_id, gloss_tier) in self.gloss_tiers if len(gloss_tier)]
+        return max(ends) if ends else None
+
+
+class EafMetadataCalculator(EafTierProcessor):
     """
     
     """
 
-    def __init__(self, metadata_file=None):
+    def __init__(self, metadata_file=None, state_file=None):
+        """
+        :param metadata_file: the output file, or None to print the result
+        :param state_file: file with the metrics of the sessions of an earlier run, see get_files_to_process
+        """
         self.metadata_file = metadata_file
+        self.state = CalculatedMetadataState(state_file) if state_file else None
         self.metadata = {}
-        self.annotations_per_signer_per_file = {}
-        self.annotation_frequencies = {}
+        # Per file the frequencies of the annotation values used for lowFreqSigns, as arrays of value ids and
+        # frequencies
+        self.annotation_values = Interner()
+        self.annotation_frequencies_per_file = {}
         self.ranges = {
             'speed': {'min': 0, 'max': 0},
             'differentSigns': {'min': 0, 'max': 0},
@@ -53,90 +154,146 @@ class EafMetadataCalculator(EafProcessor):
             self.ranges[key]['max'] = value
         self.value_lists[key].append(value)
 
-    def get_annotations_from_longest_tier(self, eaf, subject=None):
-        # Get the annotations from the tier containing the most annotations
-        annotations = []
-
-        if subject in [1, 2]:
-            subject_ids = [subject]
-        else:
-            subject_ids = [1, 2]
-
-        for subject_id in subject_ids:
-
-            for hand in ['L', 'R']:
-                tier_id = 'Gloss' + hand + ' S' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                current_annotations = transform_tier_data(eaf, tier)
-                if len(current_annotations) > len(annotations):
-                    annotations = current_annotations
-                    subject = subject_id
-
-        # Sort the list by begin time
-        annotations.sort(key=lambda ann: ann['begin'])
-
-        return (subject, annotations)
+    def get_tier_ids(self):
+        # Only the tiers used for the metadata are read from the EAFs
+        tier_ids = []
+        for subject_id in [1, 2]:
+            tier_ids += ['Gloss' + hand + ' S' + str(subject_id) for hand in ['L', 'R']]
+            tier_ids += [tier_base_name + ' S' + str(subject_id)
+                         for tier_base_name in ['TranslationFree', 'TranslationNarrow', 'DomRev Point']]
+        return tier_ids
 
-    def process_eaf(self, eaf, file_name):
+    def process_tiers(self, tiers, file_name):
         print(file_name, file=sys.stdout)
-        self.count_signs(eaf, file_name)
+        # The gloss tiers are decoded once for all metrics
+        document_tiers = DocumentTiers(tiers)
+        self.count_signs(document_tiers, file_name)
 
         session_id = file_name_to_session_id(file_name)
         self.metadata[session_id] = {}
 
-        self.metadata[session_id]['participants'] = get_participants(eaf)
+        self.metadata[session_id]['participants'] = get_participants(tiers)
 
-        self.metadata[session_id]['speed'] = round(self.get_speed(eaf), 1)
+        self.metadata[session_id]['speed'] = round(self.get_speed(document_tiers), 1)
         self.update_range('speed', self.metadata[session_id]['speed'])
 
-        self.metadata[session_id]['differentSigns'] = self.get_different_signs(eaf)
+        self.metadata[session_id]['differentSigns'] = self.get_different_signs(document_tiers)
         self.update_range('differentSigns', self.metadata[session_id]['differentSigns'])
 
-        self.metadata[session_id]['classifiers'] = round(self.get_classifiers(eaf), 1)
+        self.metadata[session_id]['classifiers'] = round(self.get_classifiers(document_tiers), 1)
         self.update_range('classifiers', self.metadata[session_id]['classifiers'])
 
-        sentence_length = self.get_sentence_length(eaf)
+        sentence_length = self.get_sentence_length(document_tiers)
         if sentence_length:
             self.metadata[session_id]['sentenceLength'] = round(sentence_length, 1)
             self.update_range('sentenceLength', self.metadata[session_id]['sentenceLength'])
 
-        self.metadata[session_id]['fingerspelling'] = self.get_fingerspelling(eaf)
+        self.metadata[session_id]['fingerspelling'] = self.get_fingerspelling(document_tiers)
         self.update_range('fingerspelling', self.metadata[session_id]['fingerspelling'])
 
-        self.metadata[session_id]['interaction'] = self.get_interaction(eaf)
+        self.metadata[session_id]['interaction'] = self.get_interaction(tiers)
         self.update_range('interaction', self.metadata[session_id]['interaction'])
 
-        self.metadata[session_id]['dominanceReversal'] = self.get_dominance_reversal(eaf)
+        self.metadata[session_id]['dominanceReversal'] = self.get_dominance_reversal(tiers)
         self.update_range('dominanceReversal', self.metadata[session_id]['dominanceReversal'])
 
+    def get_file_result(self, file_name):
+        session_id = file_name_to_session_id(file_name)
+        return {
+            'metadata': self.metadata.pop(session_id, None),
+            'annotation_frequencies': self.get_annotation_frequencies(file_name)
+        }
+
+    def merge_file_result(self, file_name, file_result):
+        if file_result['annotation_frequencies'] is not None:
+            self.add_annotation_frequencies(file_name, file_result['annotation_frequencies'])
+        if file_result['metadata'] is not None:
+            session_id = file_name_to_session_id(file_name)
+            self.metadata[session_id] = file_result['metadata']
+            for key, value in file_result['metadata'].items():
+                if key in self.value_lists:
+                    self.update_range(key, value)
+
+    def get_files_to_process(self, file_names):
+        """
+        Returns the EAFs to process. With a state file, only the EAFs that are new or changed since the state file
+        was saved are processed; EAFs that no longer exist are removed from the state. Changed EAFs are removed from
+        the state as well, and only added again if they are processed successfully.
+        :param file_names: files and directories
+        :return:
+        """
+        if self.state is None:
+            return file_names
+        files = list(find_files(file_names, extensions=["eaf"]))
+        current_files = set(os.path.abspath(f) for f in files)
+        for file_name in self.state.get_file_names():
+            if file_name not in current_files:
+                self.state.remove(file_name)
+        files_to_process = [f for f in files if not self.state.is_unchanged(f)]
+        for file_name in files_to_process:
+            self.state.remove(file_name)
+        print("Processing %d of %d EAFs; the metadata of the others is taken from %s."
+              % (len(files_to_process), len(files), self.state.state_file), file=sys.stderr)
+        return files_to_process
+
+    def update_state(self):
+        """
+        Adds the sessions processed in this run to the state and saves it, and continues with the sessions of the
+        state: the sessions of all EAFs.
+        :return:
+        """
+        for file_name in list(self.annotation_frequencies_per_file):
+            session_id = file_name_to_session_id(file_name)
+            if session_id in self.metadata:
+                self.state.add(file_name, session_id, self.metadata[session_id],
+                               self.get_annotation_frequencies(file_name))
+        self.state.save()
+
+        self.metadata = {}
+        self.annotation_values = Interner()
+        self.annotation_frequencies_per_file = {}
+        for file_name in self.state.get_file_names():
+            entry = self.state.files[file_name]
+            self.metadata[entry['session_id']] = dict(entry['metadata'])
+            self.add_annotation_frequencies(file_name, entry['frequencies'])
+
+    def get_range_statistics(self, key):
+        """
+        Returns the mean, standard deviation, minimum and maximum of the values of a metric.
+        :param key:
+        :return:
+        """
+        if self.state is not None and key in self.state.statistics:
+            return self.state.get_range_statistics()[key]
+        return (numpy.mean(self.value_lists[key]), numpy.std(self.value_lists[key]), self.ranges[key]['min'],
+                self.ranges[key]['max'])
+
     def calculate_ranges(self):
         ranges = {}
 
         for float_value in ['speed',  'classifiers', 'sentenceLength']:
-            mean = numpy.mean(self.value_lists[float_value])
-            std2 = numpy.std(self.value_lists[float_value]) * 2
+            (mean, std, range_min, range_max) = self.get_range_statistics(float_value)
+            std2 = std * 2
             ranges[float_value] = {}
             std_min = round(mean - std2, 2)
-            range_min = self.ranges[float_value]['min']
             ranges[float_value]['min'] = std_min if std_min > range_min else range_min
             std_max = round(mean + std2, 2)
-            range_max = self.ranges[float_value]['max']
             ranges[float_value]['max'] = std_max if std_max < range_max else range_max
 
         for int_value in ['differentSigns',  'fingerspelling', 'interaction', 'dominanceReversal', 'lowFreqSigns']:
-            mean = numpy.mean(self.value_lists[int_value])
-            std2 = numpy.std(self.value_lists[int_value]) * 2
+            (mean, std, range_min, range_max) = self.get_range_statistics(int_value)
+            std2 = std * 2
             ranges[int_value] = {}
             std_min = math.floor(mean - std2)
-            range_min = self.ranges[int_value]['min']
             ranges[int_value]['min'] = std_min if std_min > range_min else range_min
             std_max = math.ceil(mean + std2)
-            range_max = self.ranges[int_value]['max']
             ranges[int_value]['max'] = std_max if std_max < range_max else range_max
 
         return ranges
 
     def get_result(self):
+        if self.state is not None:
+            self.update_state()
         self.get_low_frequency_signs()
         ranges = self.calculate_ranges()
         output_data = {'ranges': ranges, 'sessions': self.metadata}
@@ -146,38 +303,21 @@ class EafMetadataCalculator(EafProcessor):
         else:
             print(json.dumps(output_data, sort_keys=True, indent=4))
 
-    def get_speed(self, eaf):
+    def get_speed(self, document_tiers):
         """
         Average number of annotations per minute for the gloss tier (one of four) containing the largest number of 
         annotations, excluding gaps of more than two seconds without any annotations.
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
-        (subject, annotations) = self.get_annotations_from_longest_tier(eaf)
-        if annotations:
-
-            intervals = []
-            current_begin = annotations[0]['begin']  # begin time of first annotation
-            current_end = annotations[0]['end']  # end time of the first annotation
-            current_number_of_annotations = 1
-            ann_index = 1
-            while ann_index < len(annotations):
-                if annotations[ann_index]['begin'] - current_end >= 2.0:
-                    intervals.append({'length': current_end - current_begin,
-                                      'number_of_annotations': current_number_of_annotations})
-                    current_begin = annotations[ann_index]['begin']
-                    current_end = annotations[ann_index]['end']
-                    current_number_of_annotations = 1
-                else:
-                    current_end = annotations[ann_index]['end']
-                    current_number_of_annotations += 1
-                ann_index += 1
-
-            total_length = 0
-            total_number_of_annotations = 0
-            for interval in intervals:
-                total_length += interval['length']
-                total_number_of_annotations += interval['number_of_annotations']
+        (subject, gloss_tier) = document_tiers.get_longest_tier()
+        if gloss_tier is not None:
+            # An interval ends where the gap between an annotation and the next one is at least two (milliseconds);
+            # the last interval (after the last gap) is not counted
+            gaps = numpy.flatnonzero(gloss_tier.begins[1:] - gloss_tier.ends[:-1] >= 2.0) + 1
+            starts = numpy.concatenate(([0], gaps))[:-1]
+            total_length = int(numpy.sum(gloss_tier.ends[gaps - 1] - gloss_tier.begins[starts]))
+            total_number_of_annotations = int(gaps[-1]) if len(gaps) else 0
 
             speed = (total_number_of_annotations / (total_length / 1000.0 / 60)) if total_length else 0
             print("Annotations per minute: %f" % speed, file=sys.stderr)  # Number of annotations per minute
@@ -186,76 +326,58 @@ class EafMetadataCalculator(EafProcessor):
             print("No annotations found", file=sys.stderr)
             return 0
 
-    def get_different_signs(self, eaf):
+    def get_different_signs(self, document_tiers):
         """
         Number of different annotations for all four gloss tiers combined.
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
-        annotation_set = set()
-        for subject_id in [1, 2]:
-            for hand in ['L', 'R']:
-                tier_id = 'Gloss' + hand + ' S' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                for annotation in tier[0].values():
-                    annotation_set.add(annotation[2])
-        print("Number of different annotations: " + str(len(annotation_set)), file=sys.stderr)
-        return len(annotation_set)
+        number_of_different_annotations = len(document_tiers.values)
+        print("Number of different annotations: " + str(number_of_different_annotations), file=sys.stderr)
+        return number_of_different_annotations
 
-    def get_classifiers(self, eaf):
+    def get_classifiers(self, document_tiers):
         """
         Average number of annotations per minute with one or more underscores on all four gloss tiers combined
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
-        annotations = []
-        for subject_id in [1, 2]:
-            for hand in ['L', 'R']:
-                tier_id = 'Gloss' + hand + ' S' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                current_annotations = transform_tier_data(eaf, tier)
-                annotations += current_annotations
-        if annotations:
-            annotations.sort(key=lambda ann: ann['begin'])
-            begin = annotations[0]['begin']
-            annotations.sort(key=lambda ann: ann['end'])
-            end = annotations[-1]['end']
-            classifier_annotations = [ann for ann in annotations if '_' in ann['value']]
-            classifiers = len(classifier_annotations) / ((end - begin) / 1000.0 / 60)
+        if document_tiers.get_number_of_annotations():
+            begin = document_tiers.get_begin()
+            end = document_tiers.get_end()
+            number_of_classifiers = document_tiers.count_annotations(lambda value: '_' in value)
+            classifiers = number_of_classifiers / ((end - begin) / 1000.0 / 60)
             print("Classifiers: %f (%d, %d, %d)" % (classifiers,
-                                                    len(classifier_annotations), begin, end), file=sys.stderr)
+                                                    number_of_classifiers, begin, end), file=sys.stderr)
             return classifiers
         else:
             print("No classifiers found", file=sys.stderr)
             return 0
 
 
-    def get_sentence_length(self, eaf):
+    def get_sentence_length(self, document_tiers):
         """
         Average number of annotations per sentence for the gloss tier (one of four) containing the largest number of 
         annotations
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
-        (subject, annotations) = self.get_annotations_from_longest_tier(eaf)
-        if subject and annotations:
+        (subject, gloss_tier) = document_tiers.get_longest_tier()
+        if subject and gloss_tier is not None:
             tier_id = 'TranslationFree S' + str(subject)
-            tier = eaf.tiers[tier_id]
-            translation_annotations = transform_tier_data(eaf, tier)
+            tier = document_tiers.tiers[tier_id]
+            translation_annotations = tier.annotations
             if not translation_annotations:
                 tier_id = 'TranslationNarrow S' + str(subject)
-                tier = eaf.tiers[tier_id]
-                translation_annotations = transform_tier_data(eaf, tier)
-            translation_annotations.sort(key=lambda ann: ann['begin'])
+                tier = document_tiers.tiers[tier_id]
+                translation_annotations = tier.annotations
 
             if translation_annotations:
-                number_of_annotations_per_sentence = []
-                for transl_ann in translation_annotations:
-                    overlapping_annotations = [
-                        ann for ann in annotations
-                        if has_overlap((ann['begin'], ann['end']), (transl_ann['begin'], transl_ann['end']))
-                    ]
-                    number_of_annotations_per_sentence.append(len(overlapping_annotations))
+                # The number of annotations overlapping with each sentence
+                number_of_annotations_per_sentence = count_overlapping(
+                    gloss_tier.begins, gloss_tier.ends,
+                    [transl_ann.begin for transl_ann in translation_annotations],
+                    [transl_ann.end for transl_ann in translation_annotations])
 
                 sentence_length = sum(number_of_annotations_per_sentence) / float(len(number_of_annotations_per_sentence))
                 print("Sentence length: %f" % sentence_length, file=sys.stderr)
@@ -270,101 +392,121 @@ class EafMetadataCalculator(EafProcessor):
             print("No annotations found", file=sys.stderr)
             return None
 
-    def count_signs(self, eaf, file_name):
+    def count_signs(self, document_tiers, file_name):
         """
         Total number of gloss annotations that fall within the 80% tail of the gloss frequency distribution across the 
         whole corpus. Frequencies are to be calculated on the basis of the tier per signer that contains most 
         annotations, so as to cover both left-handers and right-handers and so as not to count two-handed signs twice. 
         The annotations for the two signers should add up to one value.
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
 
-        self.annotations_per_signer_per_file[file_name] = {}
+        # Only the frequencies of the annotation values of the file are kept, until the frequencies of the whole
+        # corpus are known (see get_low_frequency_signs)
+        annotation_frequencies = Counter()
         for subject_id in [1, 2]:
-            (subject, annotations) = self.get_annotations_from_longest_tier(eaf, subject_id)
+            (subject, gloss_tier) = document_tiers.get_longest_tier(subject_id)
+            if gloss_tier is not None:
+                annotation_frequencies.update(gloss_tier.values)
+        self.add_annotation_frequencies(file_name, annotation_frequencies)
 
-            self.annotations_per_signer_per_file[file_name][subject_id] = annotations
+    def add_annotation_frequencies(self, file_name, annotation_frequencies):
+        """
+        Keeps the frequencies of the annotation values of a file as arrays of value ids and frequencies.
+        :param file_name:
+        :param annotation_frequencies: dictionary value: frequency
+        :return:
+        """
+        value_ids = numpy.fromiter((self.annotation_values.get_id(value) for value in annotation_frequencies),
+                                   dtype=numpy.int32, count=len(annotation_frequencies))
+        frequencies = numpy.fromiter(annotation_frequencies.values(), dtype=numpy.int32,
+                                     count=len(annotation_frequencies))
+        self.annotation_frequencies_per_file[file_name] = (value_ids, frequencies)
 
-            for annotation in annotations:
-                value = annotation['value']
-                if value in self.annotation_frequencies:
-                    self.annotation_frequencies[value] += 1
-                else:
-                    self.annotation_frequencies[value] = 1
+    def get_annotation_frequencies(self, file_name):
+        """
+        Returns and forgets the frequencies of the annotation values of a file, as a dictionary value: frequency.
+        :param file_name:
+        :return:
+        """
+        if file_name not in self.annotation_frequencies_per_file:
+            return None
+        (value_ids, frequencies) = self.annotation_frequencies_per_file.pop(file_name)
+        return {self.annotation_values[value_id]: frequency
+                for value_id, frequency in zip(value_ids.tolist(), frequencies.tolist())}
 
     def get_low_frequency_signs(self):
-        annotation_frequencies = list(self.annotation_frequencies.items())
-        index_80pct = int(len(annotation_frequencies)*0.8)
-        annotation_frequencies.sort(key=lambda ann: ann[1])
-        included_frequencies = set([ann[1] for ann in annotation_frequencies[:index_80pct]])
-
-        annotation_frequencies_80pct = set([ann[0] for ann in annotation_frequencies if ann[1] in included_frequencies])
+        """
+        Computes lowFreqSigns of every file once the frequencies of the whole corpus are known, from the frequencies
+        per file. This is the second phase of a run: the first phase, processing the files, can be done in parallel.
+        :return:
+        """
+        number_of_values = len(self.annotation_values)
+        annotation_frequencies = numpy.zeros(number_of_values, dtype=numpy.int64)
+        for (value_ids, frequencies) in self.annotation_frequencies_per_file.values():
+            annotation_frequencies[value_ids] += frequencies
+
+        # The values with a frequency among the lowest 80% of the frequencies of the values (including all values
+        # with the same frequency as the last of them)
+        index_80pct = int(number_of_values * 0.8)
+        if index_80pct > 0:
+            highest_included_frequency = numpy.sort(annotation_frequencies)[index_80pct - 1]
+            in_80pct = annotation_frequencies <= highest_included_frequency
+        else:
+            in_80pct = numpy.zeros(number_of_values, dtype=bool)
 
-        for file_path in self.annotations_per_signer_per_file:
+        for file_path, (value_ids, frequencies) in self.annotation_frequencies_per_file.items():
             file_name = file_name_to_session_id(file_path)
-            low_frequency_total = 0
-            for subject_id in [1, 2]:
-                annotations = [ann['value'] for ann in self.annotations_per_signer_per_file[file_path][subject_id]]
-                number_of_low_frequency_signs = 0
-                for annotation in annotations:
-                    if annotation in annotation_frequencies_80pct:
-                        number_of_low_frequency_signs += 1
-                low_frequency_total += number_of_low_frequency_signs
+            low_frequency_total = int(frequencies[in_80pct[value_ids]].sum())
             self.metadata[file_name]['lowFreqSigns'] = low_frequency_total
             self.update_range('lowFreqSigns', self.metadata[file_name]['lowFreqSigns'])
 
 
-    def get_fingerspelling(self, eaf):
+    def get_fingerspelling(self, document_tiers):
         """
         Total number of annotations for all four gloss tiers combined that contain the symbol '#' and a total of more 
         than two characters (so excluding e.g. '#M').
-        :param eaf: 
+        :param document_tiers: DocumentTiers
         :return: 
         """
-        annotations = []
-        for subject_id in [1, 2]:
-            for hand in ['L', 'R']:
-                tier_id = 'Gloss' + hand + ' S' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                current_annotations = transform_tier_data(eaf, tier, filter=lambda a: '#' in a and len(a) > 2)
-                annotations += current_annotations
-        print("Number of fingerspellings: %d" % len(annotations), file=sys.stderr)
-        return len(annotations)
+        number_of_fingerspellings = document_tiers.count_annotations(lambda value: '#' in value and len(value) > 2)
+        print("Number of fingerspellings: %d" % number_of_fingerspellings, file=sys.stderr)
+        return number_of_fingerspellings
 
-    def get_interaction(self, eaf):
+    def get_interaction(self, tiers):
         """
         Total number of TL and TR annotations on the two tiers 'DomRev Point S1' and 'DomRev Point S2'
-        :param eaf: 
+        :param tiers: 
         :return: 
         """
-        total = self.get_ooh_domrev_point_counts(eaf, ['TL', 'TR']) - 1
+        total = self.get_ooh_domrev_point_counts(tiers, ['TL', 'TR']) - 1
         if total is not None and total >= 0:
             print("Number of interactions: %d" % total, file=sys.stderr)
             return total
         else:
             return 0
 
-    def get_dominance_reversal(self, eaf):
+    def get_dominance_reversal(self, tiers):
         """
         Total number of RL and LR annotations on the two tiers 'DomRev Point S1' and 'DomRev Point S2'
-        :param eaf: 
+        :param tiers: 
         :return: 
         """
-        total = self.get_ooh_domrev_point_counts(eaf, ['RL', 'LR'])
+        total = self.get_ooh_domrev_point_counts(tiers, ['RL', 'LR'])
         if total is not None:
             print("Number of dominance reversals: %d" % total, file=sys.stderr)
             return total
         else:
             return 0
 
-    def get_ooh_domrev_point_counts(self, eaf, value_set):
+    def get_ooh_domrev_point_counts(self, tiers, value_set):
         total = 0
         try:
             for subject_id in [1, 2]:
                 tier_id = 'DomRev Point S' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                current_annotations = transform_tier_data(eaf, tier, lambda a: a in value_set)
+                tier = tiers[tier_id]
+                current_annotations = transform_tier_data(tier, lambda a: a in value_set)
                 total += len(current_annotations)
             return total
         except KeyError as ke:
@@ -372,54 +514,32 @@ class EafMetadataCalculator(EafProcessor):
             return None
 
 
-def transform_tier_data(eaf, tier, filter=lambda a: True):
+def transform_tier_data(tier, filter=lambda a: True):
     """
     Transforms and filters the tier data into a more workable format
-    :param eaf: 
     :param tier: 
     :param filter: 
     :return: 
     """
     return [{
-                'begin': eaf.timeslots[ann[0]],
-                'end': eaf.timeslots[ann[1]],
-                'value': ann[2]
-            } for ann in tier[0].values()
-                if filter(ann[2])]
-
+                'begin': ann.begin,
+                'end': ann.end,
+                'value': ann.value
+            } for ann in tier.annotations
+                if filter(ann.value)]
 
-def has_overlap(first, second, min_overlap=0):
-    """
-    Determines if there is overlap between the first and second interval accounting for a minimal overlap.
-    If an interval is within the other, there is overlap no matter the amount of overlap.
 
-    :param first: tuple first interval (begin, end)
-    :param second: tuple second interval (begin, end)
-    :param min_overlap: int minimal overlap integer
-    :return:
-    """
-    if first[0] >= second[1] or second[0] >= first[1]:  # the start of one is after the end of the other
-        return False
-    overlap_interval = (max(first[0], second[0]), min(first[1], second[1]))
-    overlap = overlap_interval[1] - overlap_interval[0]
-    if overlap_interval == first or overlap_interval == second:  # one interval is completely within the other
-        return True
-    elif overlap >= min_overlap:
-        return True
-    return False  # default
-
-
-def get_participants(eaf):
+def get_participants(tiers):
     """
     Get the participant of this EAF. Based on the condition the EAF has both GlossL S1 as GlossL S2 tiers.
-    :param eaf: 
+    :param tiers: 
     :return: a list containing the participant codes
     """
     participants = []
     for subject_id in [1, 2]:
         tier_id = 'GlossL S' + str(subject_id)  # Determine tier id
-        tier = eaf.tiers[tier_id]
-        attributes = tier[-2]  # Get tier attributes
+        tier = tiers[tier_id]
+        attributes = tier.attributes  # Get tier attributes
         if 'PARTICIPANT' in attributes:
             participant = attributes['PARTICIPANT']
             participants.append(participant)
@@ -454,26 +574,45 @@ def file_name_to_session_id(file_name):
 if __name__ == "__main__":
     # -o Output directory; optional
     usage = "Usage: \n" + sys.argv[0] + \
-            " -o <output directory>" + \
+            " [-o <output directory>]" + \
             " -f <output file>" + \
+            " [--cache=<annotation cache directory, default $CNGT_CACHE_DIR>]" + \
+            " [--prefetch=<number of files to read ahead>]" + \
+            " [-j <number of worker processes>]" + \
+            " [--state=<state file, to only process new and changed EAFs>]" + \
             " <input files/dirs>"
 
     # Set default values
     output_dir = None
     output_file = None
+    cache_dir = None
+    prefetch = 0
+    workers = 1
+    state_file = None
 
     # Register command line arguments
-    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:f:')
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:f:j:', ['cache=', 'prefetch=', 'state='])
     for opt in opt_list:
         if opt[0] == '-o':
             output_dir = opt[1]
         if opt[0] == '-f':
             output_file = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
+        if opt[0] == '--cache':
+            cache_dir = opt[1]
+        if opt[0] == '--prefetch':
+            prefetch = int(opt[1])
+        if opt[0] == '--state':
+            state_file = opt[1]
 
     # Build and run
-    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir,
-                                                        extensions_to_process=["eaf"])
-    eafMetadataCalculator = EafMetadataCalculator(metadata_file=output_file)
+    eafMetadataCalculator = EafMetadataCalculator(metadata_file=output_file, state_file=state_file)
+    file_collection_processor = FileCollectionProcessor(eafMetadataCalculator.get_files_to_process(file_list),
+                                                        output_dir=output_dir,
+                                                        extensions_to_process=["eaf"], prefetch=prefetch,
+                                                        workers=workers)
+    eafMetadataCalculator.set_annotation_cache(open_annotation_cache(cache_dir))
     file_collection_processor.add_file_processor(eafMetadataCalculator)
     file_collection_processor.run()
     eafMetadataCalculator.get_result()
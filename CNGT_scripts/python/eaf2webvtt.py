@@ -9,15 +9,21 @@ and turn it into a webvtt.
 import sys, getopt, os
 from webvtt import WebVTT, Caption
 from filecollectionprocessing.filecollectionprocessor import FileCollectionProcessor
-from filecollectionprocessing.eafprocessor import EafProcessor
+from filecollectionprocessing.eaftierprocessor import EafTierProcessor
+from filecollectionprocessing.annotationcache import open_annotation_cache
+from intervals import starts_within
 
 
-class EafToWebVttTransformer(EafProcessor):
+class EafToWebVttTransformer(EafTierProcessor):
+    writes_output_files = True
+
     def __init__(self, tier_base_name, fallback_tier_base_name, subjects=['S1', 'S2'], hands=['']):
         self.tier_base_name = tier_base_name
         self.fallback_tier_base_name = fallback_tier_base_name
         self.subjects = subjects
         self.hands = hands
+        # Per processed EAF, the VTT files written
+        self.output_files = {}
 
         import itertools
         if hands:
@@ -29,32 +35,67 @@ class EafToWebVttTransformer(EafProcessor):
         print(tier_names)
         self.tier_names = tier_names
 
-    def process_eaf(self, eaf, file_name):
-        print(file_name)
+    def get_configuration(self):
+        return {'tier_base_name': self.tier_base_name, 'fallback_tier_base_name': self.fallback_tier_base_name,
+                'subjects': self.subjects, 'hands': self.hands}
+
+    def get_tier_ids(self):
+        tier_ids = []
+        for tier_base_name in [self.tier_base_name, self.fallback_tier_base_name]:
+            if tier_base_name:
+                tier_ids += [tier_base_name + hand + ' ' + str(subject_id)
+                             for hand in self.hands for subject_id in self.subjects]
+        return tier_ids
+
+    def get_output_files(self, file_name):
+        """
+        Returns the VTT files written for the EAF when it was processed: one per subject with a participant.
+        :param file_name:
+        :return:
+        """
+        return self.output_files.get(file_name, [])
+
+    def get_output_file_name(self, file_name, participant):
         file_basename = os.path.splitext(os.path.basename(file_name))[0]
         if file_basename.startswith('CNGT'):
             file_basename = file_basename[4:]
+        return self.output_dir + os.sep + file_basename + "_" + participant + ".vtt"
 
+    def get_tier(self, tiers, hand, subject_id, verbose=False):
+        """
+        Returns the tier of the hand and subject, or the fallback tier if that tier has no annotations.
+        :param tiers:
+        :param hand:
+        :param subject_id:
+        :param verbose: whether to report the use of the fallback tier
+        :return:
+        """
+        tier_id = self.tier_base_name + hand + ' ' + str(subject_id)
+        tier = tiers[tier_id]
+        if not tier.annotations and self.fallback_tier_base_name:
+            if verbose:
+                print("Using fallback tier {}".format(self.fallback_tier_base_name))
+            tier_id = self.fallback_tier_base_name + hand + ' ' + str(subject_id)
+            tier = tiers[tier_id]
+        return tier
 
+    def process_tiers(self, tiers, file_name):
+        print(file_name)
 
+        self.output_files[file_name] = []
         for subject_id in self.subjects:
 
             # Put the annotations of the left and right hand in one list
             annotations = []
             participant = None
             for hand in self.hands:
-                tier_id = self.tier_base_name + hand + ' ' + str(subject_id)
-                tier = eaf.tiers[tier_id]
-                if not tier[0].values() and self.fallback_tier_base_name:
-                    print("Using fallback tier {}".format(self.fallback_tier_base_name))
-                    tier_id = self.fallback_tier_base_name + hand + ' ' + str(subject_id)
-                    tier = eaf.tiers[tier_id]
-
-                if len(tier) >= 3 and 'PARTICIPANT' in tier[2]:
-                    participant = tier[2]['PARTICIPANT']
+                tier = self.get_tier(tiers, hand, subject_id, verbose=True)
+
+                if 'PARTICIPANT' in tier.attributes:
+                    participant = tier.attributes['PARTICIPANT']
                     annotations.extend(
                         self.transform_annotation_tuples(
-                            eaf, list(tier[0].values()), hand
+                            tier.annotations, hand
                         )
                     )
 
@@ -66,7 +107,9 @@ class EafToWebVttTransformer(EafProcessor):
                 # for annotation in annotations_per_subject[subject_id]:
                 #     print("BT: %d | ET: %d | Value: %s" % annotation)
                 webvtt = self.annotations_to_webvtt(annotations)
-                webvtt.save(self.output_dir + os.sep + file_basename + "_" + participant + ".vtt")
+                output_file = self.get_output_file_name(file_name, participant)
+                webvtt.save(output_file)
+                self.output_files[file_name].append(output_file)
 
 
     def annotations_to_webvtt(self, annotations):
@@ -91,7 +134,7 @@ class EafToWebVttTransformer(EafProcessor):
                     index = index_next
                     next_annotation = annotations[index_next]
                     # print("Next :: BT: %d | ET: %d | Value: %s" % next_annotation[:3])
-                    overlap = self.check_overlap(focus_annotation, next_annotation)
+                    overlap = starts_within(focus_annotation, next_annotation)
                     if overlap:
                         # print("#%s#%s#" % (focus_annotation[2], next_annotation[2]))
                         if not(focus_annotation[2] == next_annotation[2]):
@@ -122,29 +165,21 @@ class EafToWebVttTransformer(EafProcessor):
         # print(webvtt_time)
         return webvtt_time
 
-    def check_overlap(self, annotation_1, annotation_2):
-        # Begin time 1 is between begin time 2 and end time 2
-        if annotation_2[0] <= annotation_1[0] < annotation_2[1]:
-            return True
-        elif annotation_1[0] <= annotation_2[0] < annotation_1[1]:
-            return True
-        return False
-
-    def transform_annotation_tuples(self, eaf, annotations_original, hand):
+    def transform_annotation_tuples(self, annotations_original, hand):
         """
-        Transforms the tuples with format (begin_ts, end_ts, value, svg_ref)
-        to (begin_time, end_time, value)
-        :param eaf: 
+        Transforms the annotations read by the EAF reader
+        to (begin_time, end_time, value, hand)
         :param annotations_original: 
+        :param hand: 
         :return: 
         """
         annotations_new = []
         for annotation in annotations_original:
-            if annotation[2]:
+            if annotation.value:
                 annotations_new.append((
-                    eaf.timeslots[annotation[0]],
-                    eaf.timeslots[annotation[1]],
-                    annotation[2],
+                    annotation.begin,
+                    annotation.end,
+                    annotation.value,
                     hand
                 ))
         return annotations_new
@@ -155,19 +190,39 @@ if __name__ == "__main__":
             " -o <output directory>" \
             " -t <tier base name>" \
             " -f <fallback tier base name>" \
-            " -h <hand [LR]>"
+            " -h <hand [LR]>" \
+            " -j <number of worker processes>" \
+            " -i (incremental: skip files unchanged since the last run)" \
+            " --timing=<timing report file (.json or .csv)>" \
+            " --prefetch=<number of files to read ahead>" \
+            " --cache=<annotation cache directory, default $CNGT_CACHE_DIR>"
 
     # Set default values
     output_dir = None
+    workers = 1
+    incremental = False
+    timing_report_file = None
+    prefetch = 0
+    cache_dir = None
     tier_base_name = None
     fallback_tier_base_name = None
 
     # Register command line arguments
-    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:t:f:h:')
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:t:f:h:j:i', ['timing=', 'cache=', 'prefetch='])
     hands = []
     for opt in opt_list:
         if opt[0] == '-o':
             output_dir = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
+        if opt[0] == '-i':
+            incremental = True
+        if opt[0] == '--timing':
+            timing_report_file = opt[1]
+        if opt[0] == '--prefetch':
+            prefetch = int(opt[1])
+        if opt[0] == '--cache':
+            cache_dir = opt[1]
         if opt[0] == '-t':
             tier_base_name = opt[1]
         if opt[0] == '-f':
@@ -193,9 +248,20 @@ if __name__ == "__main__":
     print("Files: " + ", ".join(file_list), file=sys.stderr)
     if output_dir is not None:
         print("Output directory: " + output_dir, file=sys.stderr)
+    print("Workers: " + str(workers), file=sys.stderr)
+    print("Incremental: " + str(incremental), file=sys.stderr)
+    if timing_report_file is not None:
+        print("Timing report: " + timing_report_file, file=sys.stderr)
+    if prefetch > 0:
+        print("Prefetch: " + str(prefetch), file=sys.stderr)
+    annotation_cache = open_annotation_cache(cache_dir)
+    if annotation_cache is not None:
+        print("Annotation cache: " + annotation_cache.cache_dir, file=sys.stderr)
 
     # Build and run
-    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"])
+    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"],
+                                                        workers=workers, incremental=incremental,
+                                                        timing_report_file=timing_report_file, prefetch=prefetch)
     args = {}
     if tier_base_name:
         args['tier_base_name'] = tier_base_name
@@ -204,5 +270,6 @@ if __name__ == "__main__":
     if hands:
         args['hands'] = hands
     eafToWebVttTransformer = EafToWebVttTransformer(**args)
+    eafToWebVttTransformer.set_annotation_cache(annotation_cache)
     file_collection_processor.add_file_processor(eafToWebVttTransformer)
     file_collection_processor.run()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+
+"""
+Script to apply several edits to CNGT EAFs in one pass: each EAF is read once, passed through the selected edits of
+eafRemoveUnusedLingtypes.py, eafSearchReplace.py and eafGlossChanger.py (in that order) and written once.
+"""
+
+import sys
+import getopt
+from CNGT_scripts.python.filecollectionprocessing.filecollectionprocessor import FileCollectionProcessor
+from CNGT_scripts.python.eafRemoveUnusedLingtypes import UnusedLingtypeRemover
+from CNGT_scripts.python.eafSearchReplace import SearchReplace
+from CNGT_scripts.python.eafGlossChanger import GlossChanger
+
+
+if __name__ == "__main__":
+    # -o Output directory; optional
+    usage = "Usage: \n" + sys.argv[0] + \
+            " -o <output directory>" + \
+            " [--remove-unused-lingtypes]" + \
+            " [--search-replace=<excel with search and replace values per linguistic type>]" + \
+            " [--gloss-changes=<excel with gloss changes>]" + \
+            " -r <first data row of the excels>" + \
+            " -j <number of worker processes>" + \
+            " -i (incremental: skip files unchanged since the last run)" + \
+            " --timing=<timing report file (.json or .csv)>" + \
+            " --prefetch=<number of files to read ahead>"
+
+    # Set default values
+    output_dir = None
+    workers = 1
+    incremental = False
+    timing_report_file = None
+    prefetch = 0
+    remove_unused_lingtypes = False
+    search_replace_excel = None
+    gloss_changes_excel = None
+    first_data_row = 1
+
+    # Register command line arguments
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:r:j:i', ['remove-unused-lingtypes', 'search-replace=',
+                                                                 'gloss-changes=', 'timing=', 'prefetch='])
+    for opt in opt_list:
+        if opt[0] == '-o':
+            output_dir = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
+        if opt[0] == '-i':
+            incremental = True
+        if opt[0] == '--timing':
+            timing_report_file = opt[1]
+        if opt[0] == '--prefetch':
+            prefetch = int(opt[1])
+        if opt[0] == '--remove-unused-lingtypes':
+            remove_unused_lingtypes = True
+        if opt[0] == '--search-replace':
+            search_replace_excel = opt[1]
+        if opt[0] == '--gloss-changes':
+            gloss_changes_excel = opt[1]
+        if opt[0] == '-r':
+            first_data_row = int(opt[1])
+
+    # Check for errors and report
+    errors = []
+    if file_list is None or len(file_list) == 0:
+        errors.append("No files or directories given.")
+    if not remove_unused_lingtypes and search_replace_excel is None and gloss_changes_excel is None:
+        errors.append("No edits given.")
+
+    if len(errors) != 0:
+        print("Errors:")
+        print("\n".join(errors))
+        print(usage)
+        exit(1)
+
+    # Report registered options
+    print("OPTIONS", file=sys.stderr)
+    print("Files: " + ", ".join(file_list), file=sys.stderr)
+    if output_dir is not None:
+        print("Output directory: " + output_dir, file=sys.stderr)
+    print("Workers: " + str(workers), file=sys.stderr)
+    print("Incremental: " + str(incremental), file=sys.stderr)
+    if timing_report_file is not None:
+        print("Timing report: " + timing_report_file, file=sys.stderr)
+    if prefetch > 0:
+        print("Prefetch: " + str(prefetch), file=sys.stderr)
+    print("Remove unused linguistic types: " + str(remove_unused_lingtypes), file=sys.stderr)
+    if search_replace_excel is not None:
+        print("Excel with search and replace values: " + search_replace_excel, file=sys.stderr)
+    if gloss_changes_excel is not None:
+        print("Excel with gloss changes: " + gloss_changes_excel, file=sys.stderr)
+
+    # Build and run; the edits are chained, so each EAF is read and written once
+    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"],
+                                                        workers=workers, chain_processors=True,
+                                                        incremental=incremental,
+                                                        timing_report_file=timing_report_file, prefetch=prefetch)
+    if remove_unused_lingtypes:
+        file_collection_processor.add_file_processor(UnusedLingtypeRemover())
+    if search_replace_excel is not None:
+        file_collection_processor.add_file_processor(SearchReplace(search_replace_excel, first_row=first_data_row))
+    if gloss_changes_excel is not None:
+        file_collection_processor.add_file_processor(GlossChanger(gloss_changes_excel, first_row=first_data_row))
+    file_collection_processor.run()
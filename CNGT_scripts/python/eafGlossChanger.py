@@ -9,6 +9,7 @@ import getopt
 from openpyxl import load_workbook
 from CNGT_scripts.python.filecollectionprocessing.filecollectionprocessor import FileCollectionProcessor
 from CNGT_scripts.python.filecollectionprocessing.eafprocessor import EafProcessor
+from CNGT_scripts.python.filecollectionprocessing.manifest import data_hash
 
 # Settings
 
@@ -70,6 +71,9 @@ class GlossChanger(EafProcessor):
             except Exception:
                 print("Unable to process row " + str(row_index) + ". Error message: " + sys.exc_info())
 
+    def get_configuration(self):
+        return {'changes': data_hash(self.changes), 'gloss_ids': data_hash(self.gloss_ids)}
+
     def process_eaf(self, eaf, file_name):
         print("EAF file: " + file_name)
         for subject_id in [1, 2]:
@@ -122,17 +126,33 @@ if __name__ == "__main__":
     usage = "Usage: \n" + sys.argv[0] + \
             " -o <output directory>" + \
             " -e <excel with changes>" + \
-            " -r <first data row>"
+            " -r <first data row>" + \
+            " -j <number of worker processes>" + \
+            " -i (incremental: skip files unchanged since the last run)" + \
+            " --timing=<timing report file (.json or .csv)>" + \
+            " --prefetch=<number of files to read ahead>"
 
     # Set default values
     output_dir = None
+    workers = 1
+    incremental = False
+    timing_report_file = None
+    prefetch = 0
     excel_with_changes = None
 
     # Register command line arguments
-    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:e:r:')
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:e:r:j:i', ['timing=', 'prefetch='])
     for opt in opt_list:
         if opt[0] == '-o':
             output_dir = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
+        if opt[0] == '-i':
+            incremental = True
+        if opt[0] == '--timing':
+            timing_report_file = opt[1]
+        if opt[0] == '--prefetch':
+            prefetch = int(opt[1])
         if opt[0] == '-e':
             excel_with_changes = opt[1]
         if opt[0] == '-r':
@@ -158,10 +178,18 @@ if __name__ == "__main__":
     print("Files: " + ", ".join(file_list), file=sys.stderr)
     if output_dir is not None:
         print("Output directory: " + output_dir, file=sys.stderr)
+    print("Workers: " + str(workers), file=sys.stderr)
+    print("Incremental: " + str(incremental), file=sys.stderr)
+    if timing_report_file is not None:
+        print("Timing report: " + timing_report_file, file=sys.stderr)
+    if prefetch > 0:
+        print("Prefetch: " + str(prefetch), file=sys.stderr)
     print("Excel with changes: " + excel_with_changes, file=sys.stderr)
 
     # Build and run
-    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"])
+    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"],
+                                                        workers=workers, incremental=incremental,
+                                                        timing_report_file=timing_report_file, prefetch=prefetch)
     glossChanger = GlossChanger(excel_with_changes, first_row=first_data_row)
     file_collection_processor.add_file_processor(glossChanger)
     file_collection_processor.run()
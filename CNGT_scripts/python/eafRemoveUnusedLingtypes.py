@@ -15,6 +15,9 @@ class UnusedLingtypeRemover(EafProcessor):
 
     """
 
+    def get_configuration(self):
+        return {}
+
     def process_eaf(self, eaf, file_name):
         print("EAF file: " + file_name)
         to_remove = []
@@ -29,18 +32,34 @@ class UnusedLingtypeRemover(EafProcessor):
 if __name__ == "__main__":
     # -o Output directory; optional
     usage = "Usage: \n" + sys.argv[0] + \
-            " -o <output directory>"
+            " -o <output directory>" + \
+            " -j <number of worker processes>" + \
+            " -i (incremental: skip files unchanged since the last run)" + \
+            " --timing=<timing report file (.json or .csv)>" + \
+            " --prefetch=<number of files to read ahead>"
 
     # Set default values
     output_dir = None
+    workers = 1
+    incremental = False
+    timing_report_file = None
+    prefetch = 0
     excel_with_changes = None
     first_data_row = None
 
     # Register command line arguments
-    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:')
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'o:j:i', ['timing=', 'prefetch='])
     for opt in opt_list:
         if opt[0] == '-o':
             output_dir = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
+        if opt[0] == '-i':
+            incremental = True
+        if opt[0] == '--timing':
+            timing_report_file = opt[1]
+        if opt[0] == '--prefetch':
+            prefetch = int(opt[1])
 
     # Check for errors and report
     errors = []
@@ -58,9 +77,17 @@ if __name__ == "__main__":
     print("Files: " + ", ".join(file_list), file=sys.stderr)
     if output_dir is not None:
         print("Output directory: " + output_dir, file=sys.stderr)
+    print("Workers: " + str(workers), file=sys.stderr)
+    print("Incremental: " + str(incremental), file=sys.stderr)
+    if timing_report_file is not None:
+        print("Timing report: " + timing_report_file, file=sys.stderr)
+    if prefetch > 0:
+        print("Prefetch: " + str(prefetch), file=sys.stderr)
 
     # Build and run
-    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"])
+    file_collection_processor = FileCollectionProcessor(file_list, output_dir=output_dir, extensions_to_process=["eaf"],
+                                                        workers=workers, incremental=incremental,
+                                                        timing_report_file=timing_report_file, prefetch=prefetch)
     remover = UnusedLingtypeRemover()
     file_collection_processor.add_file_processor(remover)
     file_collection_processor.run()
@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+"""
+On-disk cache of the tiers read from EAFs by the streaming EAF reader.
+
+Per EAF and selection of tiers, the resolved annotations are stored in a NumPy .npz file: arrays with the begin and
+end times, indices into a table of the distinct annotation values and CVE references, and the annotation ids. An entry
+is valid as long as the size and modification time of the EAF are the same, or, if only the modification time
+changed, its content hash. The least recently used entries are removed when the cache grows beyond its maximum size.
+"""
+
+import hashlib
+import io
+import json
+import os
+import zipfile
+
+import numpy
+
+from CNGT_scripts.python.filecollectionprocessing.eafreader import read_tiers, read_media_urls, Tier, Annotation
+from CNGT_scripts.python.filecollectionprocessing.manifest import file_hash
+
+CACHE_DIR_ENVIRONMENT_VARIABLE = "CNGT_CACHE_DIR"
+CACHE_SIZE_ENVIRONMENT_VARIABLE = "CNGT_CACHE_SIZE"  # in megabytes
+DEFAULT_CACHE_SIZE = 1024  # in megabytes
+
+# Increase when the format of the cache entries changes
+CACHE_VERSION = 1
+
+# Stored instead of a time for annotations with an unaligned time slot
+MISSING_TIME = numpy.iinfo(numpy.int64).min
+
+
+def open_annotation_cache(cache_dir=None, max_size=None):
+    """
+    Opens the cache in the given directory or, if none is given, in the directory in the environment variable
+    CNGT_CACHE_DIR.
+
+    :param cache_dir:
+    :param max_size: maximum size in megabytes; by default taken from CNGT_CACHE_SIZE, or 1024
+    :return: an AnnotationCache, or None if no cache directory is configured
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if not cache_dir:
+        return None
+    if max_size is None:
+        max_size = int(os.environ.get(CACHE_SIZE_ENVIRONMENT_VARIABLE, DEFAULT_CACHE_SIZE))
+    return AnnotationCache(cache_dir, max_size * 1024 * 1024)
+
+
+def load_tiers(file_name, tier_ids=None, linguistic_types=None, cache=None, data=None):
+    """
+    Reads the wanted tiers of an EAF (see eafreader.read_tiers), from the cache if one is given. If the content of
+    the EAF has been read already, it is parsed from data instead of from the file.
+    """
+    if cache is None:
+        return read_tiers(io.BytesIO(data) if data is not None else file_name,
+                          tier_ids=tier_ids, linguistic_types=linguistic_types)
+    return cache.load_tiers(file_name, tier_ids=tier_ids, linguistic_types=linguistic_types, data=data)
+
+
+def load_media_urls(file_name, cache=None):
+    """
+    Reads the media URLs of an EAF (see eafreader.read_media_urls), from the cache if one is given.
+    """
+    if cache is None:
+        return read_media_urls(file_name)
+    return cache.load_media_urls(file_name)
+
+
+class AnnotationCache:
+    def __init__(self, cache_dir, max_size):
+        """
+        :param cache_dir: the directory of the cache, created if it does not exist
+        :param max_size: maximum size in bytes
+        """
+        self.cache_dir = cache_dir.rstrip(os.sep)
+        self.max_size = max_size
+        # The size of the entries, counted once and then kept up to date with the entries written by this process
+        self.total_size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def load_tiers(self, file_name, tier_ids=None, linguistic_types=None, data=None):
+        selection = {
+            'tier_ids': sorted(tier_ids) if tier_ids is not None else None,
+            'linguistic_types': sorted(set(lingtype.lower() for lingtype in linguistic_types))
+            if linguistic_types is not None else None
+        }
+        source = io.BytesIO(data) if data is not None else file_name
+        return self.load(file_name, 'tiers', selection,
+                         lambda: read_tiers(source, tier_ids=tier_ids, linguistic_types=linguistic_types),
+                         encode_tiers, decode_tiers, data)
+
+    def load_media_urls(self, file_name):
+        return self.load(file_name, 'media_urls', None, lambda: read_media_urls(file_name),
+                         lambda media_urls: (media_urls, {}), lambda data, arrays: data)
+
+    def load(self, file_name, kind, selection, read, encode, decode, data=None):
+        """
+        Returns what is read from the EAF by the read function, from the cache entry if it is still valid.
+        Otherwise the EAF is read and the entry is (re)written.
+
+        :param file_name:
+        :param kind: what is read from the EAF
+        :param selection: JSON serializable parameters of the read function
+        :param read: function reading from the EAF
+        :param encode: function turning what is read into JSON serializable data and a dictionary of NumPy arrays
+        :param decode: inverse of encode
+        :param data: the content of the EAF if it has been read already, otherwise None
+        :return:
+        """
+        def content_hash():
+            return hashlib.sha1(data).hexdigest() if data is not None else file_hash(file_name)
+
+        entry_file = self.get_entry_file(file_name, kind, selection)
+        stat = os.stat(file_name)
+
+        entry = read_entry(entry_file)
+        if entry is not None:
+            header, arrays = entry
+            if header['version'] == CACHE_VERSION and header['size'] == stat.st_size:
+                if header['mtime'] == stat.st_mtime_ns:
+                    # Mark the entry as recently used
+                    try:
+                        os.utime(entry_file)
+                    except FileNotFoundError:
+                        pass
+                    return decode(header['data'], arrays)
+                if header['hash'] == content_hash():
+                    header['mtime'] = stat.st_mtime_ns
+                    self.write_entry(entry_file, header, arrays)
+                    return decode(header['data'], arrays)
+
+        document = read()
+        encoded, arrays = encode(document)
+        header = {
+            'version': CACHE_VERSION,
+            'file': os.path.abspath(file_name),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': content_hash(),
+            'data': encoded
+        }
+        self.write_entry(entry_file, header, arrays)
+        if self.get_total_size() > self.max_size:
+            self.evict()
+        return document
+
+    def get_entry_file(self, file_name, kind, selection):
+        key = json.dumps([os.path.abspath(file_name), kind, selection], sort_keys=True)
+        return self.cache_dir + os.sep + hashlib.sha1(key.encode("utf-8")).hexdigest() + ".npz"
+
+    def write_entry(self, entry_file, header, arrays):
+        """
+        Writes the entry to a temporary file first, so concurrent readers never see a partial entry.
+        """
+        try:
+            previous_size = os.stat(entry_file).st_size
+        except FileNotFoundError:
+            previous_size = 0
+        temporary_file = "%s.%d.tmp" % (entry_file, os.getpid())
+        with open(temporary_file, 'wb') as f:
+            numpy.savez(f, header=numpy.array(json.dumps(header)), **arrays)
+            size = f.tell()
+        os.replace(temporary_file, entry_file)
+        if self.total_size is not None:
+            self.total_size += size - previous_size
+
+    def get_entries(self):
+        """
+        :return: list of tuples (modification time, size, path) of the entries, least recently used first
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as directory_entries:
+            for directory_entry in directory_entries:
+                if directory_entry.name.endswith(".npz"):
+                    try:
+                        stat = directory_entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, directory_entry.path))
+        entries.sort()
+        return entries
+
+    def get_total_size(self):
+        """
+        Returns the size of the entries. The directory is only listed the first time; entries written by other
+        processes since are not counted until the next eviction.
+        :return:
+        """
+        if self.total_size is None:
+            self.total_size = sum(size for mtime, size, path in self.get_entries())
+        return self.total_size
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache is not larger than its maximum size.
+        :return:
+        """
+        entries = self.get_entries()
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+        self.total_size = total_size
+
+
+def read_entry(entry_file):
+    """
+    :param entry_file:
+    :return: a tuple: header, dictionary of arrays; or None if there is no (readable) entry
+    """
+    try:
+        with numpy.load(entry_file) as npz:
+            header = json.loads(str(npz['header']))
+            arrays = {name: npz[name] for name in npz.files if name != 'header'}
+        return header, arrays
+    except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+        return None
+
+
+def encode_tiers(tiers):
+    """
+    Turns the tiers into JSON serializable data (tier ids, attributes and number of annotations) and arrays with the
+    annotations of all tiers one after the other. Values and CVE references are stored once in a string table.
+    :param tiers: dictionary (tier id: eafreader.Tier)
+    :return:
+    """
+    strings = {}
+
+    def intern(string):
+        if string is None:
+            return -1
+        return strings.setdefault(string, len(strings))
+
+    annotations = [annotation for tier in tiers.values() for annotation in tier.annotations]
+    data = [{'tier_id': tier.tier_id, 'attributes': tier.attributes, 'count': len(tier.annotations)}
+            for tier in tiers.values()]
+    arrays = {
+        'begin': numpy.array([MISSING_TIME if annotation.begin is None else annotation.begin
+                              for annotation in annotations], dtype=numpy.int64),
+        'end': numpy.array([MISSING_TIME if annotation.end is None else annotation.end
+                            for annotation in annotations], dtype=numpy.int64),
+        'value': numpy.array([intern(annotation.value) for annotation in annotations], dtype=numpy.int32),
+        'cve_ref': numpy.array([intern(annotation.cve_ref) for annotation in annotations], dtype=numpy.int32),
+        'annotation_id': numpy.array([annotation.annotation_id or '' for annotation in annotations], dtype=str),
+    }
+    arrays['strings'] = numpy.array(list(strings), dtype=str)
+    return data, arrays
+
+
+def decode_tiers(data, arrays):
+    strings = arrays['strings'].tolist()
+    begins = [None if time == MISSING_TIME else time for time in arrays['begin'].tolist()]
+    ends = [None if time == MISSING_TIME else time for time in arrays['end'].tolist()]
+    values = [strings[index] for index in arrays['value'].tolist()]
+    cve_refs = [strings[index] if index >= 0 else None for index in arrays['cve_ref'].tolist()]
+    annotation_ids = arrays['annotation_id'].tolist()
+
+    tiers = {}
+    start = 0
+    for tier_data in data:
+        end = start + tier_data['count']
+        tiers[tier_data['tier_id']] = Tier(tier_data['tier_id'], tier_data['attributes'], [
+            Annotation(begin, end_time, value, annotation_id, cve_ref)
+            for begin, end_time, value, annotation_id, cve_ref
+            in zip(begins[start:end], ends[start:end], values[start:end], annotation_ids[start:end],
+                   cve_refs[start:end])
+        ])
+        start = end
+    return tiers
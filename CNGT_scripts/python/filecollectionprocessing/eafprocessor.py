@@ -11,25 +11,45 @@ import os
 from pympi.Elan import Eaf
 from urllib.parse import urlparse
 from CNGT_scripts.python.filecollectionprocessing.fileprocessor import FileProcessor
+from CNGT_scripts.python.filecollectionprocessing.eafwriter import write_eaf
+from CNGT_scripts.python.filecollectionprocessing.timingreport import NO_TIMER
 
 
 class EafProcessor(FileProcessor):
     _extensions = ["eaf"]
+    writes_output_files = True
 
-    def process_file(self, file_name):
+    def process_file(self, file_name, timer=NO_TIMER, data=None):
         """
         Processes one file.
 
         :param file_name:
+        :param timer:
+        :param data:
         :return:
         """
         try:
-            eaf = Eaf(file_name)
-            self.process_eaf(eaf, file_name)
-            eaf.to_file(self.output_dir + os.sep + os.path.basename(urlparse(file_name).path), pretty=True)
+            return FileProcessor.process_file(self, file_name, timer, data)
         except IOError:
             print("The EAF %s could not be processed." % file_name, file=sys.stderr)
             print(sys.exc_info()[0])
+            return False
+
+    def read_document(self, file_name, data=None):
+        # pympi can only parse from a path; a prefetched file is read again, but from the page cache
+        return Eaf(file_name)
+
+    def process_document(self, eaf, file_name):
+        self.process_eaf(eaf, file_name)
+
+    def write_document(self, eaf, file_name):
+        return write_eaf(eaf, self.get_output_file_name(file_name), pretty=True)
+
+    def get_output_file_name(self, file_name):
+        return self.output_dir + os.sep + os.path.basename(urlparse(file_name).path)
+
+    def get_output_files(self, file_name):
+        return [self.get_output_file_name(file_name)]
 
     def process_eaf(self, eaf, file_name):
         pass
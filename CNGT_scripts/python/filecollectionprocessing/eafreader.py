@@ -0,0 +1,107 @@
+#!/usr/bin/python
+
+"""
+Lightweight, streaming reader for the annotations of selected tiers of an EAF.
+
+Instead of building the complete object model of an EAF (as pympi does) or a complete lxml tree, the EAF is parsed
+with lxml.etree.iterparse. Only the annotations of the wanted tiers are kept, with their begin and end times already
+resolved to integers (milliseconds), and every element is released as soon as it has been seen.
+"""
+
+from collections import namedtuple
+from lxml import etree
+
+# An alignable annotation; begin and end are None for unaligned time slots
+Annotation = namedtuple('Annotation', ['begin', 'end', 'value', 'annotation_id', 'cve_ref'])
+
+# A tier with its attributes (TIER_ID, PARTICIPANT, LINGUISTIC_TYPE_REF, PARENT_REF, ...) and its alignable
+# annotations in document order
+Tier = namedtuple('Tier', ['tier_id', 'attributes', 'annotations'])
+
+
+def read_tiers(source, tier_ids=None, linguistic_types=None):
+    """
+    Reads the alignable annotations of the wanted tiers of an EAF. Reference annotations are not read.
+
+    :param source: file name or file object of the EAF
+    :param tier_ids: ids of the tiers to read; None for no selection on tier id
+    :param linguistic_types: linguistic types of the tiers to read, compared case insensitively; None for no
+                             selection on linguistic type
+    :return: dictionary (tier id: Tier) of the wanted tiers, in document order
+    """
+    tier_ids = set(tier_ids) if tier_ids is not None else None
+    linguistic_types = set(lingtype.lower() for lingtype in linguistic_types) \
+        if linguistic_types is not None else None
+
+    time_slots = {}
+    tiers = {}
+    current_tier = None
+    for event, element in etree.iterparse(source, events=('start', 'end'),
+                                          tag=('TIME_SLOT', 'TIER', 'ANNOTATION', 'ALIGNABLE_ANNOTATION')):
+        tag = element.tag
+        if event == 'start':
+            if tag == 'TIER':
+                attributes = dict(element.attrib)
+                if is_wanted_tier(attributes, tier_ids, linguistic_types):
+                    current_tier = Tier(attributes['TIER_ID'], attributes, [])
+                    tiers[current_tier.tier_id] = current_tier
+                else:
+                    current_tier = None
+            continue
+
+        if tag == 'ALIGNABLE_ANNOTATION':
+            if current_tier is not None:
+                value_element = element.find('ANNOTATION_VALUE')
+                value = value_element.text if value_element is not None else None
+                current_tier.annotations.append(Annotation(
+                    time_slots.get(element.get('TIME_SLOT_REF1')),
+                    time_slots.get(element.get('TIME_SLOT_REF2')),
+                    value if value else '',
+                    element.get('ANNOTATION_ID'),
+                    element.get('CVE_REF')
+                ))
+            continue
+        if tag == 'TIME_SLOT':
+            time_value = element.get('TIME_VALUE')
+            time_slots[element.get('TIME_SLOT_ID')] = int(time_value) if time_value is not None else None
+        elif tag == 'TIER':
+            current_tier = None
+        release(element)
+
+    return tiers
+
+
+def read_media_urls(source):
+    """
+    Reads the media URLs from the header of an EAF, without parsing the rest of the document.
+
+    :param source: file name or file object of the EAF
+    :return: list of media URLs
+    """
+    media_urls = []
+    for event, element in etree.iterparse(source, events=('end',), tag=('MEDIA_DESCRIPTOR', 'HEADER')):
+        if element.tag == 'HEADER':
+            break
+        media_urls.append(element.get('MEDIA_URL'))
+    return media_urls
+
+
+def is_wanted_tier(attributes, tier_ids, linguistic_types):
+    if tier_ids is not None and attributes.get('TIER_ID') not in tier_ids:
+        return False
+    if linguistic_types is not None and attributes.get('LINGUISTIC_TYPE_REF', '').lower() not in linguistic_types:
+        return False
+    return True
+
+
+def release(element):
+    """
+    Frees the memory of an element that has been handled, and of its preceding siblings.
+    :param element:
+    :return:
+    """
+    element.clear()
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+
+"""
+Abstract class that can be used for read-only analyses of selected tiers of EAF files
+"""
+
+from __future__ import print_function
+
+import sys
+from lxml import etree
+from CNGT_scripts.python.filecollectionprocessing.fileprocessor import FileProcessor
+from CNGT_scripts.python.filecollectionprocessing.annotationcache import load_tiers
+from CNGT_scripts.python.filecollectionprocessing.timingreport import NO_TIMER
+
+
+class EafTierProcessor(FileProcessor):
+    """
+    Reads only the tiers selected by get_tier_ids and get_linguistic_types with the streaming EAF reader, instead of
+    the complete EAF, and hands them to process_tiers. Nothing is written back. If an annotation cache is set, the
+    tiers are loaded from the cache for EAFs that did not change.
+    """
+    _extensions = ["eaf"]
+    annotation_cache = None
+
+    def process_file(self, file_name, timer=NO_TIMER, data=None):
+        """
+        Processes one file.
+
+        :param file_name:
+        :param timer:
+        :param data:
+        :return:
+        """
+        try:
+            return FileProcessor.process_file(self, file_name, timer, data)
+        except (IOError, etree.XMLSyntaxError):
+            print("The EAF %s could not be processed." % file_name, file=sys.stderr)
+            print(sys.exc_info()[0])
+            return False
+
+    def read_document(self, file_name, data=None):
+        return load_tiers(file_name, tier_ids=self.get_tier_ids(), linguistic_types=self.get_linguistic_types(),
+                          cache=self.annotation_cache, data=data)
+
+    def process_document(self, tiers, file_name):
+        self.process_tiers(tiers, file_name)
+
+    def set_annotation_cache(self, annotation_cache):
+        self.annotation_cache = annotation_cache
+
+    def get_tier_ids(self):
+        """
+        Returns the ids of the tiers to read, or None to not select on tier id.
+        :return:
+        """
+        return None
+
+    def get_linguistic_types(self):
+        """
+        Returns the linguistic types of the tiers to read, or None to not select on linguistic type.
+        :return:
+        """
+        return None
+
+    def process_tiers(self, tiers, file_name):
+        """
+        :param tiers: dictionary (tier id: eafreader.Tier) of the selected tiers
+        :param file_name:
+        :return:
+        """
+        pass
+
+    def get_extensions(self):
+        return self._extensions
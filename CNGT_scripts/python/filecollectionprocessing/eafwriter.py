@@ -0,0 +1,85 @@
+#!/usr/bin/python
+
+"""
+Writing of EAFs that leaves the output untouched if it would not change and never leaves a partially written file.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+from xml.etree import ElementTree
+from pympi.Elan import to_adocument
+
+from CNGT_scripts.python.filecollectionprocessing.manifest import file_hash
+
+
+def eaf_to_bytes(eaf, pretty=True):
+    """
+    Serializes an Eaf object into the same bytes pympi's Eaf.to_file writes.
+    :param eaf:
+    :param pretty:
+    :return:
+    """
+    output = io.BytesIO()
+    ElementTree.ElementTree(to_adocument(eaf, pretty)).write(output, xml_declaration=True, encoding='UTF-8')
+    return output.getvalue()
+
+
+def write_eaf(eaf, file_name, pretty=True):
+    """
+    Writes an Eaf object to a file, unless the file already has exactly that content.
+    :param eaf:
+    :param file_name:
+    :param pretty:
+    :return: whether the file was written
+    """
+    return write_if_changed(file_name, eaf_to_bytes(eaf, pretty))
+
+
+def write_if_changed(file_name, data):
+    """
+    Writes the data to the file if the file does not exist yet or its content hash differs. The data is written to a
+    temporary file in the same directory, which then replaces the file, so the file is either the old or the new
+    version, also if the process crashes or another process writes the same file. Like pympi's Eaf.to_file, a
+    previous version is kept with the extension .bak.
+
+    :param file_name:
+    :param data: bytes
+    :return: whether the file was written
+    """
+    if os.path.isfile(file_name) and os.path.getsize(file_name) == len(data) \
+            and file_hash(file_name) == hashlib.sha1(data).hexdigest():
+        return False
+
+    temporary_file = "%s.%d.tmp" % (file_name, os.getpid())
+    try:
+        with open(temporary_file, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.isfile(file_name):
+            keep_backup(file_name)
+        os.replace(temporary_file, file_name)
+    finally:
+        if os.path.exists(temporary_file):
+            os.remove(temporary_file)
+    return True
+
+
+def keep_backup(file_name):
+    """
+    Makes the current version of the file available as <name>.bak without ever removing the file itself.
+    :param file_name:
+    :return:
+    """
+    backup_file = os.path.splitext(file_name)[0] + ".bak"
+    try:
+        os.remove(backup_file)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(file_name, backup_file)
+    except OSError:
+        # E.g. a file system without hard links
+        shutil.copy2(file_name, backup_file)
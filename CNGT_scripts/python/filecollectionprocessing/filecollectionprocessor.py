@@ -8,14 +8,32 @@ from __future__ import print_function
 
 import sys
 import os
+import io
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout, redirect_stderr
 
 from CNGT_scripts.python.filecollectionprocessing.fileprocessor import FileProcessor
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
+from CNGT_scripts.python.filecollectionprocessing.manifest import Manifest, MANIFEST_FILE_NAME
+from CNGT_scripts.python.filecollectionprocessing.timingreport import TimingReport, PhaseTimer, NO_TIMER
+from CNGT_scripts.python.filecollectionprocessing.prefetcher import Prefetcher, DEFAULT_MEMORY_BUDGET
 
 
 class FileCollectionProcessor:
-    def __init__(self, file_names, output_dir=None, extensions_to_process=[], **kwargs):
+    def __init__(self, file_names, output_dir=None, extensions_to_process=[], workers=1, chain_processors=False,
+                 incremental=False, include=None, exclude=None, sort_files=False, timing_report_file=None,
+                 prefetch=0, prefetch_memory=DEFAULT_MEMORY_BUDGET, **kwargs):
         self.settings = kwargs
+        self.workers = workers
+        self.chain_processors = chain_processors
 
+        # In a serial run, the next files can be read ahead while a file is processed
+        self.prefetch = prefetch
+        self.prefetch_memory = prefetch_memory
+
+        # Read-only file processors do not need an output directory
+        self.output_dir = None
         if output_dir is not None:
             self.output_dir = output_dir.rstrip(os.sep)
             if not os.path.isdir(self.output_dir):
@@ -27,33 +45,54 @@ class FileCollectionProcessor:
                     os.mkdir(self.output_dir, 0o750)
 
         self.extensions_to_process = extensions_to_process
+        self.include = include
+        self.exclude = exclude
+        self.sort_files = sort_files
 
-        # Find all files recursively and add to a list
-        self.all_files = []
+        # The files and directories to process; directories are walked through while processing
+        self.file_names = []
         for file_name in file_names:
             self.add_file(file_name)
+        self.number_of_files = 0
+        # Files for which output was written or found to be identical, and files of which the output changed
+        self.number_of_files_written = 0
+        self.number_of_files_changed = 0
 
         self.file_processors = {}
 
+        # In an incremental run, files that did not change since the last run are skipped
+        self.manifest = None
+        if incremental:
+            if output_dir is None:
+                raise Exception("An incremental run needs an output directory to keep its manifest in")
+            self.manifest = Manifest(self.output_dir + os.sep + MANIFEST_FILE_NAME)
+
+        # Optionally, the time spent per file, file processor and phase is reported
+        self.timing_report_file = timing_report_file
+        self.timing_report = TimingReport() if timing_report_file else None
+
     def add_file(self, file_name):
         """
-        Adds a file name to the list of files to process. Checks if the file
-        is of a type to process (checked using the extension. If the file name 
-        refer to a directory, the directory is walked through recursively.
+        Adds a file name to the list of files to process. Only files of a type
+        to process are processed (checked using the extension). If the file name
+        refers to a directory, the directory is walked through recursively.
 
         :param file_name: the file name to add to the list of files to process
         :return:
         """
-        if os.path.isfile(file_name):
-            extension = os.path.splitext(os.path.basename(file_name))[1][1:]
-            if len(self.check_file_extensions([extension])) > 0:
-                self.all_files.append(file_name)
-        elif os.path.isdir(file_name):
-            files_in_dir = os.listdir(file_name)
-            for f in files_in_dir:
-                self.add_file(file_name + os.sep + f)
-        else:
-            print("No such file of directory: " + file_name, file=sys.stderr)
+        self.file_names.append(file_name)
+
+    def iter_files(self):
+        """
+        Yields the files to process while walking through the directories.
+        :return:
+        """
+        return find_files(self.file_names, extensions=self.extensions_to_process, include=self.include,
+                          exclude=self.exclude, sort=self.sort_files)
+
+    @property
+    def all_files(self):
+        return list(self.iter_files())
 
     def check_file_extensions(self, extensions):
         """
@@ -101,14 +140,297 @@ class FileCollectionProcessor:
         """
         if len(self.file_processors) == 0:
             print("No file processors registered.", file=sys.stderr)
-        elif len(self.all_files) == 0:
-            print("No files to process.", file=sys.stderr)
         else:
-            for f in self.all_files:
-                self.process_file(f)
+            self.number_of_files = 0
+            self.number_of_files_written = 0
+            self.number_of_files_changed = 0
+            try:
+                if self.workers > 1:
+                    self.run_parallel()
+                else:
+                    for f, unchanged, data in self.files_to_read():
+                        self.number_of_files += 1
+                        if unchanged:
+                            self.skip_file(f)
+                        elif self.process_file(f, data):
+                            self.file_processed(f, self.get_output_files(f))
+                        # Content read ahead counts against the memory budget until it is let go of here
+                        data = None
+            finally:
+                if self.manifest is not None:
+                    self.manifest.save()
+                if self.timing_report is not None:
+                    self.timing_report.write(self.timing_report_file)
+            if self.number_of_files == 0:
+                print("No files to process.", file=sys.stderr)
+            elif self.number_of_files_written > 0:
+                print("Output changed for %d of %d files."
+                      % (self.number_of_files_changed, self.number_of_files_written), file=sys.stderr)
+
+    def check_files(self):
+        """
+        Yields the files with whether they are unchanged since the last run (in an incremental run) and are skipped.
+        :return:
+        """
+        for f in self.iter_files():
+            yield f, self.is_unchanged(f)
+
+    def skip_file(self, file_name):
+        print("Unchanged since the last run, skipping: " + file_name, file=sys.stderr)
+
+    def files_to_read(self):
+        """
+        Yields the files with whether they are unchanged since the last run and skipped (see check_files), and their
+        content if it has been read ahead, or None. Skipped files are yielded in order as well, so the messages about
+        them are printed in the order of the list of files.
+        :return:
+        """
+        if self.prefetch > 0:
+            return iter(Prefetcher(self.check_files(), self.prefetch, self.prefetch_memory))
+        return ((f, unchanged, None) for f, unchanged in self.check_files())
+
+    def is_unchanged(self, file_name):
+        """
+        Checks whether the file, the configuration of its file processors and their output are the same as in the
+        last run.
+        :param file_name:
+        :return:
+        """
+        if self.manifest is None:
+            return False
+        configuration = self.get_configuration(file_name)
+        if configuration is None or not self.manifest.is_unchanged(file_name, configuration):
+            return False
+        # The output files recorded when the file was processed must still exist. If processors that write files
+        # wrote none, or the files were not recorded, the output cannot be verified.
+        output_files = self.manifest.get_output_files(file_name)
+        if output_files is None:
+            return False
+        if not output_files and any(file_processor.writes_output_files
+                                    for file_processor in self.get_file_processors(file_name)):
+            return False
+        return all(os.path.exists(output_file) for output_file in output_files)
+
+    def get_configuration(self, file_name):
+        """
+        Returns the configuration of the file processors for the file, or None if one of them has none.
+        :param file_name:
+        :return:
+        """
+        configurations = []
+        for file_processor in self.get_file_processors(file_name):
+            configuration = file_processor.get_configuration()
+            if configuration is None:
+                return None
+            configurations.append({'processor': type(file_processor).__name__, 'configuration': configuration})
+        return {'processors': configurations, 'chained': self.chain_processors}
 
-    def process_file(self, file_name):
+    def get_output_files(self, file_name):
+        """
+        Returns the files written by the file processors when processing the file.
+        :param file_name:
+        :return:
+        """
+        return [output_file for file_processor in self.get_file_processors(file_name)
+                for output_file in file_processor.get_output_files(file_name)]
+
+    def file_processed(self, file_name, output_files):
+        if self.manifest is not None:
+            configuration = self.get_configuration(file_name)
+            if configuration is not None:
+                self.manifest.update(file_name, configuration, output_files)
+
+    def run_parallel(self):
+        """
+        Processes the files in a pool of worker processes. Each worker has its own copy of the file processors.
+        The output of each file and the results gathered by the file processors are handed back to this process
+        in the order of the list of files, so logs and aggregated results are the same as in a serial run.
+
+        :return:
+        """
+        # The files to skip are decided in this process, before the pool is fed, so the messages about skipped files
+        # are printed in the order of the list of files as well
+        checked_files = list(self.check_files())
+        pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self,))
+        try:
+            worker_results = pool.imap(_process_file_in_worker,
+                                       [file_name for file_name, unchanged in checked_files if not unchanged])
+            for file_name, unchanged in checked_files:
+                self.number_of_files += 1
+                if unchanged:
+                    self.skip_file(file_name)
+                    continue
+                worker_result = next(worker_results)
+                sys.stdout.write(worker_result['output'])
+                sys.stderr.write(worker_result['errors'])
+                if worker_result['exception'] is not None:
+                    raise Exception("Processing %s failed in a worker process:\n%s"
+                                    % (file_name, worker_result['exception']))
+                self.merge_file_results(file_name, worker_result['file_results'])
+                self.count_output_changed(worker_result['output_changed'])
+                if self.timing_report is not None:
+                    self.timing_report.extend(worker_result['timings'])
+                if worker_result['processed']:
+                    self.file_processed(file_name, worker_result['output_files'])
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def process_file(self, file_name, data=None):
+        """
+        Processes one file with all file processors registered for its extension.
+        :param file_name:
+        :param data: the content of the file if it has been read ahead, otherwise None
+        :return: whether all file processors processed the file successfully
+        """
+        file_processors = self.get_file_processors(file_name)
+        timers = [PhaseTimer() if self.timing_report is not None else NO_TIMER for _ in file_processors]
+        for file_processor in file_processors:
+            file_processor.output_changed = None
+        if self.chain_processors and self.can_chain(file_processors):
+            processed = self.process_file_chained(file_name, file_processors, timers, data)
+        else:
+            processed = True
+            for file_processor, timer in zip(file_processors, timers):
+                if not file_processor.process_file(file_name, timer, data):
+                    processed = False
+
+        if self.timing_report is not None:
+            input_bytes = os.path.getsize(file_name)
+            for file_processor, timer in zip(file_processors, timers):
+                output_bytes = sum(os.path.getsize(output_file)
+                                   for output_file in file_processor.get_output_files(file_name)
+                                   if os.path.exists(output_file))
+                self.timing_report.add(file_name, type(file_processor).__name__, timer, input_bytes, output_bytes)
+        self.count_output_changed(self.get_output_changed(file_name))
+        return processed
+
+    def get_output_changed(self, file_name):
+        """
+        Returns, per file processor of the file, whether writing its output changed the output (see
+        FileProcessor.output_changed).
+        :param file_name:
+        :return:
+        """
+        return [file_processor.output_changed for file_processor in self.get_file_processors(file_name)]
+
+    def count_output_changed(self, output_changed):
+        written = [changed for changed in output_changed if changed is not None]
+        if written:
+            self.number_of_files_written += 1
+            if any(written):
+                self.number_of_files_changed += 1
+
+    @staticmethod
+    def can_chain(file_processors):
+        """
+        File processors can be chained if they read and write their documents in the same way.
+        :param file_processors:
+        :return:
+        """
+        if len(file_processors) < 2:
+            return False
+        first = type(file_processors[0])
+        return all(type(file_processor).read_document is first.read_document and
+                   type(file_processor).write_document is first.write_document and
+                   file_processor.output_dir == file_processors[0].output_dir
+                   for file_processor in file_processors)
+
+    def process_file_chained(self, file_name, file_processors, timers, data=None):
+        """
+        Reads the file once, passes the same document through the file processors in the order they were added and
+        writes the document once. Parsing is timed for the first and writing for the last file processor.
+        :param file_name:
+        :param file_processors:
+        :param timers:
+        :param data:
+        :return:
+        """
+        try:
+            with timers[0].phase('parse'):
+                document = file_processors[0].read_document(file_name, data)
+            for file_processor, timer in zip(file_processors, timers):
+                with timer.phase('process'):
+                    file_processor.process_document(document, file_name)
+            with timers[-1].phase('write'):
+                file_processors[-1].output_changed = file_processors[-1].write_document(document, file_name)
+            return True
+        except IOError:
+            print("The file %s could not be processed." % file_name, file=sys.stderr)
+            print(sys.exc_info()[0])
+            return False
+
+    def get_file_processors(self, file_name):
+        """
+        Returns the file processors registered for the extension of the file.
+        :param file_name:
+        :return:
+        """
         extension = os.path.splitext(os.path.basename(file_name))[1][1:]
-        if extension in self.file_processors:
-            for file_processor in self.file_processors[extension]:
-                file_processor.process_file(file_name)
+        return self.file_processors.get(extension, [])
+
+    def get_file_results(self, file_name):
+        """
+        Collects the results the file processors gathered for one file.
+        :param file_name:
+        :return: a list with one result per file processor registered for the file
+        """
+        return [file_processor.get_file_result(file_name) for file_processor in self.get_file_processors(file_name)]
+
+    def merge_file_results(self, file_name, file_results):
+        """
+        Hands the results gathered for one file in a worker process to the file processors of this process.
+        :param file_name:
+        :param file_results: the list returned by get_file_results
+        :return:
+        """
+        for file_processor, file_result in zip(self.get_file_processors(file_name), file_results):
+            file_processor.merge_file_result(file_name, file_result)
+
+
+# The copy of the file collection processor used by a worker process
+_worker_collection_processor = None
+
+
+def _init_worker(file_collection_processor):
+    global _worker_collection_processor
+    _worker_collection_processor = file_collection_processor
+
+
+def _process_file_in_worker(file_name):
+    """
+    Processes one file in a worker process, capturing everything that is printed so the parent can replay it.
+    :param file_name:
+    :return: a dictionary with the file name, captured stdout and stderr, whether the file was processed
+             successfully, the file results, whether the output changed, the output files, the timings and the
+             formatted exception or None
+    """
+    output = io.StringIO()
+    errors = io.StringIO()
+    processed = False
+    file_results = None
+    output_changed = []
+    output_files = []
+    timings = []
+    exception = None
+    with redirect_stdout(output), redirect_stderr(errors):
+        try:
+            processed = _worker_collection_processor.process_file(file_name)
+            file_results = _worker_collection_processor.get_file_results(file_name)
+            output_changed = _worker_collection_processor.get_output_changed(file_name)
+            output_files = _worker_collection_processor.get_output_files(file_name)
+            if _worker_collection_processor.timing_report is not None:
+                timings = _worker_collection_processor.timing_report.pop_records()
+        except Exception:
+            exception = traceback.format_exc()
+    return {
+        'file_name': file_name,
+        'output': output.getvalue(),
+        'errors': errors.getvalue(),
+        'processed': processed,
+        'file_results': file_results,
+        'output_changed': output_changed,
+        'output_files': output_files,
+        'timings': timings,
+        'exception': exception
+    }
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+
+"""
+Finding the files to process in a collection of files and directories
+"""
+
+from __future__ import print_function
+
+import fnmatch
+import os
+import sys
+
+
+def find_files(file_names, extensions=None, include=None, exclude=None, sort=False):
+    """
+    Yields the files among the given file names and, recursively, in the given directories. Files are yielded while
+    the directories are walked through, so processing can start before the whole tree has been seen.
+
+    :param file_names: list of files and/or directories
+    :param extensions: extensions (without the dot) of the files to yield; all files if None or empty
+    :param include: glob patterns of which a file must match at least one, matched against the base name and the path
+    :param exclude: glob patterns of files and directories to leave out, matched against the base name and the path
+    :param sort: walk through the directories in sorted order
+    :return: generator of file names
+    """
+    finder = _FileFinder(extensions, include, exclude, sort)
+    for file_name in file_names:
+        for found in finder.find(file_name):
+            yield found
+
+
+class _FileFinder:
+    def __init__(self, extensions, include, exclude, sort):
+        self.extensions = set(extensions) if extensions else None
+        self.include = include or []
+        self.exclude = exclude or []
+        self.sort = sort
+        # (device, inode) of the directories already walked through, to not follow symlink loops
+        self.visited_directories = set()
+
+    def find(self, file_name):
+        if os.path.isfile(file_name):
+            if self.is_wanted_file(file_name, os.path.basename(file_name)):
+                yield file_name
+        elif os.path.isdir(file_name):
+            if not self.is_excluded(file_name, os.path.basename(file_name.rstrip(os.sep))):
+                for found in self.walk(file_name):
+                    yield found
+        else:
+            print("No such file of directory: " + file_name, file=sys.stderr)
+
+    def walk(self, top_directory):
+        """
+        Walks depth first through the directory using a stack of directory listings instead of recursion.
+        :param top_directory:
+        :return: generator of file names
+        """
+        stack = [self.list_directory(top_directory, os.stat(top_directory))]
+        while stack:
+            entry = next(stack[-1], None)
+            if entry is None:
+                stack.pop()
+                continue
+            try:
+                if entry.is_dir():
+                    if not self.is_excluded(entry.path, entry.name):
+                        stack.append(self.list_directory(entry.path, entry.stat()))
+                elif entry.is_file():
+                    if self.is_wanted_file(entry.path, entry.name):
+                        yield entry.path
+            except OSError:
+                # E.g. a broken symlink
+                pass
+
+    def list_directory(self, directory, stat):
+        """
+        Returns an iterator over the entries of a directory, which is empty if the directory has been seen before.
+        :param directory:
+        :param stat: the stat result of the directory, symlinks followed
+        :return:
+        """
+        directory_id = (stat.st_dev, stat.st_ino)
+        if directory_id in self.visited_directories:
+            return iter([])
+        self.visited_directories.add(directory_id)
+
+        try:
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+        except OSError as e:
+            print("Could not read directory %s: %s" % (directory, e.strerror), file=sys.stderr)
+            return iter([])
+        if self.sort:
+            entries.sort(key=lambda entry: entry.name)
+        return iter(entries)
+
+    def is_wanted_file(self, path, name):
+        if self.extensions is not None and os.path.splitext(name)[1][1:] not in self.extensions:
+            return False
+        if self.include and not matches_any(path, name, self.include):
+            return False
+        return not self.is_excluded(path, name)
+
+    def is_excluded(self, path, name):
+        return matches_any(path, name, self.exclude)
+
+
+def matches_any(path, name, patterns):
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns)
@@ -4,15 +4,93 @@
 Abstract class that can be used to process a file in an instance of filecollectionprocessing
 """
 
+from CNGT_scripts.python.filecollectionprocessing.timingreport import NO_TIMER
+
+
 class FileProcessor:
+    # Whether writing the last processed file changed the output; None if nothing was written
+    output_changed = None
+    # Whether processing a file writes output files (see get_output_files)
+    writes_output_files = False
+
     def __init__(self):
         self.output_dir = ""
 
-    def process_file(self):
+    def process_file(self, file_name, timer=NO_TIMER, data=None):
+        """
+        Processes one file: reads it into a document, processes the document and writes it.
+        :param file_name:
+        :param timer: PhaseTimer to record the time of the parse, process and write phases
+        :param data: the content of the file if it has been read already (see Prefetcher), otherwise None
+        :return: whether the file was processed successfully
+        """
+        with timer.phase('parse'):
+            document = self.read_document(file_name, data)
+        with timer.phase('process'):
+            self.process_document(document, file_name)
+        with timer.phase('write'):
+            self.output_changed = self.write_document(document, file_name)
+        return True
+
+    def read_document(self, file_name, data=None):
+        """
+        Reads (parses) a file into the document that is handed to process_document.
+        :param file_name:
+        :param data: the content of the file if it has been read already, otherwise None
+        :return: the document
+        """
+        return None
+
+    def process_document(self, document, file_name):
         pass
 
+    def write_document(self, document, file_name):
+        """
+        Writes the processed document.
+        :param document:
+        :param file_name:
+        :return: whether the output changed, or None if this processor writes nothing
+        """
+        return None
+
     def set_output_dir(self, output_dir):
         self.output_dir = output_dir
 
     def get_extensions(self):
+        pass
+
+    def get_output_files(self, file_name):
+        """
+        Returns the files written when processing a file.
+        :param file_name:
+        :return:
+        """
+        return []
+
+    def get_configuration(self):
+        """
+        Returns a JSON serializable description of everything besides the input file that determines the output of
+        this processor, e.g. a hash of the changes to apply. It is used to decide whether an unchanged file can be
+        skipped in an incremental run. None means the file can never be skipped.
+        :return:
+        """
+        return None
+
+    def get_file_result(self, file_name):
+        """
+        Hands over what was gathered while processing one file. Is called in a worker process after processing
+        the file when running with multiple workers. Processors that aggregate over all files should return their
+        part for this file and forget it, the result is passed to merge_file_result in the main process.
+        :param file_name:
+        :return:
+        """
+        return None
+
+    def merge_file_result(self, file_name, file_result):
+        """
+        Merges the result of get_file_result of a worker process into this processor.
+        :param file_name:
+        :param file_result:
+        :return:
+        """
         pass
\ No newline at end of file
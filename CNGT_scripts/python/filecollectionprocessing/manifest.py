@@ -0,0 +1,106 @@
+#!/usr/bin/python
+
+"""
+Manifest of processed files, used to skip files that did not change since the last run
+"""
+
+import hashlib
+import json
+import os
+
+MANIFEST_FILE_NAME = ".manifest.json"
+
+
+class Manifest:
+    """
+    Keeps, per input file, its size, modification time and content hash together with the configuration of the file
+    processors that processed it and the output files they wrote. A file is unchanged if its content and the
+    configuration are the same as recorded.
+    """
+
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        self.entries = {}
+        if os.path.isfile(self.manifest_file):
+            with open(self.manifest_file, encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def is_unchanged(self, file_name, configuration):
+        """
+        Checks whether the file and the configuration are the same as when the file was last processed. The content
+        hash is only calculated if the size is the same but the modification time is not.
+        :param file_name:
+        :param configuration: JSON serializable description of the file processors
+        :return:
+        """
+        entry = self.entries.get(os.path.abspath(file_name))
+        if entry is None or entry['configuration'] != normalize(configuration):
+            return False
+
+        stat = os.stat(file_name)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime'] == stat.st_mtime_ns:
+            return True
+        if entry['hash'] == file_hash(file_name):
+            entry['mtime'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def get_output_files(self, file_name):
+        """
+        Returns the output files written when the file was last processed, or None if they were not recorded.
+        :param file_name:
+        :return:
+        """
+        entry = self.entries.get(os.path.abspath(file_name))
+        return entry.get('output_files') if entry is not None else None
+
+    def update(self, file_name, configuration, output_files=()):
+        """
+        Records that the file has been processed with the configuration.
+        :param file_name:
+        :param configuration: JSON serializable description of the file processors
+        :param output_files: the files written by the file processors
+        :return:
+        """
+        stat = os.stat(file_name)
+        self.entries[os.path.abspath(file_name)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': file_hash(file_name),
+            'configuration': normalize(configuration),
+            'output_files': list(output_files)
+        }
+
+    def save(self):
+        temporary_file = self.manifest_file + ".tmp"
+        with open(temporary_file, 'w', encoding="utf-8") as f:
+            json.dump(self.entries, f, sort_keys=True, indent=1)
+        os.replace(temporary_file, self.manifest_file)
+
+
+def normalize(configuration):
+    """
+    Makes a configuration comparable with one read from the manifest file (e.g. tuples become lists).
+    :param configuration:
+    :return:
+    """
+    return json.loads(json.dumps(configuration, sort_keys=True))
+
+
+def file_hash(file_name):
+    sha1 = hashlib.sha1()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def data_hash(data):
+    """
+    Hash of JSON serializable data, e.g. the changes read from an Excel file, to use in a configuration.
+    :param data:
+    :return:
+    """
+    return hashlib.sha1(json.dumps(data, sort_keys=True).encode("utf-8")).hexdigest()
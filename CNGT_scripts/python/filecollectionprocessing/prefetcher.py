@@ -0,0 +1,92 @@
+#!/usr/bin/python
+
+"""
+Reading ahead of the files to process, so reading from (slow, network) storage overlaps with processing
+"""
+
+import collections
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+DEFAULT_THREADS = 2
+
+
+class Prefetcher:
+    """
+    Iterates over (file name, skip, content) tuples of the given files. While a file is being processed by the
+    consumer, the next files are read into memory by a small pool of threads. At most read_ahead files are read ahead,
+    and not more than memory_budget bytes, including the file being processed. A file that does not fit in the budget
+    on its own, or that could not be read, is passed with None as content; the consumer then reads it itself. Files to
+    skip are passed on in order, without being read.
+    """
+
+    def __init__(self, files, read_ahead, memory_budget=DEFAULT_MEMORY_BUDGET, threads=DEFAULT_THREADS):
+        """
+        :param files: iterable of tuples (file name, whether the file is skipped); it is consumed ahead of the files
+                      yielded
+        :param read_ahead: maximum number of files read ahead
+        :param memory_budget: maximum number of bytes read ahead
+        :param threads: number of reading threads
+        """
+        self.files = files
+        self.read_ahead = read_ahead
+        self.memory_budget = memory_budget
+        self.threads = threads
+
+    def __iter__(self):
+        files = iter(self.files)
+        pending = collections.deque()  # (file name, skip, size, future or None)
+        bytes_pending = 0
+        files_pending = 0  # the files in pending that are not skipped
+        next_file = None
+        next_skip = False
+        next_size = 0
+
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            while True:
+                while files_pending < self.read_ahead:
+                    if next_file is None:
+                        (next_file, next_skip) = next(files, (None, False))
+                        if next_file is None:
+                            break
+                        next_size = 0 if next_skip else file_size(next_file)
+                    if pending and bytes_pending + next_size > self.memory_budget:
+                        break
+                    if next_skip:
+                        pending.append((next_file, next_skip, 0, None))
+                    elif next_size > self.memory_budget:
+                        pending.append((next_file, next_skip, 0, None))
+                        files_pending += 1
+                    else:
+                        pending.append((next_file, next_skip, next_size, executor.submit(read_file, next_file)))
+                        bytes_pending += next_size
+                        files_pending += 1
+                    next_file = None
+
+                if not pending:
+                    break
+                file_name, skip, size, future = pending.popleft()
+                data = future.result() if future is not None else None
+                yield file_name, skip, data
+                # The content counts against the budget until the consumer has processed it and asks for the next
+                # file
+                future = data = None
+                bytes_pending -= size
+                if not skip:
+                    files_pending -= 1
+
+
+def file_size(file_name):
+    try:
+        return os.path.getsize(file_name)
+    except OSError:
+        return 0
+
+
+def read_file(file_name):
+    try:
+        with open(file_name, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None
@@ -0,0 +1,130 @@
+#!/usr/bin/python
+
+"""
+Timing of the parse, process and write phases of file processors
+"""
+
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import numpy
+
+PHASES = ['parse', 'process', 'write']
+
+
+class PhaseTimer:
+    """
+    Records wall clock and CPU time per phase of processing one file.
+    """
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            timing = self.phases.setdefault(name, {'wall': 0.0, 'cpu': 0.0})
+            timing['wall'] += time.perf_counter() - wall_start
+            timing['cpu'] += time.process_time() - cpu_start
+
+
+class NoTimer:
+    """
+    Stand-in for PhaseTimer when nothing is timed.
+    """
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+
+NO_TIMER = NoTimer()
+
+
+class TimingReport:
+    """
+    Collects the phase timings and input/output sizes per file and file processor and writes them, with totals,
+    percentiles and the slowest files, to a JSON or CSV file.
+    """
+
+    def __init__(self, slowest=20):
+        self.slowest = slowest
+        self.records = []
+
+    def add(self, file_name, processor, timer, input_bytes, output_bytes):
+        record = {'file': file_name, 'processor': processor, 'input_bytes': input_bytes, 'output_bytes': output_bytes}
+        for phase in PHASES:
+            timing = timer.phases.get(phase, {'wall': 0.0, 'cpu': 0.0})
+            record[phase + '_wall'] = timing['wall']
+            record[phase + '_cpu'] = timing['cpu']
+        record['total_wall'] = sum(record[phase + '_wall'] for phase in PHASES)
+        record['total_cpu'] = sum(record[phase + '_cpu'] for phase in PHASES)
+        self.records.append(record)
+
+    def pop_records(self):
+        """
+        Returns the records collected so far and forgets them (used to hand them from a worker process to the main
+        process).
+        :return:
+        """
+        records = self.records
+        self.records = []
+        return records
+
+    def extend(self, records):
+        self.records.extend(records)
+
+    def get_summary(self):
+        columns = [phase + suffix for phase in PHASES + ['total'] for suffix in ['_wall', '_cpu']]
+
+        totals = {column: sum(record[column] for record in self.records) for column in columns}
+        totals['input_bytes'] = sum(record['input_bytes'] for record in self.records)
+        totals['output_bytes'] = sum(record['output_bytes'] for record in self.records)
+        totals['files'] = len(set(record['file'] for record in self.records))
+
+        percentiles = {}
+        if self.records:
+            for column in columns:
+                values = numpy.array([record[column] for record in self.records])
+                percentiles[column] = {
+                    'p50': float(numpy.percentile(values, 50)),
+                    'p90': float(numpy.percentile(values, 90)),
+                    'p99': float(numpy.percentile(values, 99)),
+                    'max': float(values.max())
+                }
+
+        slowest = sorted(self.records, key=lambda record: record['total_wall'], reverse=True)[:self.slowest]
+
+        return {'totals': totals, 'percentiles': percentiles, 'slowest': slowest}
+
+    def write(self, report_file):
+        """
+        Writes the report. A file name ending in .csv gives one row per file and processor, slowest first, followed
+        by rows with the totals and percentiles. Otherwise the report is written as JSON.
+        :param report_file:
+        :return:
+        """
+        summary = self.get_summary()
+        if os.path.splitext(report_file)[1].lower() == '.csv':
+            columns = ['file', 'processor', 'input_bytes', 'output_bytes'] + \
+                      [phase + suffix for phase in PHASES + ['total'] for suffix in ['_wall', '_cpu']]
+            with open(report_file, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+                writer.writeheader()
+                for record in sorted(self.records, key=lambda record: record['total_wall'], reverse=True):
+                    writer.writerow(record)
+                writer.writerow(dict(summary['totals'], file='(total)', processor=''))
+                for percentile in ['p50', 'p90', 'p99', 'max']:
+                    row = {column: values[percentile] for column, values in summary['percentiles'].items()}
+                    writer.writerow(dict(row, file='(' + percentile + ')', processor=''))
+        else:
+            summary['files'] = self.records
+            with open(report_file, 'w') as f:
+                json.dump(summary, f, indent=4)
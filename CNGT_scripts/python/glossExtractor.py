@@ -19,9 +19,11 @@ import json
 import os
 import re
 import sys
-from lxml import etree
-from urlparse import urlparse
+from urllib.parse import urlparse
 from subprocess import call, Popen, PIPE
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
+from CNGT_scripts.python.filecollectionprocessing.annotationcache import load_tiers, load_media_urls, open_annotation_cache
+from CNGT_scripts.python.intervals import has_overlap, is_within
 
 
 __author__ = "Micha Hulsbosch"
@@ -33,7 +35,7 @@ class GlossExtractor:
     Extracts video fragments for glosses from CNGT EAFs.
     """
 
-    def __init__(self, files, video_directory, gloss_directory, min_overlap=0, extra_time=0, ffmpeg_cmd='ffmpeg', video_extension_replacement="", header_time=0):
+    def __init__(self, files, video_directory, gloss_directory, min_overlap=0, extra_time=0, ffmpeg_cmd='ffmpeg', video_extension_replacement="", header_time=0, annotation_cache=None):
         """
         :param files: list of EAF files / directories containing EAF files
         :param min_overlap: minimal overlap for two handed signs
@@ -41,6 +43,7 @@ class GlossExtractor:
         :param video_directory: directory containing the videos
         :param gloss_directory: directory for the video fragments of each gloss
         :param ffmpeg_cmd: the command to use instead of 'ffmpeg', e.g. on Ubuntu it is 'avconv'
+        :param annotation_cache: AnnotationCache to load the glosses from, or None to always read the EAFs
         :return:
         """
         self.extra_time = extra_time/1000.0  # ms to s
@@ -58,6 +61,7 @@ class GlossExtractor:
 
         self.video_extension_replacement = video_extension_replacement
         self.header_time = header_time
+        self.annotation_cache = annotation_cache
 
         self.dry_run = False
 
@@ -74,15 +78,7 @@ class GlossExtractor:
         :param fname: the file name to add to the list of files to process
         :return:
         """
-        if os.path.isfile(fname):
-            if fname.endswith(".eaf"):
-                self.all_files.append(fname)
-        elif os.path.isdir(fname):
-            files_in_dir = os.listdir(fname)
-            for f in files_in_dir:
-                self.add_file(fname + os.sep + f)
-        else:
-            print("No such file of directory: " + fname, file=sys.stderr)
+        self.all_files.extend(find_files([fname], extensions=["eaf"]))
 
     def run(self, dry_run=False):
         """
@@ -104,24 +100,20 @@ class GlossExtractor:
         :param file_name:
         :return:
         """
-        with open(file_name) as eaf:
-            xml = etree.parse(eaf)
-            videos = self.extract_video_files(xml)
-            time_slots = self.extract_time_slots(xml)
-            (list_of_glosses, tier_id_prefix) = self.extract_glosses(xml, time_slots)
+        videos = self.extract_video_files(file_name)
+        (list_of_glosses, tier_id_prefix) = self.extract_glosses(file_name)
 
-            self.extract_glosses_from_videos(file_name, list_of_glosses, videos)
+        self.extract_glosses_from_videos(file_name, list_of_glosses, videos)
 
-    def extract_video_files(self, xml):
+    def extract_video_files(self, file_name):
         """
-        Extracts video file url from the EAF XML.
+        Extracts video file url from the header of the EAF.
 
-        :param xml: the EAF XML
+        :param file_name: the EAF file name
         :return: videos dictionary (key: participant code, value: video url)
         """
         videos = {}
-        for media_descriptor in xml.findall("//MEDIA_DESCRIPTOR"):
-            media_url = media_descriptor.attrib["MEDIA_URL"]
+        for media_url in load_media_urls(file_name, cache=self.annotation_cache):
             url = urlparse(media_url)
             video_file = os.path.basename(url.path)
             match = re.match(r'^CNGT\d{4}_(S\d{3})_b.mpg$', video_file)
@@ -130,49 +122,39 @@ class GlossExtractor:
 
         return videos
 
-    def extract_time_slots(self, xml):
-        """
-        Extracts time slots from the EAF XML.
-
-        :param xml: the EAF XML
-        :return:
-        """
-        time_slots = {}
-        for time_slot in xml.findall("//TIME_SLOT"):
-            time_slot_id = time_slot.attrib['TIME_SLOT_ID']
-            time_slots[time_slot_id] = time_slot.attrib['TIME_VALUE']
-        return time_slots
-
-    def extract_glosses(self, xml, time_slots):
+    def extract_glosses(self, file_name):
         """
-        Extracts glosses from the EAF XML.
+        Extracts glosses from the gloss tiers of the EAF.
 
-        :param xml: the EAF XML
+        :param file_name: the EAF file name
         :return: a tuple: list of glosses, tier id prefix
         """
+        # Only the gloss tiers are read from the EAF
+        gloss_tier_ids = [prefix + hand + ' S' + subject
+                          for prefix in ['Gloss', 'Glos'] for hand in ['L', 'R'] for subject in ['1', '2']]
+
         list_of_glosses = {}
         tier_id_prefix = "Gloss"
-        for tier in xml.findall("//TIER"):
-            tier_id = tier.attrib['TIER_ID']
+        for tier_id, tier in load_tiers(file_name, tier_ids=gloss_tier_ids,
+                                        cache=self.annotation_cache).items():
             list_of_glosses[tier_id] = {}
 
             match = re.match(r'^(Gloss?)([LR]) S([12])$', tier_id)
-            if match and ('PARENT_REF' not in tier.attrib or tier.attrib['PARENT_REF'] == '')\
-                    and ('PARTICIPANT' in tier.attrib):
+            if match and ('PARENT_REF' not in tier.attributes or tier.attributes['PARENT_REF'] == '')\
+                    and ('PARTICIPANT' in tier.attributes):
                 tier_id_prefix = match.group(1)
                 hand = match.group(2)
                 subject = match.group(3)
-                participant = tier.attrib['PARTICIPANT']
-                if not list_of_glosses.has_key(participant):
+                participant = tier.attributes['PARTICIPANT']
+                if participant not in list_of_glosses:
                     list_of_glosses[participant] = []
 
-                for annotation in tier.findall("ANNOTATION/ALIGNABLE_ANNOTATION"):
-                    annotation_id = annotation.attrib['ANNOTATION_ID']
+                for annotation in tier.annotations:
                     annotation_data = {
-                        "begin": int(time_slots[annotation.attrib['TIME_SLOT_REF1']]) - self.header_time,
-                        "end": int(time_slots[annotation.attrib['TIME_SLOT_REF2']]) - self.header_time,
-                        "id": annotation_id,
-                        "value": annotation.find("ANNOTATION_VALUE").text,
+                        "begin": annotation.begin - self.header_time,
+                        "end": annotation.end - self.header_time,
+                        "id": annotation.annotation_id,
+                        "value": annotation.value,
                         "participant": participant,
                         "hand": hand,
                         "subject": subject,
@@ -213,7 +195,8 @@ class GlossExtractor:
                 elif annotation["value"] == current_gloss["value"]:  # overlap AND same gloss value
                     current_gloss["end"] = max(annotation["end"], current_gloss["end"]) # extend the current gloss
                 else:  # overlap but NOT same gloss value
-                    if annotation["end"] <= current_gloss["end"]:  # annotation is within current gloss
+                    if is_within((annotation["begin"], annotation["end"]),
+                                 (current_gloss["begin"], current_gloss["end"])):  # annotation is within current gloss
                         self.extract_video_fragment(fname, participant, annotation, videos[participant])
                     else:  # annotation extends outside current gloss
                         self.extract_video_fragment(fname, participant, current_gloss, videos[participant])
@@ -277,36 +260,16 @@ class GlossExtractor:
             process.wait()
 
 
-def has_overlap(first, second, min_overlap=0):
-    """
-    Determines if there is overlap between the first and second interval accounting for a minimal overlap.
-    If an interval is within the other, there is overlap no matter the amount of overlap.
-
-    :param first: tuple first interval (begin, end)
-    :param second: tuple second interval (begin, end)
-    :param min_overlap: int minimal overlap integer
-    :return:
-    """
-    if first[0] >= second[1] or second[0] >= first[1]:  # the start of one is after the end of the other
-        return False
-    overlap_interval = (max(first[0], second[0]), min(first[1], second[1]))
-    overlap = overlap_interval[1] - overlap_interval[0]
-    if overlap_interval == first or overlap_interval == second:  # one interval is completely within the other
-        return True
-    elif overlap >= min_overlap:
-        return True
-    return False  # default
-
-
 if __name__ == "__main__":
     usage = "Usage: \n" + sys.argv[0] + \
             " -c <ffmpeg command if not 'ffmpeg'> -o <minimal overlap> -t <extra time at beginning and end> " \
-            "-v <video directory> -g <gloss output directory> [-e <video extension replacement>] [-h <header time>] [-d] <file|directory ...>"
+            "-v <video directory> -g <gloss output directory> [-e <video extension replacement>] [-h <header time>] [-d] " \
+            "[--cache=<annotation cache directory, default $CNGT_CACHE_DIR>] <file|directory ...>"
     errors = []
     # -o Minimal overlap in ms; optional
     # -t Extra time at beginning and end of fragment, in ms; optional
     # -v Directory containing video files
-    opt_list, file_list = getopt.getopt(sys.argv[1:], 'c:g:o:t:v:e:h:d')
+    opt_list, file_list = getopt.getopt(sys.argv[1:], 'c:g:o:t:v:e:h:d', ['cache='])
 
     ffmpeg_command = "ffmpeg"
     gloss_dir = None
@@ -316,6 +279,7 @@ if __name__ == "__main__":
     video_extension_replacement = ""
     header_time = 0
     dry_run = False
+    cache_dir = None
 
     for opt in opt_list:
         if opt[0] == '-c':
@@ -334,6 +298,8 @@ if __name__ == "__main__":
             header_time = int(opt[1])
         if opt[0] == '-d':
             dry_run = True
+        if opt[0] == '--cache':
+            cache_dir = opt[1]
 
     if gloss_dir is None or len(gloss_dir) == 0:
         errors.append("No gloss output directory given")
@@ -357,6 +323,9 @@ if __name__ == "__main__":
     print("Video directory: " + video_dir, file=sys.stderr)
     print("Gloss output directory: " + gloss_dir, file=sys.stderr)
     print("ffmpeg command: " + ffmpeg_command, file=sys.stderr)
+    annotation_cache = open_annotation_cache(cache_dir)
+    if annotation_cache is not None:
+        print("Annotation cache: " + annotation_cache.cache_dir, file=sys.stderr)
 
-    gloss_extractor = GlossExtractor(file_list, video_dir, gloss_dir, minimal_overlap, time_begin_end, ffmpeg_command, video_extension_replacement, header_time)
+    gloss_extractor = GlossExtractor(file_list, video_dir, gloss_dir, minimal_overlap, time_begin_end, ffmpeg_command, video_extension_replacement, header_time, annotation_cache)
     gloss_extractor.run(dry_run)
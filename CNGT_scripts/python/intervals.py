@@ -0,0 +1,161 @@
+#!/usr/bin/python
+
+"""
+Operations on time intervals (begin, end) of annotations, shared by the scripts that group or compare annotations:
+overlap and containment of two intervals, merging two tiers in order of begin time, building units of consecutively
+overlapping annotations and counting overlapping annotations.
+
+The operations on whole tiers take sequences of begin and end times and run in linear (or n log n) time. Longer tiers
+are handled with NumPy.
+"""
+
+import numpy
+
+# Tiers shorter than this are handled in plain Python, which is faster for a few annotations
+VECTORIZE_THRESHOLD = 64
+
+
+def has_overlap(first, second, min_overlap=0):
+    """
+    Determines if there is overlap between the first and second interval accounting for a minimal overlap.
+    If an interval is within the other, there is overlap no matter the amount of overlap.
+
+    :param first: tuple first interval (begin, end)
+    :param second: tuple second interval (begin, end)
+    :param min_overlap: int minimal overlap integer
+    :return:
+    """
+    if first[0] >= second[1] or second[0] >= first[1]:  # the start of one is after the end of the other
+        return False
+    overlap_interval = (max(first[0], second[0]), min(first[1], second[1]))
+    overlap = overlap_interval[1] - overlap_interval[0]
+    if overlap_interval == first or overlap_interval == second:  # one interval is completely within the other
+        return True
+    elif overlap >= min_overlap:
+        return True
+    return False  # default
+
+
+def starts_within(first, second):
+    """
+    Determines if the begin of one interval lies within the other interval (begin inclusive, end exclusive).
+
+    :param first: first interval (begin, end, ...)
+    :param second: second interval (begin, end, ...)
+    :return:
+    """
+    # Begin time 1 is between begin time 2 and end time 2, or the other way around
+    return second[0] <= first[0] < second[1] or first[0] <= second[0] < first[1]
+
+
+def is_within(inner, outer):
+    """
+    Determines if the inner interval lies completely within the outer interval.
+
+    :param inner: interval (begin, end)
+    :param outer: interval (begin, end)
+    :return:
+    """
+    return outer[0] <= inner[0] and inner[1] <= outer[1]
+
+
+def merge_order(first_begins, second_begins):
+    """
+    Merges two tiers in order of begin time, as a merge of two sorted lists: the annotations of each tier keep their
+    order and of two annotations with the same begin time, the one of the first tier comes first.
+
+    :param first_begins: begin times of the first tier
+    :param second_begins: begin times of the second tier
+    :return: list of indices in the concatenation of both tiers, in merged order
+    """
+    number_of_first = len(first_begins)
+    number_of_second = len(second_begins)
+    if number_of_first + number_of_second >= VECTORIZE_THRESHOLD:
+        first_array = numpy.asarray(first_begins, dtype=numpy.int64).reshape(-1)
+        second_array = numpy.asarray(second_begins, dtype=numpy.int64).reshape(-1)
+        # A stable sort is the same as the merge if both tiers are sorted
+        if numpy.all(first_array[1:] >= first_array[:-1]) and numpy.all(second_array[1:] >= second_array[:-1]):
+            return numpy.argsort(numpy.concatenate([first_array, second_array]), kind='stable').tolist()
+
+    order = []
+    first_index = 0
+    second_index = 0
+    while first_index < number_of_first and second_index < number_of_second:
+        if first_begins[first_index] <= second_begins[second_index]:
+            order.append(first_index)
+            first_index += 1
+        else:
+            order.append(number_of_first + second_index)
+            second_index += 1
+    order.extend(range(first_index, number_of_first))
+    order.extend(range(number_of_first + second_index, number_of_first + number_of_second))
+    return order
+
+
+def group_units(begins, ends, minimum_overlap=0):
+    """
+    Groups consecutive annotations into units of overlapping annotations. An annotation starts a new unit if it begins
+    after the latest end of the annotations before it, minus the minimum overlap.
+
+    :param begins: begin times, in the order of the annotations
+    :param ends: end times, in the order of the annotations
+    :param minimum_overlap: the minimum overlap for an annotation to belong to the unit of the annotations before it
+    :return: list of (start, stop) index ranges of the units
+    """
+    number_of_annotations = len(begins)
+    if number_of_annotations == 0:
+        return []
+    if number_of_annotations >= VECTORIZE_THRESHOLD:
+        begins = numpy.asarray(begins, dtype=numpy.int64)
+        latest_ends = numpy.maximum.accumulate(numpy.asarray(ends, dtype=numpy.int64))
+        starts = (numpy.flatnonzero(begins[1:] > latest_ends[:-1] - minimum_overlap) + 1).tolist()
+    else:
+        starts = []
+        latest_end = ends[0]
+        for index in range(1, number_of_annotations):
+            if begins[index] > latest_end - minimum_overlap:
+                starts.append(index)
+            if ends[index] > latest_end:
+                latest_end = ends[index]
+    boundaries = [0] + starts + [number_of_annotations]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def count_overlapping(begins, ends, query_begins, query_ends):
+    """
+    Counts, for each query interval, the intervals that overlap with it (see has_overlap with a minimal overlap of 0):
+    the intervals that begin before the end of the query interval and end after its begin.
+
+    :param begins: begin times of the intervals, in any order
+    :param ends: end times of the intervals
+    :param query_begins: begin times of the query intervals
+    :param query_ends: end times of the query intervals
+    :return: list with the number of overlapping intervals per query interval
+    """
+    begins = numpy.asarray(begins, dtype=numpy.int64).reshape(-1)
+    ends = numpy.asarray(ends, dtype=numpy.int64).reshape(-1)
+    query_begins = numpy.asarray(query_begins, dtype=numpy.int64).reshape(-1)
+    query_ends = numpy.asarray(query_ends, dtype=numpy.int64).reshape(-1)
+    counts = numpy.zeros(len(query_begins), dtype=numpy.int64)
+
+    # Intervals beginning before the end of the query, minus those of them ending before (or at) its begin. This
+    # holds if both the interval and the query end after they begin; other pairs are compared one by one.
+    proper = begins < ends
+    proper_queries = query_begins < query_ends
+    sorted_begins = numpy.sort(begins[proper])
+    sorted_ends = numpy.sort(ends[proper])
+    beginning_before_end = numpy.searchsorted(sorted_begins, query_ends[proper_queries], 'left')
+    ending_before_begin = numpy.searchsorted(sorted_ends, query_begins[proper_queries], 'right')
+    counts[proper_queries] = beginning_before_end - ending_before_begin
+
+    # Zero-length (or reversed) intervals, against the proper queries
+    other_begins = begins[~proper]
+    other_ends = ends[~proper]
+    if len(other_begins):
+        counts[proper_queries] += numpy.sum((other_begins[None, :] < query_ends[proper_queries, None]) &
+                                            (other_ends[None, :] > query_begins[proper_queries, None]), axis=1)
+
+    # Zero-length (or reversed) queries, against all intervals
+    for index in numpy.flatnonzero(~proper_queries):
+        counts[index] = numpy.count_nonzero((begins < query_ends[index]) & (ends > query_begins[index]))
+    return counts.tolist()
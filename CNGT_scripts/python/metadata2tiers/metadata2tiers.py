@@ -12,10 +12,11 @@ import getopt
 import json
 import os
 import sys
-from urlparse import urlparse
+from urllib.parse import urlparse
 import subprocess
 from collections import defaultdict
 from pympi.Elan import Eaf
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
 
 
 class Metadata2tiers:
@@ -45,15 +46,7 @@ class Metadata2tiers:
         :param fname: the file name to add to the list of files to process
         :return:
         """
-        if os.path.isfile(fname):
-            if fname.endswith(".eaf"):
-                self.all_files.append(fname)
-        elif os.path.isdir(fname):
-            files_in_dir = os.listdir(fname)
-            for f in files_in_dir:
-                self.add_file(fname + os.sep + f)
-        else:
-            print("No such file of directory: " + fname, file=sys.stderr)
+        self.all_files.extend(find_files([fname], extensions=["eaf"]))
 
     def load_metadata(self, metadata_file):
         """
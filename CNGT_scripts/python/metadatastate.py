@@ -0,0 +1,172 @@
+#!/usr/bin/python
+
+"""
+Persistent state of cngt_calculated_metadata.py, so a later run only has to process the EAFs that were added or
+changed.
+
+Per EAF, the state keeps its size, modification time and content hash, the metrics of its session and the
+frequencies of the annotation values used for lowFreqSigns. Per metric, it keeps the number of sessions and the
+running mean and sum of squared deviations (Welford), which are updated when a session is added or removed.
+"""
+
+import json
+import math
+import os
+
+from CNGT_scripts.python.filecollectionprocessing.manifest import file_hash
+
+# Increase when the format of the state file changes
+STATE_VERSION = 1
+
+# The metrics of a session of which the ranges are calculated; lowFreqSigns depends on the whole corpus and is
+# calculated from the annotation frequencies
+METRICS = ['speed', 'differentSigns', 'classifiers', 'sentenceLength', 'fingerspelling', 'interaction',
+           'dominanceReversal']
+
+
+class RunningStatistics:
+    """
+    Number, mean and sum of squared deviations from the mean of a series of values, with Welford's algorithm.
+    Values can be removed again.
+    """
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        self.count -= 1
+        if self.count == 0:
+            self.mean = 0.0
+            self.m2 = 0.0
+        else:
+            delta = value - self.mean
+            self.mean -= delta / self.count
+            self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    def get_mean(self):
+        return self.mean if self.count else float('nan')
+
+    def get_std(self):
+        """
+        Returns the population standard deviation, as numpy.std.
+        :return:
+        """
+        return math.sqrt(self.m2 / self.count) if self.count else float('nan')
+
+    def to_dict(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2}
+
+
+class CalculatedMetadataState:
+    def __init__(self, state_file):
+        self.state_file = state_file
+        self.files = {}  # absolute file name: {'size', 'mtime', 'hash', 'session_id', 'metadata', 'frequencies'}
+        self.statistics = {metric: RunningStatistics() for metric in METRICS}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        if state.get('version') != STATE_VERSION:
+            return
+        self.files = state['files']
+        self.statistics = {metric: RunningStatistics(**state['statistics'][metric]) for metric in METRICS}
+
+    def save(self):
+        """
+        Writes the state to a temporary file first, so the state file is never partially written.
+        :return:
+        """
+        state = {
+            'version': STATE_VERSION,
+            'files': self.files,
+            'statistics': {metric: statistics.to_dict() for metric, statistics in self.statistics.items()}
+        }
+        temporary_file = "%s.%d.tmp" % (self.state_file, os.getpid())
+        with open(temporary_file, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary_file, self.state_file)
+
+    def get_file_names(self):
+        return sorted(self.files)
+
+    def is_unchanged(self, file_name):
+        """
+        Checks whether the EAF is the same as when it was processed. The content hash is only calculated if the size
+        is the same but the modification time is not.
+        :param file_name:
+        :return:
+        """
+        entry = self.files.get(os.path.abspath(file_name))
+        if entry is None:
+            return False
+        stat = os.stat(file_name)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime'] == stat.st_mtime_ns:
+            return True
+        if entry['hash'] == file_hash(file_name):
+            entry['mtime'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def remove(self, file_name):
+        """
+        Removes the metrics of the session of the EAF from the statistics and forgets the EAF.
+        :param file_name:
+        :return:
+        """
+        entry = self.files.pop(os.path.abspath(file_name), None)
+        if entry is not None:
+            for metric in METRICS:
+                if metric in entry['metadata']:
+                    self.statistics[metric].remove(entry['metadata'][metric])
+
+    def add(self, file_name, session_id, metadata, annotation_frequencies):
+        """
+        Adds the session of the EAF, replacing its previous version.
+        :param file_name:
+        :param session_id:
+        :param metadata: the metrics of the session, without lowFreqSigns
+        :param annotation_frequencies: dictionary value: frequency of the annotations used for lowFreqSigns
+        :return:
+        """
+        self.remove(file_name)
+        for metric in METRICS:
+            if metric in metadata:
+                self.statistics[metric].add(metadata[metric])
+
+        stat = os.stat(file_name)
+        self.files[os.path.abspath(file_name)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': file_hash(file_name),
+            'session_id': session_id,
+            'metadata': metadata,
+            'frequencies': annotation_frequencies
+        }
+
+    def get_range_statistics(self):
+        """
+        Returns per metric the mean, the standard deviation, and the minimum and maximum of 0 and the values of the
+        sessions (as EafMetadataCalculator.update_range).
+        :return: dictionary metric: (mean, std, min, max)
+        """
+        range_statistics = {}
+        for metric in METRICS:
+            values = [entry['metadata'][metric] for entry in self.files.values() if metric in entry['metadata']]
+            statistics = self.statistics[metric]
+            range_statistics[metric] = (statistics.get_mean(), statistics.get_std(), min([0] + values),
+                                        max([0] + values))
+        return range_statistics
@@ -6,28 +6,78 @@
 
 import getopt
 import json
+import multiprocessing
 import os
 import re
+import sqlite3
 import sys
 import csv
-from lxml import etree
-from collections import defaultdict
-import flatdict
+from collections import defaultdict, namedtuple
+import numpy
+from functools import lru_cache
+from CNGT_scripts.python.filecollectionprocessing.filediscovery import find_files
+from CNGT_scripts.python.filecollectionprocessing.annotationcache import load_tiers, open_annotation_cache
+from CNGT_scripts.python.signcounts import SignCounts, SignCountsState, Interner
+from CNGT_scripts.python.intervals import merge_order, group_units
+from CNGT_scripts.python.sketches import ApproximateSignCounts
+
+# A gloss annotation as counted: times in milliseconds, the gloss, the participant and the hand (L, R or None)
+GlossAnnotation = namedtuple('GlossAnnotation', ['begin', 'end', 'value', 'participant', 'hand'])
+
+NEWLINE_OR_TAB = re.compile(r'[\n\t]')
+MULTIPLE_WHITESPACE = re.compile(r'\s\s+')
+LEADING_WHITESPACE = re.compile(r'^\s+')
+TRAILING_WHITESPACE = re.compile(r'\s+$')
+
+
+@lru_cache(maxsize=65536)
+def normalize_gloss(gloss):
+    """
+    Removes newlines and tabs, and superfluous whitespace from a gloss.
+    :param gloss:
+    :return:
+    """
+    if not gloss:
+        return gloss
+    gloss = NEWLINE_OR_TAB.sub('', gloss)
+    gloss = MULTIPLE_WHITESPACE.sub(' ', gloss)
+    gloss = LEADING_WHITESPACE.sub('', gloss)
+    return TRAILING_WHITESPACE.sub('', gloss)
 
 
 class SignCounter:
-    def __init__(self, metadata_file, files, minimum_overlap=0, gloss_tier_type='gloss', region_metadata_id='Metadata region'):
+    def __init__(self, metadata_file, files, minimum_overlap=0, gloss_tier_type='gloss', region_metadata_id='Metadata region',
+                 annotation_cache=None, workers=1, state_file=None, dimensions=None,
+                 approximate_counts=None):
+        """
+        :param metadata_file: TSV file with per signer the metadata, e.g. the region
+        :param files: EAFs or directories with EAFs
+        :param minimum_overlap: the minimum overlap of the glosses of both hands to be counted as one unit
+        :param gloss_tier_type: the linguistic type of the gloss tiers
+        :param region_metadata_id: the metadata column of the region
+        :param annotation_cache: AnnotationCache or None
+        :param workers: number of processes counting EAFs
+        :param state_file: file with the counts of an earlier run, see run_incremental
+        :param dimensions: the metadata columns to compute frequencies for besides the region, all if None
+        :param approximate_counts: sketches.ApproximateSignCounts to count in instead of the exact counts, for a
+                                   result with only the estimated frequencies and numbers of signers of the most
+                                   frequent glosses in constant memory
+        """
         self.minimum_overlap = int(minimum_overlap)
+        self.workers = workers
+        self.state_file = state_file
+        self.annotation_cache = annotation_cache
         self.gloss_tier_type = gloss_tier_type
         self.region_metadata_id = region_metadata_id
+        self.dimensions = dimensions
+        self.approximate_counts = approximate_counts
         self.all_files = []
         self.metadata = {}
-        self.time_slots = {}
 
-        self.freqs = defaultdict(lambda: 0)
-        self.freqsPerPerson = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        self.freqsPerRegion = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-        self.freqsPerSomething = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: defaultdict(int))))
+        # Gloss units per gloss and per person, document and gloss, with integer ids for the strings
+        self.counts = SignCounts()
+        self.aggregates = None
+        self.sign_counts = None
 
         for f in files:
             self.add_file(f)
@@ -35,15 +85,7 @@ class SignCounter:
         self.load_metadata(metadata_file)
 
     def add_file(self, fname):
-        if os.path.isfile(fname):
-            if fname.endswith(".eaf"):
-                self.all_files.append(fname)
-        elif os.path.isdir(fname):
-            files_in_dir = os.listdir(fname)
-            for f in files_in_dir:
-                self.add_file(fname + os.sep + f)
-        else:
-            sys.stderr.write("No such file of directory: %s\n" % fname)
+        self.all_files.extend(find_files([fname], extensions=["eaf"]))
 
     def load_metadata(self, metadata_file):
         if not metadata_file:
@@ -51,65 +93,137 @@ class SignCounter:
         else:
             with open(metadata_file) as meta:
                 header = meta.readline().strip().split("\t")  # Skip first row (header)
+                # Only the region and the selected dimensions are kept
+                columns = [index for index in range(1, len(header)) if self.dimensions is None
+                           or header[index] == self.region_metadata_id or header[index] in self.dimensions]
                 for line in meta.readlines():
                     fields = line.strip().split("\t")
-                    self.metadata[fields[0]] = dict(zip(header[1:], fields[1:]))
+                    self.metadata[fields[0]] = {header[index]: fields[index] for index in columns
+                                                if index < len(fields)}
 
     def run(self):
         """ """
         if len(self.all_files) > 0:
-            for f in self.all_files:
-                try:
-                    self.process_file(f)
-                    self.generate_result()
-                except KeyError as ke:
-                    sys.stderr.write("KeyError in file %s: '%s'\n" % (f, ke.args[0]))
-                # except:
-                #     sys.stderr.write("Unexpected error: %s %s\n" % (str(sys.exc_info()[0]), str(sys.exc_info()[1])))
+            if self.state_file is not None:
+                self.run_incremental()
+            else:
+                for fname, document_counts, error in self.count_files(self.all_files):
+                    self.add_document_counts(document_counts)
         else:
             sys.stderr.write("No EAF files to process.\n")
 
-    def process_file(self, fname):
-        file_basename = os.path.basename(fname)
-        basename = os.path.splitext(file_basename)[0]
-        with open(fname, 'r', encoding="utf-8") as eaf:
-            xml = etree.parse(eaf)
-            self.extract_time_slots(xml)
-            grouped_tiers = self.group_tiers_per_participant(xml)
-            extracted_glosses_per_participant = self.extract_glosses_per_participant(grouped_tiers)
-            for participant, extracted_glosses in extracted_glosses_per_participant.items():
-                if extracted_glosses[1] == 1:
-                    list_of_gloss_units = self.to_units(extracted_glosses[0])
-                    self.restructure(list_of_gloss_units, basename)
-                elif extracted_glosses[1] == 2:
-                    list_of_gloss_units = self.to_units_two_handed(extracted_glosses[0])
-                    self.restructure(list_of_gloss_units, basename)
-
-    # Helper functions to extract data from the EAF XML
-    def extract_time_slots(self, xml):
-        for time_slot in xml.findall("//TIME_SLOT"):
-            time_slot_id = time_slot.attrib['TIME_SLOT_ID']
-            self.time_slots[time_slot_id] = time_slot.attrib['TIME_VALUE']
+    def run_incremental(self):
+        """
+        Counts only the EAFs that are new or changed since the state file was saved. The old contributions of
+        changed and removed EAFs are subtracted from the saved counts, the new contributions are added, and the
+        state file is updated.
+        :return:
+        """
+        state = SignCountsState(self.state_file, self.get_configuration())
+        current_files = set(os.path.abspath(f) for f in self.all_files)
+        for fname in state.get_file_names():
+            if fname not in current_files:
+                state.remove(fname)
+
+        files_to_count = []
+        for fname in self.all_files:
+            if state.is_unchanged(fname):
+                if state.get_error(fname) is not None:
+                    sys.stderr.write(state.get_error(fname))
+            else:
+                files_to_count.append(fname)
+        sys.stderr.write("Counting %d of %d EAFs; the counts of the others are taken from %s.\n"
+                         % (len(files_to_count), len(self.all_files), self.state_file))
+
+        for fname, document_counts, error in self.count_files(files_to_count):
+            state.add(fname, document_counts['document'], document_counts['freqs'],
+                      document_counts['freqsPerPerson'], error)
+        state.save()
+
+        self.counts = state.counts
+        self.aggregates = None
+        self.sign_counts = None
 
+    def get_configuration(self):
+        """
+        Returns the settings that influence the counts of a document.
+        :return:
+        """
+        return {'minimum_overlap': self.minimum_overlap, 'gloss_tier_type': self.gloss_tier_type}
+
+    def count_files(self, files):
+        """
+        Counts the gloss units per person in each of the files, in a pool of worker processes if more than one
+        worker is configured. The workers only count the gloss units per person in each document; the counts are
+        handed back to this process in the order of the list of files. As the counts are sums, the result of adding
+        them up is the same as that of a serial run. Errors are written to stderr.
+        :param files:
+        :return: generator of tuples: file name, document counts (see new_document_counts), error message or None
+        """
+        if self.workers > 1:
+            pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                        initargs=(self.minimum_overlap, self.gloss_tier_type, self.annotation_cache))
+            results = pool.imap(_count_file_in_worker, files, chunksize=4)
+        else:
+            pool = None
+            results = (self.count_file(f) for f in files)
+        try:
+            for fname, (document_counts, error) in zip(files, results):
+                if error is not None:
+                    sys.stderr.write(error)
+                yield fname, document_counts, error
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+    def count_file(self, fname):
+        """
+        Counts the gloss units per person in one EAF.
+        :param fname:
+        :return: a tuple: the document counts (see new_document_counts), an error message or None. If an error
+                 occurred, the counts contain the participants counted before the error.
+        """
+        document_counts = new_document_counts(os.path.splitext(os.path.basename(fname))[0])
+        try:
+            self.process_file(fname, document_counts)
+        except KeyError as ke:
+            return document_counts, "KeyError in file %s: '%s'\n" % (fname, ke.args[0])
+        return document_counts, None
+
+    def process_file(self, fname, document_counts):
+        # Only the gloss tiers are read from the EAF
+        tiers = load_tiers(fname, linguistic_types=[self.gloss_tier_type], cache=self.annotation_cache)
+        grouped_tiers = self.group_tiers_per_participant(tiers)
+        extracted_glosses_per_participant = self.extract_glosses_per_participant(grouped_tiers)
+        for participant, extracted_glosses in extracted_glosses_per_participant.items():
+            if extracted_glosses[1] == 1:
+                list_of_gloss_units = self.to_units(extracted_glosses[0])
+                self.restructure(list_of_gloss_units, document_counts)
+            elif extracted_glosses[1] == 2:
+                list_of_gloss_units = self.to_units_two_handed(extracted_glosses[0])
+                self.restructure(list_of_gloss_units, document_counts)
+
+    # Helper functions to extract data from the tiers read from the EAF
     def get_tier_id(self, tier):
-        return tier.attrib['TIER_ID']
+        return tier.tier_id
 
     def get_participant(self, tier):
-        if 'PARTICIPANT' in tier.attrib:
-            return tier.attrib['PARTICIPANT']
+        if 'PARTICIPANT' in tier.attributes:
+            return tier.attributes['PARTICIPANT']
         return ""
 
     def get_linguistic_type(self, tier):
-        if 'LINGUISTIC_TYPE_REF' in tier.attrib:
-            return tier.attrib['LINGUISTIC_TYPE_REF']
+        if 'LINGUISTIC_TYPE_REF' in tier.attributes:
+            return tier.attributes['LINGUISTIC_TYPE_REF']
         return ""
     # End helper functions
 
-    def group_tiers_per_participant(self, xml):
+    def group_tiers_per_participant(self, tiers):
         grouped_tiers = defaultdict(list)
-        for tier in xml.findall("//TIER"):
+        for tier in tiers.values():
             if self.get_linguistic_type(tier).lower() == self.gloss_tier_type \
-                    and ('PARENT_REF' not in tier.attrib or tier.attrib['PARENT_REF'] == ''):
+                    and ('PARENT_REF' not in tier.attributes or tier.attributes['PARENT_REF'] == ''):
                 grouped_tiers[self.get_participant(tier)].append(tier)
         return grouped_tiers
 
@@ -127,7 +241,7 @@ class SignCounter:
         return extracted_glosses_per_participant
 
     def extract_glosses_two_handed(self, participant, tier_list):
-        list_of_glosses = {}  # Structure: { $tierID: { "participant":  "...", "annotations": [ { "begin": ..., "end": ..., "id": ..., "participant": ... }, { ... } ] } }
+        list_of_glosses = {}  # Structure: { $tierID: { "participant":  "...", "annotations": [ GlossAnnotation, ... ] } }
         tier_id_hand = {}
         for tier in tier_list:
             tier_id = self.get_tier_id(tier)
@@ -141,23 +255,7 @@ class SignCounter:
 
                 list_of_glosses[tier_id]["participant"] = participant
 
-                list_of_glosses[tier_id]["annotations"] = []
-
-                for annotation in tier.findall("ANNOTATION/ALIGNABLE_ANNOTATION"):
-                    annotation_id = annotation.attrib['ANNOTATION_ID']
-                    cve_ref = None
-                    if 'CVE_REF' in annotation.attrib:
-                        cve_ref = annotation.attrib['CVE_REF']
-                    annotation_data = {
-                        "begin": int(self.time_slots[annotation.attrib['TIME_SLOT_REF1']]),
-                        "end": int(self.time_slots[annotation.attrib['TIME_SLOT_REF2']]),
-                        "id": annotation_id,
-                        "value": annotation.find("ANNOTATION_VALUE").text,
-                        "cve_ref": cve_ref,
-                        "participant": participant,
-                        "hand": hand
-                    }
-                    list_of_glosses[tier_id]["annotations"].append(annotation_data)
+                list_of_glosses[tier_id]["annotations"] = self.get_list_of_glosses(tier, participant, hand)
 
         return list_of_glosses, tier_id_hand
 
@@ -170,213 +268,534 @@ class SignCounter:
         return list_of_glosses
 
     def get_list_of_glosses(self, tier, participant, hand):
-        annotations = []
-        for annotation in tier.findall("ANNOTATION/ALIGNABLE_ANNOTATION"):
-            annotation_id = annotation.attrib['ANNOTATION_ID']
-            cve_ref = None
-            if 'CVE_REF' in annotation.attrib:
-                cve_ref = annotation.attrib['CVE_REF']
-            annotation_data = {
-                "begin": int(self.time_slots[annotation.attrib['TIME_SLOT_REF1']]),
-                "end": int(self.time_slots[annotation.attrib['TIME_SLOT_REF2']]),
-                "id": annotation_id,
-                "value": annotation.find("ANNOTATION_VALUE").text,
-                "cve_ref": cve_ref,
-                "participant": participant,
-                "hand": hand
-            }
-            annotations.append(annotation_data)
-        return annotations
+        for annotation in tier.annotations:
+            # A time slot without a time value; the file is skipped, as the glosses cannot be put in order
+            if annotation.begin is None or annotation.end is None:
+                raise KeyError('TIME_VALUE')
+        return [GlossAnnotation(annotation.begin, annotation.end, annotation.value, participant, hand)
+                for annotation in tier.annotations]
 
 
     def to_units_two_handed(self, list_of_glosses_and_tier_id_hand):
         """Turns the list of glosses into a list of units of overlapping glosses.
+        The glosses of both hands are merged in order of begin time (right hand first if they begin at the same time).
+        A gloss starts a new unit if it begins after the latest end of the glosses before it, minus the minimum
+        overlap.
         :rtype: list of gloss units
         """
         list_of_glosses = list_of_glosses_and_tier_id_hand[0]
         tier_id_hand = list_of_glosses_and_tier_id_hand[1]
 
-        list_of_gloss_units = []  # Structure: [ [ { "begin": ..., "end": ..., "id": ..., "participant": ... } ], [ ] ]
-        for signer_id in (1, 2):
-            unit = []  # Overlapping glosses are put in a unit.
-            last_end_on = ''  # The hand (L or R) of the last seen gloss
-            last_end = None  # The end timeSlot of the last seen gloss
-
-            right_tier_id = tier_id_hand['R']
-            left_tier_id = tier_id_hand['L']
-            if right_tier_id in list_of_glosses and left_tier_id in list_of_glosses:
-                right_hand_data = list_of_glosses[right_tier_id]
-                left_hand_data = list_of_glosses[left_tier_id]
-
-                if "annotations" in right_hand_data and "annotations" in left_hand_data:
-                    right_hand_annotations = right_hand_data['annotations']
-                    left_hand_annotations = left_hand_data['annotations']
-                    while len(right_hand_annotations) > 0 or len(left_hand_annotations) > 0:
-                        if len(right_hand_annotations) > 0 and len(left_hand_annotations) > 0:
-                            if right_hand_annotations[0]['begin'] <= left_hand_annotations[0]['begin']:
-                                last_end_on = 'R'
-                            else:
-                                last_end_on = 'L'
-                        elif len(right_hand_data['annotations']) > 0:
-                            last_end_on = 'R'
-                        else:
-                            last_end_on = 'L'
-
-                        current_hand_data = list_of_glosses[tier_id_hand[last_end_on]]
-                        current_hand_begin = current_hand_data['annotations'][0]['begin']
-                        if last_end is not None and current_hand_begin > (last_end - self.minimum_overlap):
-                            # Begin new unit
-                            list_of_gloss_units.append(unit)
-                            unit = []
-
-                        unit.append(current_hand_data['annotations'][0])
-
-                        current_hand_end = current_hand_data['annotations'][0]['end']
-                        if last_end is None or current_hand_end > last_end:
-                            last_end = current_hand_end
-
-                        current_hand_data['annotations'].pop(0)
-
-            list_of_gloss_units.append(unit)
+        right_tier_id = tier_id_hand['R']
+        left_tier_id = tier_id_hand['L']
+        right_hand_annotations = list_of_glosses[right_tier_id].get('annotations', [])
+        left_hand_annotations = list_of_glosses[left_tier_id].get('annotations', [])
 
-        return list_of_gloss_units
+        both_hands = right_hand_annotations + left_hand_annotations
+        merged = [both_hands[index] for index in merge_order([annotation.begin for annotation in right_hand_annotations],
+                                                             [annotation.begin for annotation in left_hand_annotations])]
+
+        # Structure: [ [ GlossAnnotation, ... ], [ ] ]
+        return [merged[start:stop] for start, stop in group_units([annotation.begin for annotation in merged],
+                                                                  [annotation.end for annotation in merged],
+                                                                  self.minimum_overlap)]
 
     def to_units(self, list_of_glosses):
-        list_of_gloss_units = []  # Structure: [ [ { "begin": ..., "end": ..., "id": ..., "participant": ... } ], [ ] ]
+        list_of_gloss_units = []  # Structure: [ [ GlossAnnotation, ... ], [ ] ]
         for tier_name, tier_data in list_of_glosses.items():
             for annotation in tier_data["annotations"]:
                 list_of_gloss_units.append([annotation])
         return list_of_gloss_units
 
-    def restructure(self, list_of_glosses, basename):
+    def restructure(self, list_of_glosses, document_counts):
+        """
+        Counts the glosses of the units in the document counts, once per unit and once per person in a unit.
+        :param list_of_glosses: list of gloss units
+        :param document_counts:
+        :return:
+        """
+        freqs = document_counts['freqs']
+        freqs_per_person = document_counts['freqsPerPerson']
         for unit in list_of_glosses:
             tmp = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
             for annotation in unit:
-                gloss = annotation['value']
-
-                try:
-                    re.sub(r'\n', '', gloss)
-                    re.sub(r'\t', '', gloss)
-                    re.sub(r'\s\s+', ' ', gloss)
-                    re.sub(r'^\s+', '', gloss)
-                    re.sub(r'\s+$', '', gloss)
-                except TypeError:
-                    pass
-
+                # Normalized once per distinct gloss
+                gloss = normalize_gloss(annotation.value)
                 if gloss is not None and not gloss == '':
-                    tmp[gloss]['participants'][annotation['participant']] += 1
+                    tmp[gloss]['participants'][annotation.participant] += 1
 
             for gloss in tmp.keys():
-                self.freqs[gloss] += 1
+                freqs[gloss] = freqs.get(gloss, 0) + 1
 
                 for person in tmp[gloss]['participants'].keys():
-                    self.freqsPerPerson[person][basename][gloss] += 1
-
-                    try:
-                        region = self.metadata[person][self.region_metadata_id]
-                        self.freqsPerRegion[region][person][gloss] += 1
-                    except:
-                        pass
-
-                    try:
-                        for something in self.metadata[person].keys():
-                            if something != 'self.region_metadata_id':
-                                item = self.metadata[person][something]
-                                self.freqsPerSomething[something][item][person][gloss] += 1
-                    except:
-                        pass
+                    person_freqs = freqs_per_person.setdefault(person, {})
+                    person_freqs[gloss] = person_freqs.get(gloss, 0) + 1
+
+    def add_document_counts(self, document_counts):
+        """
+        Adds the counts of one document to the totals.
+        :param document_counts:
+        :return:
+        """
+        if self.approximate_counts is not None:
+            self.approximate_counts.add_document(document_counts['document'], document_counts['freqs'],
+                                                 document_counts['freqsPerPerson'])
+            return
+
+        self.counts.add_document(document_counts['document'], document_counts['freqs'],
+                                 document_counts['freqsPerPerson'])
+
+        # The result has to be generated again
+        self.aggregates = None
+        self.sign_counts = None
+
+    def get_person_items(self, dimension):
+        """
+        Looks up the metadata of the counted persons for one dimension.
+        :param dimension: a metadata column
+        :return: a tuple: an Interner of the items of the dimension, with ids in sorted order, an array with per
+                 person id the id of its item or -1 if there is no metadata for the person
+        """
+        items = Interner(sorted(set(self.metadata[person][dimension] for person in self.counts.persons
+                                    if person in self.metadata and dimension in self.metadata[person])))
+        person_items = [items.get_id(self.metadata[person][dimension])
+                        if person in self.metadata and dimension in self.metadata[person] else -1
+                        for person in self.counts.persons]
+        return items, person_items
+
+    def get_frequencies_per_item(self, dimension):
+        """
+        Returns the frequency and number of signers per gloss id and item of a metadata dimension.
+        :param dimension:
+        :return: a tuple: the items of the dimension, and lists, sorted on gloss id and item id, of gloss ids, item
+                 ids, frequencies, numbers of signers and the start of the rows per gloss id (with one extra element)
+        """
+        items, person_items = self.get_person_items(dimension)
+        gloss_ids, item_ids, frequencies, numbers_of_signers = self.counts.get_frequencies_per_item(person_items)
+        starts = numpy.searchsorted(gloss_ids, numpy.arange(len(self.counts.glosses) + 1))
+        return (items, gloss_ids.tolist(), item_ids.tolist(), frequencies.tolist(), numbers_of_signers.tolist(),
+                starts.tolist())
+
+    def get_dimensions(self):
+        """
+        Returns the metadata dimensions of the counted persons besides the region, sorted.
+        :return:
+        """
+        dimensions = set()
+        for person in self.counts.persons:
+            if person in self.metadata:
+                dimensions.update(self.metadata[person].keys())
+        dimensions.discard(self.region_metadata_id)
+        return sorted(dimensions)
+
+    def get_aggregates(self):
+        """
+        Computes the number of signers, region and metadata frequencies of all glosses at once from the compact
+        counts. The result is generated gloss by gloss from these aggregates.
+        :return:
+        """
+        if self.aggregates is None:
+            self.aggregates = {
+                'freqs': self.counts.get_gloss_frequencies().tolist(),
+                # Person frequencies; a person is counted once per document
+                'numbersOfSigners': self.counts.get_numbers_of_signers().tolist(),
+                'regions': self.get_frequencies_per_item(self.region_metadata_id),
+                'somethings': [('frequencyPer' + something, self.get_frequencies_per_item(something))
+                               for something in self.get_dimensions()]
+            }
+        return self.aggregates
+
+    def get_gloss_ids(self):
+        """
+        Returns the ids of the counted glosses, sorted on gloss.
+        :return:
+        """
+        freqs = self.get_aggregates()['freqs']
+        glosses = self.counts.glosses
+        return [gloss_id for gloss_id in sorted(range(len(glosses)), key=glosses.__getitem__) if freqs[gloss_id] != 0]
+
+    def get_gloss_result(self, gloss_id):
+        """
+        Returns the result of one gloss.
+        :param gloss_id:
+        :return:
+        """
+        def item_frequencies(frequencies_per_item):
+            items, gloss_ids, item_ids, frequencies, numbers_of_signers, starts = frequencies_per_item
+            return {items[item_ids[row]]: {'frequency': frequencies[row], 'numberOfSigners': numbers_of_signers[row]}
+                    for row in range(starts[gloss_id], starts[gloss_id + 1])}
+
+        aggregates = self.get_aggregates()
+        gloss_result = {'frequency': aggregates['freqs'][gloss_id],
+                        'numberOfSigners': aggregates['numbersOfSigners'][gloss_id],
+                        'frequenciesPerRegion': item_frequencies(aggregates['regions'])}
+        for label, frequencies_per_item in aggregates['somethings']:
+            frequencies = item_frequencies(frequencies_per_item)
+            if frequencies:
+                gloss_result[label] = frequencies
+        return gloss_result
+
+    def iter_result(self):
+        """
+        Generates the result gloss by gloss, in order of gloss, so it can be written without holding all of it.
+        :return: generator of tuples: gloss, result of the gloss
+        """
+        if self.approximate_counts is not None:
+            # The most frequent glosses, most frequent first
+            yield from self.approximate_counts.iter_result()
+            return
+
+        glosses = self.counts.glosses
+        for gloss_id in self.get_gloss_ids():
+            yield glosses[gloss_id], self.get_gloss_result(gloss_id)
+
+    def get_number_of_glosses(self):
+        if self.approximate_counts is not None:
+            return len(self.approximate_counts.get_top_glosses())
+        return len(self.get_gloss_ids())
+
+    def get_columns(self):
+        """
+        Returns the columns of the flattened result (see flatten_result) of all glosses, sorted, without generating
+        the result.
+        :return:
+        """
+        if self.approximate_counts is not None:
+            return ['frequency', 'numberOfSigners']
+
+        aggregates = self.get_aggregates()
+        columns = {'frequency', 'numberOfSigners'}
+        for label, frequencies_per_item in [('frequenciesPerRegion', aggregates['regions'])] + aggregates['somethings']:
+            items, gloss_ids, item_ids = frequencies_per_item[:3]
+            for item_id in set(item_ids):
+                columns.add(label + '/' + items[item_id] + '/frequency')
+                columns.add(label + '/' + items[item_id] + '/numberOfSigners')
+
+        # Glosses without region frequencies have an empty dictionary, which is a column of its own
+        starts = aggregates['regions'][5]
+        if any(starts[gloss_id] == starts[gloss_id + 1] for gloss_id in self.get_gloss_ids()):
+            columns.add('frequenciesPerRegion')
+        return sorted(columns)
 
     def generate_result(self):
-        number_of_tokens = 0
-        number_of_types = 0
-        number_of_singletons = 0
-
-        self.sign_counts = {}
-
-        for gloss in sorted(self.freqs.keys()):
-            number_of_types += 1
-            number_of_tokens += self.freqs[gloss]
-            if self.freqs[gloss] == 1:
-                number_of_singletons += 1
-
-            # Person frequencies
-            number_of_signers = 0
-            for person in sorted(self.freqsPerPerson.keys()):
-                for document in sorted(self.freqsPerPerson[person].keys()):
-                    if gloss in self.freqsPerPerson[person][document]:
-                        number_of_signers += 1
-
-            # Uncomment the following to pass this in the result
-            # signer_frequencies = defaultdict(lambda: defaultdict(int))
-            # for person in sorted(self.freqsPerPerson.keys()):
-            #     for document in sorted(self.freqsPerPerson[person].keys()):
-            #         if gloss in self.freqsPerPerson[person][document].keys():
-            #             signer_frequencies[person][document] = self.freqsPerPerson[person][document][gloss]
-
-            # Region frequencies
-            region_frequencies = defaultdict(lambda: defaultdict(int))
-            for region in sorted(self.freqsPerRegion.keys()):
-                # region_frequencies[region]['frequency'] = 0
-                for person in sorted(self.freqsPerRegion[region].keys()):
-                    if gloss in self.freqsPerRegion[region][person]:
-                        region_frequencies[region]['frequency'] += self.freqsPerRegion[region][person][gloss]
-                        region_frequencies[region]['numberOfSigners'] += 1
-
-            something_frequencies = defaultdict(lambda: defaultdict(lambda: defaultdict(int)))
-            for something in sorted(self.freqsPerSomething.keys()):
-                for item in sorted(self.freqsPerSomething[something].keys()):
-                    for person in sorted(self.freqsPerSomething[something][item].keys()):
-                        if gloss in self.freqsPerSomething[something][item][person]:
-                            label = 'frequencyPer' + something
-                            something_frequencies[label][item]['frequency'] += \
-                                self.freqsPerSomething[something][item][person][gloss]
-                            something_frequencies[label][item]['numberOfSigners'] += 1
-
-            self.sign_counts[gloss] = {'frequency': self.freqs[gloss], 'numberOfSigners': number_of_signers,
-                                    'frequenciesPerRegion': region_frequencies} #, 'frequenciesPerSpeaker': signer_frequencies}
-            self.sign_counts[gloss].update(something_frequencies)
+        self.sign_counts = dict(self.iter_result())
 
     def get_result(self):
-
+        """
+        Returns the result, generating it if the counts changed since it was generated last.
+        :return:
+        """
+        if self.sign_counts is None:
+            self.generate_result()
         return self.sign_counts
 
 
-def output_results(result, csv_file=False):
+def new_document_counts(basename):
+    """
+    Returns empty counts for one document: the number of gloss units per gloss, and per person per gloss. Only plain
+    dictionaries are used, so the counts can be handed from a worker process to the main process.
+    :param basename: the name of the document
+    :return:
+    """
+    return {'document': basename, 'freqs': {}, 'freqsPerPerson': {}}
+
+
+# The sign counter used by a worker process
+_worker_sign_counter = None
+
+
+def _init_worker(minimum_overlap, gloss_tier_type, annotation_cache):
+    global _worker_sign_counter
+    # The metadata is only used when the counts are added up in the main process
+    _worker_sign_counter = SignCounter(None, [], minimum_overlap, gloss_tier_type=gloss_tier_type,
+                                       annotation_cache=annotation_cache)
+
+
+def _count_file_in_worker(fname):
+    return _worker_sign_counter.count_file(fname)
+
+
+def flatten_result(data):
+    """
+    Flattens the nested result of a gloss into a dictionary with paths of keys, separated by '/', as keys. Empty
+    dictionaries are kept as values.
+    :param data:
+    :return:
+    """
+    flat_data = {}
+    for key, value in data.items():
+        if isinstance(value, dict) and value:
+            for sub_key, sub_value in flatten_result(value).items():
+                flat_data[key + '/' + sub_key] = sub_value
+        else:
+            flat_data[key] = value
+    return flat_data
+
+
+def get_column_value(data, flat_data, column):
+    if column in flat_data:
+        return flat_data[column]
+    if column in data:
+        # A column for a dictionary, e.g. frequenciesPerRegion if other glosses have none: its flattened content
+        return '{' + ', '.join('%r: %r' % item for item in flatten_result(data[column]).items()) + '}'
+    return ''
+
+
+def write_json(results, f):
+    """
+    Writes the results as one JSON object, gloss by gloss, in the same layout as json.dumps(..., sort_keys=True,
+    indent=4).
+    :param results: iterable of tuples: gloss, result of the gloss, sorted on gloss
+    :param f: text file
+    :return:
+    """
+    separator = '{'
+    for gloss, data in results:
+        f.write(separator + '\n    ' + json.dumps(gloss) + ': ' +
+                json.dumps(data, sort_keys=True, indent=4).replace('\n', '\n    '))
+        separator = ','
+    f.write('{}\n' if separator == '{' else '\n}\n')
+
+
+def write_json_lines(results, f):
+    """
+    Writes the results as JSON Lines: one JSON object per gloss, with the gloss under the key "gloss".
+    :param results: iterable of tuples: gloss, result of the gloss
+    :param f: text file
+    :return:
+    """
+    for gloss, data in results:
+        f.write(json.dumps(dict(data, gloss=gloss), sort_keys=True) + '\n')
+
+
+def write_csv(results, columns, f):
+    """
+    Writes the flattened results as CSV, one row per gloss, with the given columns.
+    :param results: iterable of tuples: gloss, result of the gloss
+    :param columns: the columns, e.g. from SignCounter.get_columns
+    :param f: text file
+    :return:
+    """
+    freqs_writer = csv.writer(f)
+    freqs_writer.writerow(['gloss'] + columns)
+    for gloss, data in results:
+        flat_data = flatten_result(data)
+        freqs_writer.writerow([gloss] + [get_column_value(data, flat_data, column) for column in columns])
+
+
+def write_npz(results, number_of_glosses, columns, npz_file):
+    """
+    Writes the flattened results in a compressed, columnar NumPy .npz file with the arrays 'gloss', 'columns' and
+    'values': per column (first axis) the value for each gloss (second axis), or -1 if the gloss has none.
+    :param results: iterable of tuples: gloss, result of the gloss
+    :param number_of_glosses:
+    :param columns: the columns, e.g. from SignCounter.get_columns; columns for dictionaries are left out
+    :param npz_file:
+    :return:
+    """
+    columns = [column for column in columns if column != 'frequenciesPerRegion']
+    column_indexes = {column: index for index, column in enumerate(columns)}
+    glosses = []
+    values = numpy.full((len(columns), number_of_glosses), -1, dtype=numpy.int64)
+    for gloss_index, (gloss, data) in enumerate(results):
+        glosses.append(gloss)
+        for column, value in flatten_result(data).items():
+            if column in column_indexes:
+                values[column_indexes[column], gloss_index] = value
+    numpy.savez_compressed(npz_file, gloss=numpy.array(glosses, dtype=str), columns=numpy.array(columns, dtype=str),
+                           values=values)
+
+
+SQLITE_TABLES = [
+    """CREATE TABLE gloss (id INTEGER PRIMARY KEY, gloss TEXT NOT NULL UNIQUE, frequency INTEGER NOT NULL,
+                           number_of_signers INTEGER NOT NULL)""",
+    """CREATE TABLE region (id INTEGER PRIMARY KEY, region TEXT NOT NULL UNIQUE)""",
+    """CREATE TABLE person (id INTEGER PRIMARY KEY, person TEXT NOT NULL UNIQUE, region_id INTEGER REFERENCES region)""",
+    """CREATE TABLE document (id INTEGER PRIMARY KEY, document TEXT NOT NULL UNIQUE)""",
+    """CREATE TABLE metadata_item (id INTEGER PRIMARY KEY, dimension TEXT NOT NULL, item TEXT NOT NULL,
+                                   UNIQUE (dimension, item))""",
+    """CREATE TABLE person_metadata_item (person_id INTEGER NOT NULL REFERENCES person,
+                                          metadata_item_id INTEGER NOT NULL REFERENCES metadata_item,
+                                          PRIMARY KEY (person_id, metadata_item_id))""",
+    """CREATE TABLE person_document_count (gloss_id INTEGER NOT NULL REFERENCES gloss,
+                                           person_id INTEGER NOT NULL REFERENCES person,
+                                           document_id INTEGER NOT NULL REFERENCES document,
+                                           frequency INTEGER NOT NULL,
+                                           PRIMARY KEY (gloss_id, person_id, document_id))""",
+    """CREATE TABLE gloss_region_frequency (gloss_id INTEGER NOT NULL REFERENCES gloss,
+                                            region_id INTEGER NOT NULL REFERENCES region,
+                                            frequency INTEGER NOT NULL, number_of_signers INTEGER NOT NULL,
+                                            PRIMARY KEY (gloss_id, region_id))""",
+    """CREATE TABLE gloss_metadata_frequency (gloss_id INTEGER NOT NULL REFERENCES gloss,
+                                              metadata_item_id INTEGER NOT NULL REFERENCES metadata_item,
+                                              frequency INTEGER NOT NULL, number_of_signers INTEGER NOT NULL,
+                                              PRIMARY KEY (gloss_id, metadata_item_id))"""
+]
+
+# Created after the rows are inserted, which is faster than keeping them up to date while inserting
+SQLITE_INDEXES = [
+    "CREATE INDEX person_document_count_person ON person_document_count (person_id)",
+    "CREATE INDEX person_document_count_document ON person_document_count (document_id)",
+    "CREATE INDEX person_region ON person (region_id)",
+    "CREATE INDEX person_metadata_item_item ON person_metadata_item (metadata_item_id)",
+    "CREATE INDEX gloss_region_frequency_region ON gloss_region_frequency (region_id)",
+    "CREATE INDEX gloss_metadata_frequency_item ON gloss_metadata_frequency (metadata_item_id)"
+]
+
+
+def write_sqlite(sign_counter, sqlite_file):
+    """
+    Writes the counts and the result of the sign counter to a new SQLite database, in one transaction. Besides
+    glosses, persons, documents, regions and metadata items, the database has the counts per gloss, person and
+    document, and the frequencies and numbers of signers per gloss and region (gloss_region_frequency) and per gloss
+    and metadata item (gloss_metadata_frequency), as in the JSON result. The ids are those of the sign counter.
+    :param sign_counter:
+    :param sqlite_file:
+    :return:
+    """
+    counts = sign_counter.counts
+    aggregates = sign_counter.get_aggregates()
+
+    temporary_file = "%s.%d.tmp" % (sqlite_file, os.getpid())
+    if os.path.exists(temporary_file):
+        os.remove(temporary_file)
+    connection = sqlite3.connect(temporary_file)
+    try:
+        # A new file that replaces the database only when complete, so no journal is needed
+        connection.execute("PRAGMA journal_mode = OFF")
+        connection.execute("PRAGMA synchronous = OFF")
+        with connection:
+            for statement in SQLITE_TABLES:
+                connection.execute(statement)
+
+            gloss_ids = sign_counter.get_gloss_ids()
+            connection.executemany("INSERT INTO gloss VALUES (?, ?, ?, ?)",
+                                   ((gloss_id, counts.glosses[gloss_id], aggregates['freqs'][gloss_id],
+                                     aggregates['numbersOfSigners'][gloss_id]) for gloss_id in gloss_ids))
+
+            regions, person_regions = sign_counter.get_person_items(sign_counter.region_metadata_id)
+            connection.executemany("INSERT INTO region VALUES (?, ?)", enumerate(regions))
+            connection.executemany("INSERT INTO person VALUES (?, ?, ?)",
+                                   ((person_id, person, person_regions[person_id] if person_regions[person_id] >= 0
+                                     else None) for person_id, person in enumerate(counts.persons)))
+            connection.executemany("INSERT INTO document VALUES (?, ?)", enumerate(counts.documents))
+
+            person_ids, document_ids, row_gloss_ids, row_counts = counts.get_rows()
+            selection = row_counts > 0
+            connection.executemany("INSERT INTO person_document_count VALUES (?, ?, ?, ?)",
+                                   zip(row_gloss_ids[selection].tolist(), person_ids[selection].tolist(),
+                                       document_ids[selection].tolist(), row_counts[selection].tolist()))
+
+            items, item_gloss_ids, item_ids, frequencies, numbers_of_signers = aggregates['regions'][:5]
+            connection.executemany("INSERT INTO gloss_region_frequency VALUES (?, ?, ?, ?)",
+                                   zip(item_gloss_ids, item_ids, frequencies, numbers_of_signers))
+
+            metadata_item_offset = 0
+            for label, frequencies_per_item in aggregates['somethings']:
+                dimension = label[len('frequencyPer'):]
+                items, person_items = sign_counter.get_person_items(dimension)
+                connection.executemany("INSERT INTO metadata_item VALUES (?, ?, ?)",
+                                       ((metadata_item_offset + item_id, dimension, item)
+                                        for item_id, item in enumerate(items)))
+                connection.executemany("INSERT INTO person_metadata_item VALUES (?, ?)",
+                                       ((person_id, metadata_item_offset + item_id)
+                                        for person_id, item_id in enumerate(person_items) if item_id >= 0))
+                items, item_gloss_ids, item_ids, frequencies, numbers_of_signers = frequencies_per_item[:5]
+                connection.executemany("INSERT INTO gloss_metadata_frequency VALUES (?, ?, ?, ?)",
+                                       ((gloss_id, metadata_item_offset + item_id, frequency, number_of_signers)
+                                        for gloss_id, item_id, frequency, number_of_signers
+                                        in zip(item_gloss_ids, item_ids, frequencies, numbers_of_signers)))
+                metadata_item_offset += len(items)
+
+            for statement in SQLITE_INDEXES:
+                connection.execute(statement)
+    finally:
+        connection.close()
+    os.replace(temporary_file, sqlite_file)
+
+
+def output_results(sign_counter, csv_file=None, json_lines_file=None, npz_file=None, sqlite_file=None):
+    """
+    Writes the result of the sign counter to the given files, or as JSON to stdout if no file is given.
+    :param sign_counter:
+    :param csv_file:
+    :param json_lines_file:
+    :param npz_file:
+    :param sqlite_file:
+    :return:
+    """
     if csv_file:
-        # Flatten result dict
-        flat_dicts = {}
-        columns = set()
-        for gloss, data in result.items():
-            flat_data = flatdict.FlatDict(data, delimiter='/')
-            flat_dicts[gloss] = flat_data
-            columns.update(flat_data.keys())
-
-        # Write to csv file
         with open(csv_file, 'w') as f:
-            freqs_writer = csv.writer(f)
-            columns_list = sorted(columns)
-            freqs_writer.writerow(['gloss'] + columns_list)
-            for gloss, flat_dict in flat_dicts.items():
-                data_field = [flat_dict.get(name, '') for name in columns_list]
-                freqs_writer.writerow([gloss] + data_field)
-    else:
-        print(json.dumps(result, sort_keys=True, indent=4))
+            write_csv(sign_counter.iter_result(), sign_counter.get_columns(), f)
+    if json_lines_file:
+        with open(json_lines_file, 'w') as f:
+            write_json_lines(sign_counter.iter_result(), f)
+    if npz_file:
+        write_npz(sign_counter.iter_result(), sign_counter.get_number_of_glosses(), sign_counter.get_columns(),
+                  npz_file)
+    if sqlite_file:
+        write_sqlite(sign_counter, sqlite_file)
+    if not (csv_file or json_lines_file or npz_file or sqlite_file):
+        write_json(sign_counter.iter_result(), sys.stdout)
 
 
 if __name__ == "__main__":
-    usage = "Usage: \n" + sys.argv[0] + " -m <metadata file> -o <mimimum overlap> <file|directory ...>"
+    usage = "Usage: \n" + sys.argv[0] + " -m <metadata file> -o <mimimum overlap> [--csv=<csv file>]" \
+            " [--jsonl=<JSON Lines file>] [--npz=<compressed columnar NumPy file>] [--sqlite=<SQLite file>]" \
+            " [-j <number of worker processes>] [--state=<state file>]" \
+            " [--dimensions=<comma separated metadata columns besides the region, default all>]" \
+            " [--approximate [--epsilon=<frequency error as a fraction of all gloss units, default 0.001>]" \
+            " [--delta=<probability of a larger error, default 0.01>]" \
+            " [--signer-error=<relative error of the numbers of signers, default 0.1>]" \
+            " [--top=<number of most frequent glosses, default 100>]]" \
+            " [--cache=<annotation cache directory, default $CNGT_CACHE_DIR>] <file|directory ...>"
     errors = []
-    optlist, file_list = getopt.getopt(sys.argv[1:], 'm:o:', ['csv='])
+    optlist, file_list = getopt.getopt(sys.argv[1:], 'm:o:j:', ['csv=', 'jsonl=', 'npz=', 'sqlite=', 'cache=', 'state=',
+                                                                'dimensions=', 'approximate', 'epsilon=', 'delta=',
+                                                                'signer-error=', 'top='])
     metadata_fname = ''
     min_overlap = None
     csv_file = None
+    json_lines_file = None
+    npz_file = None
+    sqlite_file = None
+    cache_dir = None
+    workers = 1
+    state_file = None
+    dimensions = None
+    approximate = False
+    approximate_settings = {}
     for opt in optlist:
         if opt[0] == '-m':
             metadata_fname = opt[1]
         if opt[0] == '-o':
             min_overlap = opt[1]
+        if opt[0] == '-j':
+            workers = int(opt[1])
         if opt[0] == '--csv':
             csv_file = opt[1]
+        if opt[0] == '--jsonl':
+            json_lines_file = opt[1]
+        if opt[0] == '--npz':
+            npz_file = opt[1]
+        if opt[0] == '--sqlite':
+            sqlite_file = opt[1]
+        if opt[0] == '--cache':
+            cache_dir = opt[1]
+        if opt[0] == '--state':
+            state_file = opt[1]
+        if opt[0] == '--dimensions':
+            dimensions = [dimension.strip() for dimension in opt[1].split(",") if dimension.strip() != '']
+        if opt[0] == '--approximate':
+            approximate = True
+        if opt[0] == '--epsilon':
+            approximate_settings['epsilon'] = float(opt[1])
+        if opt[0] == '--delta':
+            approximate_settings['delta'] = float(opt[1])
+        if opt[0] == '--signer-error':
+            approximate_settings['signer_error'] = float(opt[1])
+        if opt[0] == '--top':
+            approximate_settings['top'] = int(opt[1])
 
     if min_overlap is None or min_overlap == '':
         errors.append("No minimum overlap file given.")
@@ -384,13 +803,18 @@ if __name__ == "__main__":
     if file_list is None or len(file_list) == 0:
         errors.append("No files or directories given.")
 
+    if approximate and (state_file or sqlite_file):
+        errors.append("The approximate counts cannot be used with a state file or written to SQLite.")
+
     if len(errors) != 0:
         print("Errors:")
         print("\n".join(errors))
         print(usage)
         exit(1)
 
-    signCounter = SignCounter(metadata_fname, file_list, min_overlap)
+    signCounter = SignCounter(metadata_fname, file_list, min_overlap,
+                              annotation_cache=open_annotation_cache(cache_dir), workers=workers,
+                              state_file=state_file, dimensions=dimensions,
+                              approximate_counts=ApproximateSignCounts(**approximate_settings) if approximate else None)
     signCounter.run()
-    result = signCounter.get_result()
-    output_results(result, csv_file)
+    output_results(signCounter, csv_file, json_lines_file, npz_file, sqlite_file)
@@ -0,0 +1,426 @@
+#!/usr/bin/python
+
+"""
+Compact storage of sign counts, used by signCounter.py.
+
+Glosses, persons and documents are interned to integer ids. The number of gloss units per gloss is kept in an array
+indexed by gloss id, and the number of gloss units per person, document and gloss in a sparse matrix in coordinate
+form: three arrays of ids and one of counts, with a row per person, document and gloss added. The aggregates of the
+result are computed from these arrays with numpy.
+
+The counts can be saved to a state file together with the contribution of each document, so a later run only has to
+count the documents that were added or changed (see SignCountsState).
+"""
+
+from array import array
+import json
+import os
+import zipfile
+import numpy
+
+from CNGT_scripts.python.filecollectionprocessing.manifest import file_hash, normalize
+
+# Increase when the format of the state file changes
+STATE_VERSION = 1
+
+
+class Interner:
+    """
+    Maps values (e.g. gloss strings) to consecutive integer ids and back.
+    """
+
+    def __init__(self, values=()):
+        self.ids = {}
+        self.values = []
+        for value in values:
+            self.get_id(value)
+
+    def get_id(self, value):
+        """
+        Returns the id of the value, giving it the next id if it has none yet.
+        :param value:
+        :return:
+        """
+        value_id = self.ids.get(value)
+        if value_id is None:
+            value_id = len(self.values)
+            self.ids[value] = value_id
+            self.values.append(value)
+        return value_id
+
+    def __getitem__(self, value_id):
+        return self.values[value_id]
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __contains__(self, value):
+        return value in self.ids
+
+
+class SignCounts:
+    def __init__(self):
+        self.glosses = Interner()
+        self.persons = Interner()
+        self.documents = Interner()
+
+        # Number of gloss units per gloss id
+        self.freqs = array('q')
+
+        # Number of gloss units per person, document and gloss, in coordinate form
+        self.person_ids = array('i')
+        self.document_ids = array('i')
+        self.gloss_ids = array('i')
+        self.counts = array('q')
+
+        # The distinct rows, computed when needed
+        self.rows = None
+
+    def get_gloss_id(self, gloss):
+        gloss_id = self.glosses.get_id(gloss)
+        if gloss_id == len(self.freqs):
+            self.freqs.append(0)
+        return gloss_id
+
+    def add_document(self, document, freqs, freqs_per_person, sign=1):
+        """
+        Adds the counts of one document.
+        :param document: name of the document
+        :param freqs: dictionary (gloss: number of gloss units)
+        :param freqs_per_person: dictionary (person: gloss: number of gloss units)
+        :param sign: -1 to subtract the counts instead
+        :return:
+        """
+        self.rows = None
+        document_id = self.documents.get_id(document)
+        for gloss, frequency in freqs.items():
+            self.freqs[self.get_gloss_id(gloss)] += sign * frequency
+
+        for person, person_freqs in freqs_per_person.items():
+            person_id = self.persons.get_id(person)
+            for gloss, frequency in person_freqs.items():
+                self.person_ids.append(person_id)
+                self.document_ids.append(document_id)
+                self.gloss_ids.append(self.get_gloss_id(gloss))
+                self.counts.append(sign * frequency)
+
+    def remove_document(self, document, freqs, freqs_per_person):
+        """
+        Subtracts counts added before with add_document.
+        """
+        self.add_document(document, freqs, freqs_per_person, sign=-1)
+
+    def compact(self, documents_to_keep=()):
+        """
+        Replaces the rows by the distinct rows, leaving out the rows with a count of 0, e.g. of removed documents.
+        The glosses, persons and documents that are left without rows are forgotten, except for the documents to
+        keep (counted documents without glosses); the others get new ids, in the same order.
+        :param documents_to_keep: the names of the documents to keep
+        :return: a tuple of two arrays: per old gloss id and per old person id, the new id or -1 if it was forgotten
+        """
+        person_ids, document_ids, gloss_ids, counts = self.get_rows()
+        selection = counts != 0
+        freqs = self.get_gloss_frequencies()
+
+        kept_glosses = freqs != 0
+        kept_glosses[gloss_ids[selection]] = True
+        kept_persons = numpy.zeros(len(self.persons), dtype=bool)
+        kept_persons[person_ids[selection]] = True
+        kept_documents = numpy.zeros(len(self.documents), dtype=bool)
+        kept_documents[document_ids[selection]] = True
+        kept_documents[[self.documents.ids[document] for document in documents_to_keep
+                        if document in self.documents]] = True
+        gloss_map = get_id_map(kept_glosses)
+        person_map = get_id_map(kept_persons)
+        document_map = get_id_map(kept_documents)
+
+        self.glosses = Interner([self.glosses[gloss_id] for gloss_id in numpy.flatnonzero(kept_glosses).tolist()])
+        self.persons = Interner([self.persons[person_id] for person_id in numpy.flatnonzero(kept_persons).tolist()])
+        self.documents = Interner([self.documents[document_id]
+                                   for document_id in numpy.flatnonzero(kept_documents).tolist()])
+        self.freqs = array('q', freqs[kept_glosses].astype(numpy.int64).tobytes())
+        self.person_ids = array('i', person_map[person_ids[selection]].astype(numpy.int32).tobytes())
+        self.document_ids = array('i', document_map[document_ids[selection]].astype(numpy.int32).tobytes())
+        self.gloss_ids = array('i', gloss_map[gloss_ids[selection]].astype(numpy.int32).tobytes())
+        self.counts = array('q', counts[selection].astype(numpy.int64).tobytes())
+        self.rows = None
+        return gloss_map, person_map
+
+    def to_arrays(self):
+        """
+        :return: a tuple: JSON serializable data (the interned strings), dictionary of numpy arrays
+        """
+        data = {'glosses': self.glosses.values, 'persons': self.persons.values, 'documents': self.documents.values}
+        arrays = {'freqs': numpy.frombuffer(self.freqs, dtype=numpy.int64) if self.freqs
+                  else numpy.zeros(0, dtype=numpy.int64)}
+        for name in ['person_ids', 'document_ids', 'gloss_ids']:
+            arrays[name] = numpy.frombuffer(getattr(self, name), dtype=numpy.int32) if getattr(self, name) \
+                else numpy.zeros(0, dtype=numpy.int32)
+        arrays['counts'] = numpy.frombuffer(self.counts, dtype=numpy.int64) if self.counts \
+            else numpy.zeros(0, dtype=numpy.int64)
+        return data, arrays
+
+    @staticmethod
+    def from_arrays(data, arrays):
+        """
+        Inverse of to_arrays.
+        """
+        sign_counts = SignCounts()
+        sign_counts.glosses = Interner(data['glosses'])
+        sign_counts.persons = Interner(data['persons'])
+        sign_counts.documents = Interner(data['documents'])
+        sign_counts.freqs = array('q', arrays['freqs'].astype(numpy.int64).tobytes())
+        for name in ['person_ids', 'document_ids', 'gloss_ids']:
+            setattr(sign_counts, name, array('i', arrays[name].astype(numpy.int32).tobytes()))
+        sign_counts.counts = array('q', arrays['counts'].astype(numpy.int64).tobytes())
+        return sign_counts
+
+    def get_gloss_frequencies(self):
+        return numpy.frombuffer(self.freqs, dtype=numpy.int64) if self.freqs else numpy.zeros(0, dtype=numpy.int64)
+
+    def get_rows(self):
+        """
+        Returns the person, document and gloss ids and the counts as numpy arrays, with one row per distinct person,
+        document and gloss (a document can be added more than once, e.g. if EAFs in different directories have the
+        same name).
+        :return: a tuple of four arrays: person ids, document ids, gloss ids, counts
+        """
+        if self.rows is None:
+            self.rows = self.compute_rows()
+        return self.rows
+
+    def compute_rows(self):
+        if not self.counts:
+            return tuple(numpy.zeros(0, dtype=numpy.int64) for _ in range(4))
+        person_ids = numpy.array(self.person_ids, dtype=numpy.int64)
+        document_ids = numpy.array(self.document_ids, dtype=numpy.int64)
+        gloss_ids = numpy.array(self.gloss_ids, dtype=numpy.int64)
+        counts = numpy.array(self.counts, dtype=numpy.int64)
+
+        number_of_persons = len(self.persons)
+        number_of_documents = len(self.documents)
+        keys = (gloss_ids * number_of_persons + person_ids) * number_of_documents + document_ids
+        unique_keys, inverse = numpy.unique(keys, return_inverse=True)
+        unique_counts = numpy.bincount(inverse, weights=counts, minlength=len(unique_keys)).astype(numpy.int64)
+        gloss_and_person_ids, document_ids = numpy.divmod(unique_keys, number_of_documents)
+        gloss_ids, person_ids = numpy.divmod(gloss_and_person_ids, number_of_persons)
+        return person_ids, document_ids, gloss_ids, unique_counts
+
+    def get_numbers_of_signers(self):
+        """
+        Returns per gloss id the number of persons using the gloss, counting a person once per document.
+        :return:
+        """
+        person_ids, document_ids, gloss_ids, counts = self.get_rows()
+        return numpy.bincount(gloss_ids[counts > 0], minlength=len(self.glosses))
+
+    def get_frequencies_per_item(self, person_items):
+        """
+        Aggregates the counts per gloss and per item of a metadata dimension, e.g. per region.
+        :param person_items: array with per person id the id of its item, or -1 if the person has none
+        :return: a tuple of four arrays, sorted on gloss id and item id: gloss ids, item ids, frequencies, numbers
+                 of signers
+        """
+        person_ids, document_ids, gloss_ids, counts = self.get_rows()
+        # Only the persons matter here, so first add up the counts of the documents of a person
+        number_of_persons = max(len(self.persons), 1)
+        person_keys, inverse = numpy.unique(gloss_ids * number_of_persons + person_ids, return_inverse=True)
+        counts = numpy.bincount(inverse, weights=counts, minlength=len(person_keys)).astype(numpy.int64)
+        gloss_ids, person_ids = numpy.divmod(person_keys, number_of_persons)
+
+        items = numpy.asarray(person_items, dtype=numpy.int64)[person_ids]
+        selection = (items >= 0) & (counts > 0)
+        gloss_ids = gloss_ids[selection]
+        items = items[selection]
+        counts = counts[selection]
+
+        # Each row now is a distinct person, so the number of rows per gloss and item is the number of signers
+        number_of_items = int(items.max()) + 1 if len(items) else 1
+        keys, inverse = numpy.unique(gloss_ids * number_of_items + items, return_inverse=True)
+        frequencies = numpy.bincount(inverse, weights=counts, minlength=len(keys)).astype(numpy.int64)
+        numbers_of_signers = numpy.bincount(inverse, minlength=len(keys))
+
+        result_gloss_ids, result_items = numpy.divmod(keys, number_of_items)
+        return result_gloss_ids, result_items, frequencies, numbers_of_signers
+
+
+def get_id_map(kept):
+    """
+    Returns the new ids of the kept ids, numbered consecutively in the same order.
+    :param kept: boolean array with per old id whether it is kept
+    :return: array with per old id the new id, or -1 if it is not kept
+    """
+    id_map = numpy.full(len(kept), -1, dtype=numpy.int64)
+    id_map[kept] = numpy.arange(int(numpy.count_nonzero(kept)))
+    return id_map
+
+
+class SignCountsState:
+    """
+    Sign counts with, per EAF, its size, modification time, content hash and contribution to the counts, saved in a
+    NumPy .npz file. When an EAF changed or was removed, its old contribution is subtracted from the counts, so only
+    new and changed EAFs have to be counted again. The state is only used if it was made with the same configuration
+    (e.g. minimum overlap) as the current run.
+    """
+
+    def __init__(self, state_file, configuration):
+        """
+        :param state_file:
+        :param configuration: JSON serializable settings that influence the counts
+        """
+        self.state_file = state_file
+        self.configuration = normalize(configuration)
+        self.counts = SignCounts()
+        self.files = {}  # absolute file name: {'size', 'mtime', 'hash', 'document', 'error'}
+        self.contributions = {}  # absolute file name: (person ids, gloss ids, counts, freq gloss ids, freq counts)
+        self.load()
+
+    def load(self):
+        try:
+            with numpy.load(self.state_file) as npz:
+                header = json.loads(str(npz['header']))
+                arrays = {name: npz[name] for name in npz.files if name != 'header'}
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            return
+        if header['version'] != STATE_VERSION or header['configuration'] != self.configuration:
+            return
+
+        self.counts = SignCounts.from_arrays(header['counts'], arrays)
+        self.files = header['files']
+        for file_name, entry in self.files.items():
+            rows = slice(*entry.pop('rows'))
+            freq_rows = slice(*entry.pop('freq_rows'))
+            self.contributions[file_name] = (arrays['contribution_person_ids'][rows],
+                                             arrays['contribution_gloss_ids'][rows],
+                                             arrays['contribution_counts'][rows],
+                                             arrays['contribution_freq_gloss_ids'][freq_rows],
+                                             arrays['contribution_freq_counts'][freq_rows])
+
+    def save(self):
+        """
+        Writes the state to a temporary file first, so the state file is never partially written.
+        :return:
+        """
+        gloss_map, person_map = self.counts.compact(set(entry['document'] for entry in self.files.values()))
+        for file_name, (person_ids, gloss_ids, counts, freq_gloss_ids, freq_counts) in self.contributions.items():
+            self.contributions[file_name] = (person_map[person_ids].astype(numpy.int32),
+                                             gloss_map[gloss_ids].astype(numpy.int32), counts,
+                                             gloss_map[freq_gloss_ids].astype(numpy.int32), freq_counts)
+        data, arrays = self.counts.to_arrays()
+
+        files = {}
+        columns = [[], [], [], [], []]
+        rows_start = 0
+        freq_rows_start = 0
+        for file_name in sorted(self.files):
+            contribution = self.contributions[file_name]
+            for column, values in zip(columns, contribution):
+                column.append(values)
+            files[file_name] = dict(self.files[file_name],
+                                    rows=[rows_start, rows_start + len(contribution[0])],
+                                    freq_rows=[freq_rows_start, freq_rows_start + len(contribution[3])])
+            rows_start += len(contribution[0])
+            freq_rows_start += len(contribution[3])
+        for name, column, dtype in zip(['contribution_person_ids', 'contribution_gloss_ids', 'contribution_counts',
+                                        'contribution_freq_gloss_ids', 'contribution_freq_counts'], columns,
+                                       [numpy.int32, numpy.int32, numpy.int64, numpy.int32, numpy.int64]):
+            arrays[name] = numpy.concatenate(column).astype(dtype) if column else numpy.zeros(0, dtype=dtype)
+
+        header = {'version': STATE_VERSION, 'configuration': self.configuration, 'counts': data, 'files': files}
+        temporary_file = "%s.%d.tmp" % (self.state_file, os.getpid())
+        with open(temporary_file, 'wb') as f:
+            numpy.savez(f, header=numpy.array(json.dumps(header)), **arrays)
+        os.replace(temporary_file, self.state_file)
+
+    def get_file_names(self):
+        return list(self.files)
+
+    def is_unchanged(self, file_name):
+        """
+        Checks whether the EAF is the same as when it was counted. The content hash is only calculated if the size is
+        the same but the modification time is not.
+        :param file_name:
+        :return:
+        """
+        entry = self.files.get(os.path.abspath(file_name))
+        if entry is None:
+            return False
+        stat = os.stat(file_name)
+        if entry['size'] != stat.st_size:
+            return False
+        if entry['mtime'] == stat.st_mtime_ns:
+            return True
+        if entry['hash'] == file_hash(file_name):
+            entry['mtime'] = stat.st_mtime_ns
+            return True
+        return False
+
+    def get_error(self, file_name):
+        entry = self.files.get(os.path.abspath(file_name))
+        return entry['error'] if entry is not None else None
+
+    def get_document_counts(self, file_name):
+        """
+        Returns the contribution of the EAF to the counts, in the form it was added.
+        :param file_name:
+        :return: a tuple: document, freqs, freqs per person
+        """
+        file_name = os.path.abspath(file_name)
+        person_ids, gloss_ids, counts, freq_gloss_ids, freq_counts = self.contributions[file_name]
+        glosses = self.counts.glosses
+        persons = self.counts.persons
+
+        freqs = {glosses[gloss_id]: count for gloss_id, count in zip(freq_gloss_ids.tolist(), freq_counts.tolist())}
+        freqs_per_person = {}
+        for person_id, gloss_id, count in zip(person_ids.tolist(), gloss_ids.tolist(), counts.tolist()):
+            freqs_per_person.setdefault(persons[person_id], {})[glosses[gloss_id]] = count
+        return self.files[file_name]['document'], freqs, freqs_per_person
+
+    def remove(self, file_name):
+        """
+        Subtracts the contribution of the EAF from the counts and forgets the EAF.
+        :param file_name:
+        :return:
+        """
+        file_name = os.path.abspath(file_name)
+        if file_name in self.files:
+            self.counts.remove_document(*self.get_document_counts(file_name))
+            del self.files[file_name]
+            del self.contributions[file_name]
+
+    def add(self, file_name, document, freqs, freqs_per_person, error=None):
+        """
+        Adds the contribution of the EAF to the counts, replacing its previous contribution.
+        :param file_name:
+        :param document: name of the document
+        :param freqs: dictionary (gloss: number of gloss units)
+        :param freqs_per_person: dictionary (person: gloss: number of gloss units)
+        :param error: the error message of counting the EAF, if any
+        :return:
+        """
+        self.remove(file_name)
+        self.counts.add_document(document, freqs, freqs_per_person)
+
+        glosses = self.counts.glosses
+        persons = self.counts.persons
+        rows = [(persons.get_id(person), glosses.get_id(gloss), count)
+                for person, person_freqs in freqs_per_person.items() for gloss, count in person_freqs.items()]
+        self.contributions[os.path.abspath(file_name)] = (
+            numpy.array([row[0] for row in rows], dtype=numpy.int32),
+            numpy.array([row[1] for row in rows], dtype=numpy.int32),
+            numpy.array([row[2] for row in rows], dtype=numpy.int64),
+            numpy.array([glosses.get_id(gloss) for gloss in freqs], dtype=numpy.int32),
+            numpy.array(list(freqs.values()), dtype=numpy.int64)
+        )
+
+        stat = os.stat(file_name)
+        self.files[os.path.abspath(file_name)] = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': file_hash(file_name),
+            'document': document,
+            'error': error
+        }
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+
+"""
+Approximate sign counts in constant memory, used by the approximate mode of signCounter.py.
+
+The number of gloss units per gloss is estimated with a count-min sketch, the number of signers per gloss with a
+count-min sketch of HyperLogLog registers (a HyperLogLog per cell instead of a counter) and the most frequent glosses
+are kept with the Space-Saving algorithm. The memory use depends only on the error bounds, not on the size of the
+corpus or the number of different glosses and signers.
+
+With probability 1 - delta, an estimated frequency is at most epsilon times the total number of gloss units too high
+and never too low. An estimated number of signers has a relative standard error of about signer_error, plus the
+signers of other glosses in the same cells.
+"""
+
+from functools import lru_cache
+import hashlib
+import heapq
+import math
+import numpy
+
+# Number of glosses of which the hashes are kept
+HASH_CACHE_SIZE = 65536
+
+
+def hash_value(value):
+    """
+    Returns a 128 bit hash of a string that is the same in every process (unlike the built-in hash).
+    :param value:
+    :return: a tuple of two 64 bit integers
+    """
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+    return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+
+class CountMinSketch:
+    def __init__(self, epsilon=0.001, delta=0.01):
+        """
+        :param epsilon: the maximum overestimate of a count, as a fraction of the sum of all counts
+        :param delta: the probability that an estimate exceeds this bound
+        """
+        self.epsilon = epsilon
+        self.delta = delta
+        self.width = int(math.ceil(math.e / epsilon))
+        self.depth = int(math.ceil(math.log(1.0 / delta)))
+        self.table = numpy.zeros((self.depth, self.width), dtype=numpy.int64)
+        self.rows = numpy.arange(self.depth)
+        self.get_columns = lru_cache(maxsize=HASH_CACHE_SIZE)(self.compute_columns)
+
+    def compute_columns(self, value):
+        """
+        Returns the column of the value in each row, by double hashing.
+        :param value:
+        :return:
+        """
+        (first_hash, second_hash) = hash_value(value)
+        return numpy.array([(first_hash + row * second_hash) % self.width for row in range(self.depth)])
+
+    def add(self, value, count=1):
+        self.table[self.rows, self.get_columns(value)] += count
+
+    def estimate(self, value):
+        return int(self.table[self.rows, self.get_columns(value)].min())
+
+    def merge(self, other):
+        """
+        Adds the counts of a sketch with the same error bounds.
+        :param other:
+        :return:
+        """
+        self.table += other.table
+
+
+class CountMinHyperLogLog:
+    def __init__(self, epsilon=0.001, delta=0.01, error=0.1):
+        """
+        Estimates the number of distinct items per key: a count-min sketch of which each cell holds the registers of
+        a HyperLogLog. The estimate of a key is the smallest HyperLogLog estimate of its cells.
+
+        :param epsilon: as for CountMinSketch; determines the number of cells per row
+        :param delta: as for CountMinSketch; determines the number of rows
+        :param error: the relative standard error of a HyperLogLog; determines the number of registers per cell
+        """
+        self.keys = CountMinSketch(epsilon, delta)
+        self.precision = max(4, int(math.ceil(math.log2((1.04 / error) ** 2))))
+        self.number_of_registers = 1 << self.precision
+        self.registers = numpy.zeros((self.keys.depth, self.keys.width, self.number_of_registers), dtype=numpy.uint8)
+
+        m = self.number_of_registers
+        self.alpha = {16: 0.673, 32: 0.697, 64: 0.709}.get(m, 0.7213 / (1 + 1.079 / m))
+
+    def get_register(self, item):
+        """
+        Returns the register of the item and the position of the first 1 bit in the rest of its hash.
+        :param item:
+        :return:
+        """
+        item_hash = hash_value(item)[0]
+        rest = item_hash >> self.precision
+        return item_hash & (self.number_of_registers - 1), (64 - self.precision) - rest.bit_length() + 1
+
+    def add(self, key, item):
+        (register, rank) = self.get_register(item)
+        cells = self.registers[self.keys.rows, self.keys.get_columns(key), register]
+        self.registers[self.keys.rows, self.keys.get_columns(key), register] = numpy.maximum(cells, rank)
+
+    def estimate(self, key):
+        registers = self.registers[self.keys.rows, self.keys.get_columns(key)].astype(numpy.float64)
+        m = self.number_of_registers
+        raw_estimates = self.alpha * m * m / numpy.sum(numpy.exp2(-registers), axis=1)
+        zeros = numpy.sum(registers == 0, axis=1)
+        # Linear counting for small numbers
+        estimates = numpy.where((raw_estimates <= 2.5 * m) & (zeros > 0),
+                                m * numpy.log(m / numpy.maximum(zeros, 1)), raw_estimates)
+        return int(round(estimates.min()))
+
+    def merge(self, other):
+        numpy.maximum(self.registers, other.registers, out=self.registers)
+
+
+class HeavyHitters:
+    def __init__(self, size=100):
+        """
+        Keeps the most frequent values with the Space-Saving algorithm. Every value with a count above the sum of all
+        counts divided by the size is kept; the count of a kept value is at most the count of the value it replaced
+        too high.
+
+        :param size: the number of values kept
+        """
+        self.size = size
+        self.counts = {}
+        # Heap of (count, value); an entry is outdated if the count of its value increased since
+        self.heap = []
+
+    def add(self, value, count=1):
+        if value in self.counts or len(self.counts) < self.size:
+            self.counts[value] = self.counts.get(value, 0) + count
+        else:
+            # Replace the value with the lowest count, taking over its count
+            smallest = self.pop_smallest()
+            self.counts[value] = self.counts.pop(smallest) + count
+        heapq.heappush(self.heap, (self.counts[value], value))
+        if len(self.heap) > 4 * self.size:
+            self.heap = [(value_count, value) for value, value_count in self.counts.items()]
+            heapq.heapify(self.heap)
+
+    def pop_smallest(self):
+        while True:
+            (value_count, value) = heapq.heappop(self.heap)
+            if self.counts.get(value) == value_count:
+                return value
+
+    def get_values(self):
+        """
+        Returns the kept values, most frequent first.
+        :return:
+        """
+        return sorted(self.counts, key=lambda value: (-self.counts[value], value))
+
+
+class ApproximateSignCounts:
+    def __init__(self, epsilon=0.001, delta=0.01, signer_error=0.1, top=100):
+        """
+        :param epsilon: the maximum overestimate of a frequency, as a fraction of the total number of gloss units
+        :param delta: the probability that an estimate exceeds its bound
+        :param signer_error: the relative standard error of the estimated numbers of signers
+        :param top: the number of most frequent glosses in the result
+        """
+        self.freqs = CountMinSketch(epsilon, delta)
+        self.signers = CountMinHyperLogLog(epsilon, delta, signer_error)
+        # More glosses are kept than reported, so the reported ones are the most frequent with little error
+        self.heavy_hitters = HeavyHitters(max(top, int(math.ceil(1.0 / epsilon))))
+        self.top = top
+        self.total = 0
+
+    def add_document(self, document, freqs, freqs_per_person):
+        """
+        Adds the counts of one document.
+        :param document:
+        :param freqs: dictionary gloss: number of gloss units
+        :param freqs_per_person: dictionary person: dictionary gloss: number of gloss units
+        :return:
+        """
+        for gloss, frequency in freqs.items():
+            self.freqs.add(gloss, frequency)
+            self.heavy_hitters.add(gloss, frequency)
+            self.total += frequency
+        # A person is counted once per document, as in the exact counts
+        for person, person_freqs in freqs_per_person.items():
+            signer = person + "\t" + document
+            for gloss, frequency in person_freqs.items():
+                if frequency > 0:
+                    self.signers.add(gloss, signer)
+
+    def get_gloss_frequency(self, gloss):
+        return self.freqs.estimate(gloss)
+
+    def get_number_of_signers(self, gloss):
+        return self.signers.estimate(gloss)
+
+    def get_top_glosses(self):
+        """
+        Returns the most frequent glosses, most frequent first.
+        :return:
+        """
+        return sorted(self.heavy_hitters.get_values(),
+                      key=lambda gloss: (-self.get_gloss_frequency(gloss), gloss))[:self.top]
+
+    def iter_result(self):
+        """
+        Generates the result of the most frequent glosses, most frequent first.
+        :return: generator of tuples: gloss, result of the gloss
+        """
+        for gloss in self.get_top_glosses():
+            yield gloss, {'frequency': self.get_gloss_frequency(gloss),
+                          'numberOfSigners': self.get_number_of_signers(gloss)}
+
+    def merge(self, other):
+        """
+        Adds the counts of other approximate counts with the same error bounds.
+        :param other:
+        :return:
+        """
+        self.freqs.merge(other.freqs)
+        self.signers.merge(other.signers)
+        for gloss, frequency in other.heavy_hitters.counts.items():
+            self.heavy_hitters.add(gloss, frequency)
+        self.total += other.total
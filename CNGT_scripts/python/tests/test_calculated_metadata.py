@@ -0,0 +1,100 @@
+"""
+Pins the session metrics of cngt_calculated_metadata.py, computed on arrays of begin and end times and per different
+value, to the numbers of the earlier implementation (which looped over the annotations of a pympi Eaf), on a small
+fixed EAF.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from CNGT_scripts.python.cngt_calculated_metadata import EafMetadataCalculator, DocumentTiers
+from CNGT_scripts.python.filecollectionprocessing.eafreader import read_tiers
+
+# Tier id: annotations (begin, end, value). GlossR S1 is the tier with the most annotations: the gap of 1 ms after
+# GEBAREN does not split an interval for the speed, the gap of 2 ms after #ABC does; #M has length 0 and the last
+# interval (BOOM_CL) is not counted. The sentences of subject 1 include one of length 0.
+TIERS = {
+    'GlossL S1': [(0, 500, 'GEBAREN'), (600, 900, '#ABC'), (1000, 1400, 'PT:1'), (1500, 1800, 'BOOM_CL')],
+    'GlossR S1': [(0, 500, 'GEBAREN'), (501, 900, '#ABC'), (902, 1400, 'IK'), (1400, 1400, '#M'),
+                  (1400, 1800, 'LOOP_CL'), (3000, 3500, 'BOOM_CL')],
+    'GlossL S2': [(3000, 3400, 'JA'), (3500, 3600, '#DE')],
+    'GlossR S2': [(3000, 3400, 'JA'), (3500, 4200, 'ZIEN_CL'), (4300, 6000, '')],
+    'TranslationFree S1': [(0, 1400, 'Gebaren zijn ...'), (1400, 1400, ''), (1500, 3600, 'Een boom ...'),
+                           (0, 3600, 'Gebaren, een boom ...')],
+    'TranslationFree S2': [(3000, 6000, 'Ja, ...')],
+    'DomRev Point S1': [(100, 100, 'TL'), (200, 200, 'RL')],
+    'DomRev Point S2': [(3100, 3100, 'TR')],
+}
+
+# The metrics of the EAF as calculated by the earlier implementation
+SPEED = 166.85205784204672
+SENTENCE_LENGTH = 2.75
+METADATA = {'participants': ['S001', 'S002'], 'speed': 166.9, 'differentSigns': 11, 'classifiers': 40.0,
+            'sentenceLength': 2.8, 'fingerspelling': 3, 'interaction': 1, 'dominanceReversal': 1, 'lowFreqSigns': 9}
+
+
+def write_eaf(file_name):
+    time_slots = []
+    tiers = []
+    for tier_id, annotations in TIERS.items():
+        participant = 'S001' if tier_id.endswith('S1') else 'S002'
+        tier = ['<TIER LINGUISTIC_TYPE_REF="default" PARTICIPANT="%s" TIER_ID="%s">' % (participant, tier_id)]
+        for (begin, end, value) in annotations:
+            begin_id = 'ts%d' % (len(time_slots) + 1)
+            end_id = 'ts%d' % (len(time_slots) + 2)
+            time_slots.append('<TIME_SLOT TIME_SLOT_ID="%s" TIME_VALUE="%d"/>' % (begin_id, begin))
+            time_slots.append('<TIME_SLOT TIME_SLOT_ID="%s" TIME_VALUE="%d"/>' % (end_id, end))
+            tier.append('<ANNOTATION><ALIGNABLE_ANNOTATION ANNOTATION_ID="a%d" TIME_SLOT_REF1="%s" TIME_SLOT_REF2="%s">'
+                        '<ANNOTATION_VALUE>%s</ANNOTATION_VALUE></ALIGNABLE_ANNOTATION></ANNOTATION>'
+                        % (len(time_slots) // 2, begin_id, end_id, value))
+        tier.append('</TIER>')
+        tiers.append('\n'.join(tier))
+    with open(file_name, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<ANNOTATION_DOCUMENT AUTHOR="" DATE="2020-01-01T00:00:00+01:00" FORMAT="3.0" VERSION="3.0" '
+                'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                'xsi:noNamespaceSchemaLocation="http://www.mpi.nl/tools/elan/EAFv3.0.xsd">\n'
+                '<HEADER MEDIA_FILE="" TIME_UNITS="milliseconds"/>\n'
+                '<TIME_ORDER>\n%s\n</TIME_ORDER>\n%s\n'
+                '<LINGUISTIC_TYPE LINGUISTIC_TYPE_ID="default" TIME_ALIGNABLE="true"/>\n'
+                '</ANNOTATION_DOCUMENT>\n' % ('\n'.join(time_slots), '\n'.join(tiers)))
+
+
+class TestCalculatedMetadata(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, 'CNGT0001.eaf')
+        write_eaf(self.file_name)
+        self.calculator = EafMetadataCalculator()
+        self.document_tiers = DocumentTiers(read_tiers(self.file_name, tier_ids=self.calculator.get_tier_ids()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_count_annotations(self):
+        self.assertEqual(self.document_tiers.get_number_of_annotations(), 15)
+        self.assertEqual(self.document_tiers.count_annotations(lambda value: '_' in value), 4)
+        self.assertEqual(self.document_tiers.count_annotations(lambda value: value == 'GEBAREN'), 2)
+        self.assertEqual(self.document_tiers.count_annotations(lambda value: False), 0)
+
+    def test_speed(self):
+        self.assertAlmostEqual(self.calculator.get_speed(self.document_tiers), SPEED)
+
+    def test_sentence_length(self):
+        self.assertAlmostEqual(self.calculator.get_sentence_length(self.document_tiers), SENTENCE_LENGTH)
+
+    def test_metrics(self):
+        self.assertEqual(self.calculator.get_different_signs(self.document_tiers), METADATA['differentSigns'])
+        self.assertAlmostEqual(self.calculator.get_classifiers(self.document_tiers), METADATA['classifiers'])
+        self.assertEqual(self.calculator.get_fingerspelling(self.document_tiers), METADATA['fingerspelling'])
+
+    def test_process_file(self):
+        self.calculator.process_file(self.file_name)
+        self.calculator.get_low_frequency_signs()
+        self.assertEqual(self.calculator.metadata['0001'], METADATA)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,150 @@
+"""
+Compares the interval operations with the implementations they replaced in glossExtractor.py, signCounter.py,
+cngt_calculated_metadata.py and eaf2webvtt.py, on random intervals.
+"""
+
+import random
+import unittest
+
+from CNGT_scripts.python.intervals import has_overlap, starts_within, is_within, merge_order, group_units, \
+    count_overlapping, VECTORIZE_THRESHOLD
+
+
+def old_has_overlap(first, second, min_overlap=0):
+    if first[0] >= second[1] or second[0] >= first[1]:
+        return False
+    overlap_interval = (max(first[0], second[0]), min(first[1], second[1]))
+    overlap = overlap_interval[1] - overlap_interval[0]
+    if overlap_interval == first or overlap_interval == second:
+        return True
+    elif overlap >= min_overlap:
+        return True
+    return False
+
+
+def old_check_overlap(a1, a2):
+    if a2[0] <= a1[0] < a2[1]:
+        return True
+    if a1[0] <= a2[0] < a1[1]:
+        return True
+    return False
+
+
+def old_to_units_two_handed(right_hand_annotations, left_hand_annotations, minimum_overlap):
+    """
+    The merge of both hands of signCounter.py, for annotations (begin, end, ...). The empty units it produced are
+    left out.
+    """
+    right_hand_annotations = list(right_hand_annotations)
+    left_hand_annotations = list(left_hand_annotations)
+    list_of_gloss_units = []
+    unit = []
+    last_end = None
+    while len(right_hand_annotations) > 0 or len(left_hand_annotations) > 0:
+        if len(right_hand_annotations) > 0 and len(left_hand_annotations) > 0:
+            current_hand_annotations = right_hand_annotations \
+                if right_hand_annotations[0][0] <= left_hand_annotations[0][0] else left_hand_annotations
+        elif len(right_hand_annotations) > 0:
+            current_hand_annotations = right_hand_annotations
+        else:
+            current_hand_annotations = left_hand_annotations
+
+        current_hand_begin = current_hand_annotations[0][0]
+        if last_end is not None and current_hand_begin > (last_end - minimum_overlap):
+            list_of_gloss_units.append(unit)
+            unit = []
+        unit.append(current_hand_annotations[0])
+        current_hand_end = current_hand_annotations[0][1]
+        if last_end is None or current_hand_end > last_end:
+            last_end = current_hand_end
+        current_hand_annotations.pop(0)
+    list_of_gloss_units.append(unit)
+    return [unit for unit in list_of_gloss_units if unit]
+
+
+def new_to_units_two_handed(right_hand_annotations, left_hand_annotations, minimum_overlap):
+    both_hands = right_hand_annotations + left_hand_annotations
+    merged = [both_hands[index] for index in merge_order([annotation[0] for annotation in right_hand_annotations],
+                                                         [annotation[0] for annotation in left_hand_annotations])]
+    return [merged[start:stop] for start, stop in group_units([annotation[0] for annotation in merged],
+                                                              [annotation[1] for annotation in merged],
+                                                              minimum_overlap)]
+
+
+def random_interval(maximum_time, maximum_length):
+    begin = random.randint(0, maximum_time)
+    return begin, begin + random.choice([0, 0, random.randint(1, maximum_length)])
+
+
+def random_tier(number_of_annotations, maximum_time=2000, maximum_length=300):
+    """
+    Returns annotations (begin, end, index) in order of begin time, some of them zero-length or with the same times.
+    """
+    intervals = sorted(random_interval(maximum_time, maximum_length) for _ in range(number_of_annotations))
+    for index in range(1, number_of_annotations):
+        if random.random() < 0.1:
+            intervals[index] = intervals[index - 1]
+    return [(begin, end, index) for index, (begin, end) in enumerate(intervals)]
+
+
+class TestIntervals(unittest.TestCase):
+    def setUp(self):
+        random.seed(42)
+
+    def test_has_overlap(self):
+        for _ in range(20000):
+            first = random_interval(100, 40)
+            second = random_interval(100, 40)
+            min_overlap = random.randint(0, 30)
+            self.assertEqual(has_overlap(first, second, min_overlap), old_has_overlap(first, second, min_overlap),
+                             (first, second, min_overlap))
+
+    def test_starts_within(self):
+        for _ in range(20000):
+            first = random_interval(100, 40)
+            second = random_interval(100, 40)
+            self.assertEqual(starts_within(first, second), old_check_overlap(first, second), (first, second))
+
+    def test_is_within(self):
+        for _ in range(20000):
+            (inner, outer) = sorted([random_interval(100, 40), random_interval(100, 40)])
+            self.assertEqual(is_within(inner, outer), inner[1] <= outer[1] and inner[0] >= outer[0], (inner, outer))
+
+    def test_units_two_handed(self):
+        # Both in plain Python and with NumPy
+        for number_of_annotations in [0, 1, 2, 5, 20, VECTORIZE_THRESHOLD, 200]:
+            for _ in range(50):
+                right = random_tier(random.randint(0, number_of_annotations))
+                left = [(begin, end, 'L%d' % index) for begin, end, index in
+                        random_tier(number_of_annotations - len(right))]
+                minimum_overlap = random.choice([0, 0, 10, 50])
+                self.assertEqual(new_to_units_two_handed(right, left, minimum_overlap),
+                                 old_to_units_two_handed(right, left, minimum_overlap))
+
+    def test_merge_order_unsorted(self):
+        # Tiers that are not in order of begin time are merged as by the old merge
+        for number_of_annotations in [5, 200]:
+            for _ in range(50):
+                right = [random_interval(2000, 300) + (index,) for index in range(number_of_annotations)]
+                left = [random_interval(2000, 300) + ('L%d' % index,) for index in range(number_of_annotations)]
+                self.assertEqual(new_to_units_two_handed(right, left, 0), old_to_units_two_handed(right, left, 0))
+
+    def test_count_overlapping(self):
+        for number_of_annotations in [0, 1, 10, 200]:
+            for _ in range(50):
+                annotations = [random_interval(1000, 100) for _ in range(number_of_annotations)]
+                translations = [random_interval(1000, 300) for _ in range(random.randint(0, 20))]
+                expected = [len([annotation for annotation in annotations if old_has_overlap(annotation, translation)])
+                            for translation in translations]
+                self.assertEqual(count_overlapping([annotation[0] for annotation in annotations],
+                                                   [annotation[1] for annotation in annotations],
+                                                   [translation[0] for translation in translations],
+                                                   [translation[1] for translation in translations]), expected)
+
+    def test_count_overlapping_zero_length(self):
+        self.assertEqual(count_overlapping([5], [5], [5], [5]), [0])
+        self.assertEqual(count_overlapping([5, 5, 3], [5, 5, 8], [5, 5, 4], [5, 6, 5]), [1, 1, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
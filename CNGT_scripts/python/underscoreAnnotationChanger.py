@@ -20,6 +20,9 @@ class UnderscoreAnnotationChanger(EafProcessor):
     def __init__(self):
         pass
 
+    def get_configuration(self):
+        return {'substrings': sorted(gloss_substrings_to_change)}
+
     def process_eaf(self, eaf, file_name):
         print("EAF file: " + file_name)
         for subject_id in [1, 2]: